@@ -1,11 +1,42 @@
+from collections import OrderedDict
 from typing import Optional, Tuple
+import numpy as np
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import (
     NodePath, Camera, PerspectiveLens, GraphicsWindow, LineSegs,
-    Texture, PNMImage, StringStream, FrameBufferProperties, 
+    Texture, FrameBufferProperties,
     WindowProperties, GraphicsPipe, GraphicsOutput
 )
 from hakoniwa_panda3d_drone.primitive.render import RenderEntity
+from hakoniwa_panda3d_drone.core.image_encoder import CapturedFrame, encode_png
+from hakoniwa_panda3d_drone.core.frame_ring import FrameRingWriter
+
+
+class CaptureTarget:
+    """
+    キャプチャ用オフスクリーンバッファ 1 つ分。
+    普段は非アクティブにしておき、キャプチャするフレームだけ描画させる。
+    """
+    def __init__(self, buf, tex, depth_tex, dr, cam_np: NodePath, width: int, height: int):
+        self.buf = buf
+        self.tex = tex
+        self.depth_tex = depth_tex
+        self.dr = dr
+        self.cam_np = cam_np
+        self.width = width
+        self.height = height
+        self.initialized = False  # 作成直後は 1 フレーム空描画が必要
+        self.buf.set_active(False)
+
+    def activate(self):
+        self.buf.set_active(True)
+
+    def deactivate(self):
+        self.buf.set_active(False)
+
+    def release(self, base):
+        base.graphicsEngine.remove_window(self.buf)
+        self.cam_np.removeNode()
 
 
 class AttachCamera(RenderEntity):
@@ -20,6 +51,8 @@ class AttachCamera(RenderEntity):
         far: float = 1000.0,
         background_color: Tuple[float,float,float,float] = (0,0,0,1),
         model_config: dict = None,
+        model_registry=None,
+        capture_pool_size: int = 2,
     ):
         super().__init__(parent, name)
 
@@ -40,7 +73,11 @@ class AttachCamera(RenderEntity):
 
         # モデル読み込み
         if model_config is not None:
-            self.load_model(loader, self.resolve_model_path(model_config.get("model_path")), copy=True, cache=False)
+            model_path = self.resolve_model_path(model_config.get("model_path"))
+            if model_registry is not None:
+                self.instance_model(model_registry, model_path)
+            else:
+                self.load_model(loader, model_path, copy=True, cache=False)
             self._geom_np.set_pos(*model_config.get("pos", [0,0,0]))
             self._geom_np.set_hpr(*model_config.get("hpr", [0,0,0]))
 
@@ -51,11 +88,17 @@ class AttachCamera(RenderEntity):
         self.display_region = None
         self.dr_coords = None
 
-        # キャプチャバッファ
-        self.capture_tex = None
-        self.capture_buf = None
-        self.capture_dr = None
-        self._init_done = False
+        # キャプチャバッファ: (幅, 高さ, 深度あり) ごとに保持し、上限を超えたら最も古いものを破棄（LRU）
+        self.capture_pool: "OrderedDict[Tuple[int,int,bool], CaptureTarget]" = OrderedDict()
+        self.capture_pool_size = max(1, int(capture_pool_size))
+
+        # ストリーミング用バッファ（start_stream で作成）
+        self.stream_buf = None
+        self.stream_tex = None
+        self.stream_cam_np = None
+        self.stream_writer = None
+        self.stream_every_n = 1
+        self._stream_counter = 0
 
     # --- DisplayRegion設定 ---
     def set_display_region(self, win: GraphicsWindow, sort: int, x: float, y: float, width: float, height: float):
@@ -79,29 +122,22 @@ class AttachCamera(RenderEntity):
         return (width / height) if height else 1.0
 
     # --- キャプチャバッファ生成 ---
-    def ensure_capture_target(self, base, w=None, h=None, use_alpha=False):
-        win_w, win_h = base.win.get_x_size() or 1280, base.win.get_y_size() or 720
-        w, h = w or win_w, h or win_h
-
-        if (self.capture_buf and
-            self.capture_tex.get_x_size() == w and
-            self.capture_tex.get_y_size() == h):
-            return
-
-        if self.capture_buf:
-            base.graphicsEngine.remove_window(self.capture_buf)
-            self.capture_buf = None
-
+    def _make_capture_buffer(self, base, tag: str, w: int, h: int, use_alpha=False, with_depth=False):
+        """
+        オフスクリーンバッファと専用カメラ（レンズはキャプチャ用のコピーで、アスペクト比を w/h に固定）を作り、
+        (buf, tex, depth_tex, dr, cam_np) を返す。
+        """
         fb = FrameBufferProperties()
         fb.set_rgb_color(True)
         fb.set_rgba_bits(8, 8, 8, 8 if use_alpha else 0)
-        fb.set_depth_bits(24)
+        fb.set_depth_bits(32 if with_depth else 24)
+        fb.set_float_depth(with_depth)
 
         wp = WindowProperties.size(w, h)
         flags = GraphicsPipe.BFRefuseWindow
 
         buf = base.graphicsEngine.make_output(
-            base.pipe, f"{self.np.get_name()}_buf",
+            base.pipe, f"{self.np.get_name()}_{tag}",
             -2, fb, wp, flags,
             base.win.getGsg(), base.win
         )
@@ -110,45 +146,177 @@ class AttachCamera(RenderEntity):
         tex.set_keep_ram_image(True)
         tex.set_format(Texture.F_rgba if use_alpha else Texture.F_rgb)
         buf.add_render_texture(tex, GraphicsOutput.RTMCopyRam)
+
+        depth_tex = None
+        if with_depth:
+            # 深度バッファも RAM へコピーする（depth16/depth32 形式用）
+            depth_tex = Texture()
+            depth_tex.set_keep_ram_image(True)
+            depth_tex.set_format(Texture.F_depth_component32)
+            buf.add_render_texture(depth_tex, GraphicsOutput.RTMCopyRam, GraphicsOutput.RTPDepth)
         buf.set_clear_color_active(True)
         buf.set_clear_color(self.background_color)
 
+        cam = Camera(f"{self.np.get_name()}_{tag}_camera", self.cap_lens.make_copy())
+        cam.get_lens().set_aspect_ratio(w / float(h))
+        cam_np = self.cap_cam_np.attachNewNode(cam)  # 表示カメラと姿勢共有
+
         dr = buf.make_display_region()
-        dr.set_camera(self.cap_cam_np)  # ★キャプチャ専用カメラを使う
+        dr.set_camera(cam_np)
         dr.set_clear_depth_active(True)
         dr.set_clear_color_active(True)
         dr.set_clear_color(self.background_color)
+        return buf, tex, depth_tex, dr, cam_np
 
-        self.capture_tex = tex
-        self.capture_buf = buf
-        self.capture_dr = dr
-        self._init_done = False
+    def ensure_capture_target(self, base, w=None, h=None, use_alpha=False, with_depth=False) -> CaptureTarget:
+        """
+        指定解像度のキャプチャバッファをプールから取り出す（なければ作る）。
+        深度なしの要求には同じ解像度の深度ありバッファも使い回す。
+        """
+        win_w, win_h = base.win.get_x_size() or 1280, base.win.get_y_size() or 720
+        w, h = w or win_w, h or win_h
 
-    # --- キャプチャ処理 ---
-    def capture_rgb_bytes(self, base, w=1280, h=720) -> tuple[bytes, int, int, int]:
-        self.ensure_capture_target(base, w, h, use_alpha=False)
-        prev_ar = self.cap_lens.get_aspect_ratio()
-        self.cap_lens.set_aspect_ratio(w / float(h))
+        for key in ([(w, h, True)] if with_depth else [(w, h, False), (w, h, True)]):
+            target = self.capture_pool.get(key)
+            if target is not None:
+                self.capture_pool.move_to_end(key)
+                return target
 
-        base.graphicsEngine.render_frame()
-        if not self._init_done:
-            base.graphicsEngine.render_frame()
-            self._init_done = True
+        # 一括キャプチャで描画待ち（アクティブ）のバッファは破棄しない
+        while len(self.capture_pool) >= self.capture_pool_size:
+            victim = next((k for k, t in self.capture_pool.items() if not t.buf.is_active()), None)
+            if victim is None:
+                break
+            self.capture_pool.pop(victim).release(base)
+            ow, oh, od = victim
+            print(f"[AttachCamera] Evicted capture buffer {ow}x{oh}{' +depth' if od else ''}")
+
+        tag = f"buf_{w}x{h}{'_depth' if with_depth else ''}"
+        target = CaptureTarget(*self._make_capture_buffer(base, tag, w, h, use_alpha, with_depth), w, h)
+        self.capture_pool[(w, h, with_depth)] = target
+        return target
+
+    def release_capture_targets(self, base):
+        for target in self.capture_pool.values():
+            target.release(base)
+        self.capture_pool.clear()
+
+    # --- ストリーミング ---
+    def start_stream(self, base, writer: FrameRingWriter, w: int = 640, h: int = 480, every_n_frames: int = 1):
+        """
+        専用バッファで every_n_frames ごとに描画し、writer へ書き出す。
+        バッファは書き出すフレームだけアクティブにする（描画と RAM への読み戻しは書き出さないフレームでは行わない）。
+        書き出しは stream_frame() を描画後のタスクから呼ぶ（追加の render_frame は行わない）。
+        """
+        self.stop_stream(base)
+        buf, tex, _, dr, cam_np = self._make_capture_buffer(base, "stream", w, h)
+        self.stream_cam_np = cam_np
+        self.stream_buf = buf
+        self.stream_tex = tex
+        self.stream_writer = writer
+        self.stream_every_n = max(1, int(every_n_frames))
+        self._stream_counter = 0
+        self._update_stream_active()
+
+    def _update_stream_active(self):
+        """次のフレームが書き出し対象のときだけストリーム用バッファを描画する"""
+        self.stream_buf.setActive((self._stream_counter + 1) % self.stream_every_n == 0)
+
+    def suspend_stream(self) -> bool:
+        """キャプチャの render_frame() でストリーム用バッファを描画しないよう止める（元の状態を返す）"""
+        if self.stream_buf is None:
+            return False
+        active = self.stream_buf.isActive()
+        self.stream_buf.setActive(False)
+        return active
+
+    def resume_stream(self, active: bool):
+        if self.stream_buf is not None:
+            self.stream_buf.setActive(active)
+
+    def stop_stream(self, base):
+        if self.stream_buf is not None:
+            base.graphicsEngine.remove_window(self.stream_buf)
+            self.stream_cam_np.removeNode()
+        self.stream_buf = None
+        self.stream_tex = None
+        if self.stream_writer is not None:
+            self.stream_writer.close()
+        self.stream_writer = None
+
+    def stream_frame(self, sim_time_usec: int = 0) -> bool:
+        """直前に描画されたストリーム画像をリングバッファへ書き出す（書き出したら True）"""
+        if self.stream_writer is None:
+            return False
+        self._stream_counter += 1
+        write = self._stream_counter % self.stream_every_n == 0
+        self._update_stream_active()
+        if not write or not self.stream_tex.hasRamImage():
+            return False
+        ram = self.stream_tex.getRamImageAs("RGB")
+        frame = CapturedFrame(memoryview(ram), self.stream_tex.get_x_size(), self.stream_tex.get_y_size(), 3)
+        self.stream_writer.write(frame.as_array(), sim_time_usec)
+        return True
 
-        self.cap_lens.set_aspect_ratio(prev_ar)
+    # --- キャプチャ処理 ---
+    def begin_capture(self, base, w=1280, h=720, depth=False) -> CaptureTarget:
+        """次の render_frame() でこのバッファだけ描画されるようにアクティブにする"""
+        target = self.ensure_capture_target(base, w, h, use_alpha=False, with_depth=depth)
+        target.activate()
+        return target
+
+    def finish_capture(self, base, target: CaptureTarget, depth=False) -> CapturedFrame:
+        """描画済みのバッファを読み戻して非アクティブに戻す"""
+        target.deactivate()
         gsg = base.win.getGsg()
-        if gsg and not self.capture_tex.hasRamImage():
-            base.graphicsEngine.extract_texture_data(self.capture_tex, gsg)
-        if not self.capture_tex.hasRamImage():
+        if gsg and not target.tex.hasRamImage():
+            base.graphicsEngine.extract_texture_data(target.tex, gsg)
+        if not target.tex.hasRamImage():
             raise RuntimeError("no RAM image")
 
-        ram = self.capture_tex.getRamImageAs("RGB")
-        return (bytes(ram), self.capture_tex.get_x_size(), self.capture_tex.get_y_size(), 3)
+        if depth:
+            return self._depth_frame(target)
+        ram = target.tex.getRamImageAs("RGB")
+        return CapturedFrame(memoryview(ram), target.width, target.height, 3)
+
+    def capture_frame(self, base, w=1280, h=720, depth=False) -> CapturedFrame:
+        """
+        描画と GPU からの読み戻しだけを行う（エンコードはしない）。
+        キャプチャ用バッファは解像度ごとに使い回すため、返すフレームは読み戻した RAM イメージのコピーを持つ
+        （エンコードはワーカースレッドで行われ、その間に次の読み戻しで上書きされうる）。
+        depth=True ならカラーの代わりに深度バッファ（正規化値）を返す。
+        """
+        target = self.begin_capture(base, w, h, depth)
+        try:
+            base.graphicsEngine.render_frame()
+            if not target.initialized:
+                base.graphicsEngine.render_frame()
+                target.initialized = True
+        finally:
+            target.deactivate()
+        return self.finish_capture(base, target, depth)
+
+    def _depth_frame(self, target: CaptureTarget) -> CapturedFrame:
+        tex = target.depth_tex
+        if tex is None or not tex.hasRamImage():
+            raise RuntimeError("no depth RAM image")
+        dtype = {
+            Texture.T_float: np.float32,
+            Texture.T_unsigned_int: np.uint32,
+            Texture.T_unsigned_short: np.uint16,
+        }.get(tex.getComponentType())
+        if dtype is None:
+            raise RuntimeError(f"unsupported depth component type: {tex.getComponentType()}")
+        # getRamImage() はテクスチャ自身のバッファを指すので、次の読み戻しで書き換わらないようコピーする
+        # （カラーは getRamImageAs("RGB") が変換先の新しいバッファを返すためそのまま渡せる）
+        return CapturedFrame(
+            memoryview(bytes(tex.getRamImage())), tex.get_x_size(), tex.get_y_size(), 1,
+            dtype=dtype, depth_range=(self.cap_lens.get_near(), self.cap_lens.get_far()),
+        )
+
+    def capture_rgb_bytes(self, base, w=1280, h=720) -> tuple[bytes, int, int, int]:
+        frame = self.capture_frame(base, w, h)
+        return (bytes(frame.data), frame.width, frame.height, frame.channels)
 
     def capture_png_bytes(self, base, w=1280, h=720) -> bytes:
-        data, ww, hh, _ = self.capture_rgb_bytes(base, w, h)
-        img = PNMImage()
-        self.capture_tex.store(img)
-        ss = StringStream()
-        img.write(ss, "png")
-        return ss.get_data()
+        return encode_png(self.capture_frame(base, w, h))
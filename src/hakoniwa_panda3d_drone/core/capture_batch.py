@@ -0,0 +1,134 @@
+"""
+複数カメラの一括キャプチャ（DroneService/CameraCaptureImageBatch）の要求・応答形式。
+
+専用の PDU 型は用意せず、CameraCaptureImage の要求・応答をそのまま使う。
+
+要求（CameraCaptureImageRequest）:
+  drone_name : 対象をカンマ区切りで並べる。"<ドローン名>" または "<ドローン名>/<カメラ名>"、"*" は全ドローン
+  image_type : "<形式>[@<幅>x<高さ>][#<時刻>]" を 1 つ（全対象に適用）または drone_name と同数カンマ区切りで並べる
+               時刻はシミュレーション時刻[usec] か "latest"（既定）。過去の時刻は姿勢履歴から補間して描画する
+  例: drone_name="Drone1,Drone2/front,Drone3"  image_type="jpeg:80@640x480#1500000"
+
+応答（CameraCaptureImageResponse.data、リトルエンディアン）:
+  [バッチヘッダ 16B][エントリヘッダ 36B][画像データ][エントリヘッダ][画像データ]...
+  バッチヘッダ  : magic "HKCB", エントリ数, 先頭エントリのシミュレーション時刻[usec]
+  エントリヘッダ: ok, 形式名(15B), 幅, 高さ, データ長, 実際に描画したシミュレーション時刻[usec]
+                  （要求と同じ順に並ぶ。同じ時刻を指定したエントリは同じ 1 フレームから取得される）
+"""
+import struct
+from typing import List, Optional, Sequence, Tuple
+from hakoniwa_panda3d_drone.core.image_encoder import parse_image_type
+
+BATCH_MAGIC = b"HKCB"
+_BATCH_HDR = struct.Struct("<4sIq")
+_ENTRY_HDR = struct.Struct("<B15sIIIq")
+DEFAULT_CAPTURE_SIZE = (1280, 720)
+
+
+def parse_capture_spec(spec: Optional[str],
+                       default_size: Tuple[int, int] = DEFAULT_CAPTURE_SIZE) -> Tuple[str, int, int, Optional[int]]:
+    """
+    "<形式>[@<幅>x<高さ>][#<時刻>]" を (image_type, 幅, 高さ, sim_time_usec) に分解する。
+    時刻を省略または "latest" にした場合の sim_time_usec は None。
+    例: "jpeg:80@640x480#1500000" -> ("jpeg:80", 640, 480, 1500000), "png" -> ("png", 1280, 720, None)
+    """
+    spec, _, when = (spec or "png").strip().partition("#")
+    sim_time_usec = None
+    when = when.strip().lower()
+    if when and when != "latest":
+        if not when.isdigit():
+            raise ValueError(f"invalid capture time: {when!r}")
+        sim_time_usec = int(when)
+    image_type, _, size = spec.partition("@")
+    w, h = default_size
+    if size:
+        sw, _, sh = size.lower().partition("x")
+        if not (sw.isdigit() and sh.isdigit()) or int(sw) == 0 or int(sh) == 0:
+            raise ValueError(f"invalid capture size: {size!r}")
+        w, h = int(sw), int(sh)
+    return image_type or "png", w, h, sim_time_usec
+
+
+class CaptureEntry:
+    """
+    一括キャプチャの 1 要素。
+    camera_name=None はそのドローンの既定カメラ、sim_time_usec=None は最新の姿勢。
+    """
+    __slots__ = ("drone_name", "camera_name", "image_type", "width", "height", "sim_time_usec")
+
+    def __init__(self, drone_name: str, camera_name: Optional[str], image_type: str, width: int, height: int,
+                 sim_time_usec: Optional[int] = None):
+        self.drone_name = drone_name
+        self.camera_name = camera_name
+        self.image_type = image_type
+        self.width = width
+        self.height = height
+        self.sim_time_usec = sim_time_usec
+
+    def __repr__(self):
+        cam = f"/{self.camera_name}" if self.camera_name else ""
+        when = "latest" if self.sim_time_usec is None else self.sim_time_usec
+        return f"CaptureEntry({self.drone_name}{cam} {self.image_type}@{self.width}x{self.height}#{when})"
+
+
+def parse_batch_request(drone_field: str, type_field: str, all_drones: Sequence[str]) -> List[CaptureEntry]:
+    """一括キャプチャ要求を CaptureEntry のリストに展開する（不正な要求は ValueError）"""
+    targets = []
+    for item in (drone_field or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if item == "*":
+            targets.extend((name, None) for name in all_drones)
+            continue
+        drone, _, cam = item.partition("/")
+        targets.append((drone, cam or None))
+    if not targets:
+        raise ValueError("no capture target")
+
+    specs = [s.strip() for s in (type_field or "png").split(",")]
+    if len(specs) == 1:
+        specs = specs * len(targets)
+    elif len(specs) != len(targets):
+        raise ValueError(f"image_type has {len(specs)} entries for {len(targets)} targets")
+
+    entries = []
+    for (drone, cam), spec in zip(targets, specs):
+        image_type, w, h, sim_time_usec = parse_capture_spec(spec)
+        entries.append(CaptureEntry(drone, cam, image_type, w, h, sim_time_usec))
+    return entries
+
+
+def pack_batch_response(results: Sequence[Tuple[bool, str, int, int, bytes, int]]) -> bytes:
+    """
+    (ok, image_type, 幅, 高さ, データ, sim_time_usec) のリストを 1 つのバイト列にまとめる。
+    失敗したエントリはデータ長 0 で ok=0 とする。
+    """
+    sim_time_usec = results[0][5] if results else 0
+    parts = [_BATCH_HDR.pack(BATCH_MAGIC, len(results), sim_time_usec)]
+    for ok, image_type, w, h, data, entry_time_usec in results:
+        fmt = parse_image_type(image_type)[0].encode("ascii")
+        parts.append(_ENTRY_HDR.pack(1 if ok else 0, fmt, w, h, len(data), entry_time_usec))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def batch_response_size(results: Sequence[Tuple[bool, str, int, int, bytes, int]]) -> int:
+    """pack_batch_response() が返すバイト列の長さ（まとめる前に PDU の heap に収まるか確かめる用）"""
+    return _BATCH_HDR.size + sum(_ENTRY_HDR.size + len(r[4]) for r in results)
+
+
+def unpack_batch_response(data) -> Tuple[int, List[Tuple[bool, str, int, int, memoryview, int]]]:
+    """クライアント側の復号: (sim_time_usec, [(ok, 形式, 幅, 高さ, データ, sim_time_usec), ...])"""
+    mv = memoryview(data).cast("B")
+    magic, count, sim_time_usec = _BATCH_HDR.unpack_from(mv, 0)
+    if magic != BATCH_MAGIC:
+        raise ValueError(f"not a batch capture response (magic={magic!r})")
+    off = _BATCH_HDR.size
+    entries = []
+    for _ in range(count):
+        ok, fmt, w, h, size, entry_time_usec = _ENTRY_HDR.unpack_from(mv, off)
+        off += _ENTRY_HDR.size
+        entries.append((bool(ok), fmt.rstrip(b"\0").decode("ascii"), w, h, mv[off:off + size], entry_time_usec))
+        off += size
+    return sim_time_usec, entries
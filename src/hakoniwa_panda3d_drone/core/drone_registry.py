@@ -0,0 +1,96 @@
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from panda3d.core import NodePath, ClockObject
+from hakoniwa_panda3d_drone.primitive.render import RenderEntity
+from hakoniwa_panda3d_drone.core.rotor_spin import RotorSpin
+
+
+class DroneHandle:
+    """1 機分の描画ノードへの参照（ローターのジオメトリノードは回転方向ごとに事前に分けておく）"""
+    __slots__ = ("name", "model", "np", "rotors_cw", "rotors_ccw", "spin")
+
+    def __init__(self, model: RenderEntity):
+        self.name = model.name
+        self.model = model
+        self.np: NodePath = model.np
+        rotors = [child._geom_np for child in model.children
+                  if child.purpose == 'rotor' and child._geom_np is not None]
+        # 偶数番目を時計回り（-yaw）、奇数番目を反時計回り（+yaw）に回す
+        self.rotors_cw: List[NodePath] = rotors[0::2]
+        self.rotors_ccw: List[NodePath] = rotors[1::2]
+        # シェーダーで回す場合の状態（None なら CPU で回す）
+        self.spin: Optional[RotorSpin] = None
+
+    def enable_shader_spin(self):
+        if self.spin is None and (self.rotors_cw or self.rotors_ccw):
+            self.spin = RotorSpin(self.np, self.rotors_cw, self.rotors_ccw)
+
+    def spin_rotors(self, delta_yaw: float):
+        for r in self.rotors_cw:
+            r.setH(r.getH() - delta_yaw)
+        for r in self.rotors_ccw:
+            r.setH(r.getH() + delta_yaw)
+
+
+class DroneRegistry:
+    """ドローン名 -> DroneHandle の索引。姿勢の一括適用を行う。"""
+    def __init__(self):
+        self._drones: Dict[str, DroneHandle] = {}
+        self.shader_spin = False
+        self._clock = ClockObject.getGlobalClock()
+        self._last_frame_time: Optional[float] = None
+
+    def add(self, model: RenderEntity) -> DroneHandle:
+        handle = DroneHandle(model)
+        if self.shader_spin:
+            handle.enable_shader_spin()
+        self._drones[handle.name] = handle
+        return handle
+
+    def enable_shader_spin(self):
+        """ローターの回転をシェーダーに任せる（以降に追加したドローンも対象）"""
+        self.shader_spin = True
+        for handle in self._drones.values():
+            handle.enable_shader_spin()
+
+    def shader_spin_updates(self) -> int:
+        """シェーダー入力を書き換えた回数の合計"""
+        return sum(h.spin.updates for h in self._drones.values() if h.spin is not None)
+
+    def get(self, name: str) -> Optional[DroneHandle]:
+        return self._drones.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._drones.keys())
+
+    def __len__(self):
+        return len(self._drones)
+
+    def apply_poses(self, names: Sequence[str], positions: np.ndarray, hprs: np.ndarray,
+                    rotor_speeds: Optional[np.ndarray] = None) -> int:
+        """
+        positions (N,3), hprs (N,3)[deg], rotor_speeds (N,)[deg/s] を 1 回のループで適用する。
+        ローターはシェーダー駆動なら速度の変化時だけ入力を更新し、CPU 駆動なら前回の呼び出しからの
+        フレーム時間ぶん回す。未登録の名前は無視し、適用した機数を返す。
+        """
+        frame_time = self._clock.getFrameTime()
+        frame_dt = 0.0 if self._last_frame_time is None else frame_time - self._last_frame_time
+        self._last_frame_time = frame_time
+        pos = np.asarray(positions, dtype=np.float64).tolist()
+        hpr = np.asarray(hprs, dtype=np.float64).tolist()
+        speeds = None if rotor_speeds is None else np.asarray(rotor_speeds, dtype=np.float64).tolist()
+        applied = 0
+        for i, name in enumerate(names):
+            handle = self._drones.get(name)
+            if handle is None:
+                continue
+            x, y, z = pos[i]
+            h, p, r = hpr[i]
+            handle.np.setPosHpr(x, y, z, h, p, r)
+            if speeds is not None:
+                if handle.spin is not None:
+                    handle.spin.set_speed(speeds[i], frame_time)
+                elif speeds[i] != 0.0:
+                    handle.spin_rotors(speeds[i] * frame_dt)
+            applied += 1
+        return applied
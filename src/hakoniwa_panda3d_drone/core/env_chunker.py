@@ -0,0 +1,197 @@
+"""
+大きな環境モデル（CityGML の .glb など）を空間グリッドのチャンクに分割する前処理。
+
+  - モデル全体の変換を頂点に焼き込み、プリミティブ（三角形など）を重心の属するセル（chunk_size の立方体）へ振り分ける
+  - セルごとに使う頂点だけを持つ GeomVertexData を作り直し、flattenStrong で Geom をまとめる
+  - セルごとに LODNode を置き、近距離は元のジオメトリ、遠距離はセルを proxy_grid^3 に分けた
+    外接箱（プロキシ）を描き、それより遠ければ描かない
+
+チャンクごとにバウンディングを持つので、各カメラ（表示・キャプチャ）は視錐台と距離で不要なチャンクを外せる。
+LOD の切り替え距離はモデル座標系の値なので、配置後のスケールに合わせて apply_lod_distances() で設定する。
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from panda3d.core import (
+    NodePath, GeomNode, Geom, GeomVertexData, GeomEnums, InternalName, LODNode,
+)
+from hakoniwa_panda3d_drone.primitive.polygon import make_cubes_geom_node
+
+PROXY_COLOR = (0.72, 0.72, 0.72, 1.0)
+# LOD を設定するまでの仮の切り替え距離（実質常に詳細を描く）
+_FAR = 1e30
+
+_NUMPY_TYPES = {
+    GeomEnums.NT_uint8: np.uint8,
+    GeomEnums.NT_uint16: np.uint16,
+    GeomEnums.NT_uint32: np.uint32,
+    GeomEnums.NT_float32: np.float32,
+    GeomEnums.NT_float64: np.float64,
+}
+
+
+def _vertex_positions(vdata: GeomVertexData) -> np.ndarray:
+    """頂点座標を (N,3) float64 で取り出す"""
+    fmt = vdata.getFormat()
+    name = InternalName.getVertex()
+    array_index = fmt.getArrayWith(name)
+    column = fmt.getColumn(name)
+    dtype = np.dtype(_NUMPY_TYPES[column.getNumericType()])
+    stride = fmt.getArray(array_index).getStride()
+    raw = memoryview(vdata.getArray(array_index)).cast("B")
+    view = np.ndarray(
+        shape=(vdata.getNumRows(), min(column.getNumComponents(), 3)),
+        dtype=dtype, buffer=raw, offset=column.getStart(),
+        strides=(stride, dtype.itemsize),
+    )
+    return view.astype(np.float64)
+
+
+def _primitive_indices(prim) -> np.ndarray:
+    if not prim.isIndexed():
+        first = prim.getFirstVertex()
+        return np.arange(first, first + prim.getNumVertices(), dtype=np.int64)
+    raw = memoryview(prim.getVertices()).cast("B")
+    return np.frombuffer(raw, dtype=_NUMPY_TYPES[prim.getIndexType()]).astype(np.int64)
+
+
+def _compact_geom(vdata: GeomVertexData, prim, indices: np.ndarray) -> Geom:
+    """indices（元の頂点番号）で使う頂点だけを残した Geom を作る（全配列の行をそのままコピー）"""
+    used, remap = np.unique(indices, return_inverse=True)
+    new_vdata = GeomVertexData(vdata.getName(), vdata.getFormat(), Geom.UH_static)
+    new_vdata.uncleanSetNumRows(len(used))
+    for i in range(vdata.getNumArrays()):
+        stride = vdata.getFormat().getArray(i).getStride()
+        src = np.frombuffer(memoryview(vdata.getArray(i)).cast("B"), dtype=np.uint8).reshape(-1, stride)
+        memoryview(new_vdata.modifyArray(i)).cast("B")[:] = np.ascontiguousarray(src[used]).reshape(-1)
+
+    if len(used) > 0xffff:
+        index_type, index_dtype = Geom.NT_uint32, np.uint32
+    else:
+        index_type, index_dtype = Geom.NT_uint16, np.uint16
+    new_prim = type(prim)(Geom.UH_static)
+    new_prim.setIndexType(index_type)
+    iarr = new_prim.modifyVertices()
+    iarr.uncleanSetNumRows(len(remap))
+    memoryview(iarr).cast("B")[:] = remap.astype(index_dtype).view(np.uint8)
+
+    geom = Geom(new_vdata)
+    geom.addPrimitive(new_prim)
+    return geom
+
+
+class _Cell:
+    __slots__ = ("geoms", "points")
+
+    def __init__(self):
+        self.geoms: List[Tuple[Geom, object]] = []   # (Geom, RenderState)
+        self.points: List[np.ndarray] = []           # プロキシ用の頂点座標
+
+
+def _proxy_boxes(points: np.ndarray, cell_min: np.ndarray, sub_size: float, proxy_grid: int):
+    """セル内の頂点を proxy_grid^3 の小セルに分け、小セルごとの外接箱 (中心, 大きさ) を返す"""
+    sub = np.clip(np.floor((points - cell_min) / sub_size).astype(np.int64), 0, proxy_grid - 1)
+    keys = (sub[:, 0] * proxy_grid + sub[:, 1]) * proxy_grid + sub[:, 2]
+    order = np.argsort(keys, kind="stable")
+    keys, pts = keys[order], points[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    mins = np.minimum.reduceat(pts, starts, axis=0)
+    maxs = np.maximum.reduceat(pts, starts, axis=0)
+    return (mins + maxs) * 0.5, np.maximum(maxs - mins, 1e-3)
+
+
+def chunk_model(model_np: NodePath, chunk_size: float, proxy_grid: int = 4, name: str = "chunks") -> NodePath:
+    """
+    model_np の子（のコピー）をチャンク分割した新しいシーンを返す（座標は model_np の座標系）。
+    構成: name / chunk_<ix>_<iy>_<iz>（LODNode）/ [detail, proxy]
+    """
+    # model_np 自身の変換は配置側（親）に残し、子だけを複製する
+    work = NodePath("work")
+    work.setState(model_np.getState())
+    for child in model_np.getChildren():
+        child.copyTo(work)
+    work.clearModelNodes()
+    work.flattenLight()   # 変換を頂点に焼き込む（状態はノードごとに残る）
+
+    cells: Dict[Tuple[int, int, int], _Cell] = {}
+    for gn_np in work.findAllMatches("**/+GeomNode"):
+        gn: GeomNode = gn_np.node()
+        net_state = gn_np.getNetState()
+        for gi in range(gn.getNumGeoms()):
+            geom = gn.getGeom(gi).decompose()
+            state = net_state.compose(gn.getGeomState(gi))
+            vdata = geom.getVertexData()
+            positions = _vertex_positions(vdata)
+            for prim in geom.getPrimitives():
+                per_prim = prim.getNumVerticesPerPrimitive()
+                if per_prim == 0:
+                    continue   # パッチなど（分割対象外）
+                idx = _primitive_indices(prim).reshape(-1, per_prim)
+                if len(idx) == 0:
+                    continue
+                keys = np.floor(positions[idx].mean(axis=1) / chunk_size).astype(np.int64)
+                uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                order = np.argsort(inverse, kind="stable")
+                bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+                for k, key in enumerate(uniq):
+                    rows = idx[order[bounds[k]:bounds[k + 1]]].reshape(-1)
+                    cell = cells.setdefault(tuple(int(v) for v in key), _Cell())
+                    cell.geoms.append((_compact_geom(vdata, prim, rows), state))
+                    cell.points.append(positions[np.unique(rows)])
+
+    root = NodePath(name)
+    sub_size = chunk_size / proxy_grid
+    for key, cell in sorted(cells.items()):
+        ix, iy, iz = key
+        lod = LODNode(f"chunk_{ix}_{iy}_{iz}")
+        lod_np = root.attachNewNode(lod)
+
+        detail = GeomNode("detail")
+        for geom, state in cell.geoms:
+            detail.addGeom(geom, state)
+        detail_np = lod_np.attachNewNode(detail)
+        detail_np.flattenStrong()
+        lod.addSwitch(_FAR, 0.0)
+
+        points = np.concatenate(cell.points)
+        centers, sizes = _proxy_boxes(points, np.array(key, dtype=np.float64) * chunk_size, sub_size, proxy_grid)
+        proxy = make_cubes_geom_node(
+            "proxy", sizes=sizes, pos=centers, hpr=np.zeros_like(centers),
+            colors=np.tile(np.array(PROXY_COLOR, dtype=np.float32), (len(centers), 1)),
+        )
+        lod_np.attachNewNode(proxy)
+        lod.addSwitch(_FAR, _FAR)
+
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        lod.setCenter(tuple((lo + hi) * 0.5))
+    return root
+
+
+def apply_lod_distances(chunks_np: NodePath, detail_distance: Optional[float], proxy_distance: Optional[float]):
+    """
+    チャンクの LOD 切り替え距離を設定する（モデル座標系の値）。
+    detail_distance までは詳細、proxy_distance まではプロキシ、それより遠いチャンクは描かない。
+    None は無制限（detail_distance が None なら常に詳細を描く）。
+    """
+    detail = _FAR if detail_distance is None else float(detail_distance)
+    far = _FAR if proxy_distance is None else max(float(proxy_distance), detail)
+    if detail_distance is None:
+        detail = far
+    for lod_np in chunks_np.findAllMatches("**/+LODNode"):
+        lod: LODNode = lod_np.node()
+        lod.setSwitch(0, detail, 0.0)
+        lod.setSwitch(1, far, detail)
+
+
+def chunk_stats(chunks_np: NodePath) -> dict:
+    n_chunks = chunks_np.findAllMatches("**/+LODNode").getNumPaths()
+    n_geoms = sum(np_.node().getNumGeoms() for np_ in chunks_np.findAllMatches("**/+LODNode/detail"))
+    return {"chunks": n_chunks, "detail_geoms": n_geoms}
+
+
+def world_to_model_scale(geom_np: NodePath) -> float:
+    """geom_np の座標系の長さ 1 がワールドで何 m になるか（3 軸の平均）"""
+    s = geom_np.getScale(geom_np.getTop())
+    scale = (abs(s.x) + abs(s.y) + abs(s.z)) / 3.0
+    return scale if scale > 0 and math.isfinite(scale) else 1.0
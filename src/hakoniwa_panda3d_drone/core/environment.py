@@ -3,6 +3,8 @@ from pathlib import Path
 from panda3d.core import NodePath, Point3
 from hakoniwa_panda3d_drone.primitive.render import RenderEntity
 from hakoniwa_panda3d_drone.primitive import mjcf_building
+from hakoniwa_panda3d_drone.core.model_cache import get_model_cache
+from hakoniwa_panda3d_drone.core.env_chunker import chunk_model, apply_lod_distances, chunk_stats, world_to_model_scale
 
 class EnvironmentEntity(RenderEntity):
     def __init__(
@@ -16,10 +18,21 @@ class EnvironmentEntity(RenderEntity):
         cache: bool = False,
         copy: bool = False,
         loader=None,
+        batch: bool = False,
+        batch_chunk_size: float = 100.0,
+        chunk: bool = False,
+        chunk_size: float = 200.0,
+        lod_distances: Optional[Tuple[float, float]] = None,
+        proxy_grid: int = 4,
     ):
         # RenderEntity は (render, name) で初期化
         super().__init__(render, name)
         self.building_renders: list[RenderEntity] = []
+        # バッチモード時の建物チャンクと索引
+        self.building_chunks: list[NodePath] = []
+        self.building_index: Optional[mjcf_building.BuildingIndex] = None
+        # チャンク分割したモデル（chunk=True のとき）
+        self.chunks_np: Optional[NodePath] = None
 
         # loader は ShowBase.loader を使う（明示渡しがなければ base.loader）
         if loader is None:
@@ -34,12 +47,17 @@ class EnvironmentEntity(RenderEntity):
 
         # ファイルタイプに応じてロード処理を分岐
         if p.suffix.lower() == '.xml':
-            # MJCFから建物をロード
-            building_data_list = mjcf_building.load_buildings_from_mjcf(str(p))
-            self.building_renders = mjcf_building.create_building_renders(self.np, building_data_list)
+            # MJCFから建物をロード（横に置いた .npz キャッシュがあれば XML は読まない）
+            buildings = mjcf_building.load_building_table(str(p))
+            if batch:
+                self.building_chunks, self.building_index = mjcf_building.create_batched_building_renders(
+                    self.np, buildings, chunk_size=batch_chunk_size)
+                print(f"[Environment] Batched {len(buildings)} buildings into {len(self.building_chunks)} chunks")
+            else:
+                self.building_renders = mjcf_building.create_building_renders(self.np, buildings)
         else:
             # 通常のモデルをロード
-            self.load_model(loader, str(p), copy=copy)
+            self.load_model(loader, str(p), copy=copy, cache=cache)
             # 表裏両面（屋内モデル対策）
             self.np.setTwoSided(True)
 
@@ -54,11 +72,53 @@ class EnvironmentEntity(RenderEntity):
             if target_np:
                 target_np.setHpr(*hpr)
 
-        # 大きすぎ/小さすぎ補正
-        mn, mx = self.np.getTightBounds()
-        if mn and mx:
-            diag = (mx - mn).length()
-            if diag > 1e4:
-                self.np.setScale(100.0 / diag)
-            elif diag < 1e-2:
-                self.np.setScale(100.0 / max(diag, 1e-6))
+        # 大きすぎ/小さすぎ補正（キャッシュがあれば前回の結果を使い、バウンド計算を省く）
+        entry = self.model_cache_entry
+        placement = f"scale={scale};hpr={list(hpr) if hpr is not None else None}"
+        if entry is not None and entry.has_auto_scale(placement):
+            auto_scale = entry.get_auto_scale(placement)
+        else:
+            auto_scale = self._calc_auto_scale()
+            if entry is not None:
+                entry.set_auto_scale(placement, auto_scale)
+        if auto_scale is not None:
+            self.np.setScale(auto_scale)
+
+        # 空間チャンク分割 + LOD（配置後のスケールで chunk_size / lod_distances[m] をモデル座標系に直す）
+        if chunk and p.suffix.lower() != '.xml' and self._geom_np is not None:
+            self._chunk_model(loader, p, chunk_size, lod_distances, proxy_grid)
+
+    def _chunk_model(self, loader, path: Path, chunk_size: float,
+                     lod_distances: Optional[Tuple[float, float]], proxy_grid: int):
+        world_scale = world_to_model_scale(self._geom_np)
+        model_chunk = chunk_size / world_scale
+        settings = {"derived": "chunks", "chunk_size": round(model_chunk, 4), "proxy_grid": proxy_grid}
+        model_np = self._geom_np
+        chunks_np = get_model_cache().load_derived(
+            loader, str(path), settings,
+            lambda: chunk_model(model_np, model_chunk, proxy_grid=proxy_grid, name=f"{self.name}_chunks"))
+
+        # 元のジオメトリを外してチャンクに差し替える（モデルルートの姿勢はそのまま使う）
+        for child in self._geom_np.getChildren():
+            child.removeNode()
+        chunks_np.reparentTo(self._geom_np)
+        detail, far = lod_distances if lod_distances else (None, None)
+        apply_lod_distances(
+            chunks_np,
+            None if detail is None else detail / world_scale,
+            None if far is None else far / world_scale,
+        )
+        self.chunks_np = chunks_np
+        print(f"[Environment] Chunked {self.name}: {chunk_stats(chunks_np)} chunk_size={chunk_size}m lod={lod_distances}")
+
+    def _calc_auto_scale(self) -> Optional[float]:
+        bounds = self.np.getTightBounds()
+        if not bounds:
+            return None
+        mn, mx = bounds
+        diag = (mx - mn).length()
+        if diag > 1e4:
+            return 100.0 / diag
+        elif diag < 1e-2:
+            return 100.0 / max(diag, 1e-6)
+        return None
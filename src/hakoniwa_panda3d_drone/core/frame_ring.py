@@ -0,0 +1,173 @@
+"""
+カメラ画像をストリーミングするための共有メモリ（メモリマップトファイル）リングバッファ。
+
+ファイルレイアウト:
+  [ファイルヘッダ 64B][スロット0][スロット1]...
+  ファイルヘッダ: magic, version, slot_count, slot_stride, max_width, max_height, channels, latest_frame
+  スロット     : [スロットヘッダ 64B][画像データ（上の行から RGB8）]
+  スロットヘッダ: seq, frame_index, sim_time_usec, width, height, channels, data_size
+
+書き込み中のスロットは seq が奇数になる（seqlock）。読み手は読み取り前後で seq が
+同じ偶数であることを確認すれば、コピーなしで参照したデータが壊れていないと判断できる。
+"""
+import os
+import mmap
+import time
+import struct
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+
+MAGIC = b"HKRING01"
+VERSION = 1
+_FILE_HDR = struct.Struct("<8sIIIIIIq")
+_SLOT_HDR = struct.Struct("<QqqIIII")
+_HDR_SIZE = 64
+_LATEST_OFF = _FILE_HDR.size - 8
+_PAGE = mmap.PAGESIZE
+
+
+def default_ring_path(name: str) -> str:
+    """/dev/shm があればそこに、なければ一時ディレクトリに置く"""
+    base = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+    return str(base / f"hakoniwa_panda3d_{name}.ring")
+
+
+class FrameRingWriter:
+    """Panda3D 側からフレームを書き込むライター"""
+    def __init__(self, path: str, max_width: int, max_height: int, channels: int = 3, slot_count: int = 4):
+        self.path = path
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+        self.slot_count = slot_count
+        data_max = max_width * max_height * channels
+        self.slot_stride = ((_HDR_SIZE + data_max + _PAGE - 1) // _PAGE) * _PAGE
+        size = _HDR_SIZE + self.slot_stride * slot_count
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        _FILE_HDR.pack_into(self._mm, 0, MAGIC, VERSION, slot_count, self.slot_stride,
+                            max_width, max_height, channels, -1)
+        self.frame_index = 0
+        print(f"[FrameRing] Created {path} ({slot_count} slots x {max_width}x{max_height}x{channels})")
+
+    def write(self, image: np.ndarray, sim_time_usec: int = 0) -> int:
+        """
+        (H, W, C) の uint8 画像（上の行から）を次のスロットに書き込み、フレーム番号を返す。
+        """
+        h, w, c = image.shape
+        if w > self.max_width or h > self.max_height or c != self.channels:
+            raise ValueError(f"frame {w}x{h}x{c} does not fit ring {self.max_width}x{self.max_height}x{self.channels}")
+        idx = self.frame_index
+        off = _HDR_SIZE + (idx % self.slot_count) * self.slot_stride
+        seq = _SLOT_HDR.unpack_from(self._mm, off)[0]
+
+        # 書き込み中（奇数）にしてからデータを書き、最後に偶数へ戻す
+        _SLOT_HDR.pack_into(self._mm, off, seq + 1, idx, sim_time_usec, w, h, c, w * h * c)
+        dst = np.frombuffer(self._mm, dtype=np.uint8, count=w * h * c, offset=off + _HDR_SIZE)
+        np.copyto(dst.reshape(h, w, c), image)
+        del dst
+        struct.pack_into("<Q", self._mm, off, seq + 2)
+        struct.pack_into("<q", self._mm, _LATEST_OFF, idx)
+        self.frame_index += 1
+        return idx
+
+    def close(self, unlink: bool = True):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class RingFrame:
+    """リングバッファ上の 1 フレーム。image はマップ領域を直接参照する（コピーなし）。"""
+    def __init__(self, reader: "FrameRingReader", offset: int, seq: int, frame_index: int,
+                 sim_time_usec: int, width: int, height: int, channels: int, image: np.ndarray):
+        self._reader = reader
+        self._offset = offset
+        self._seq = seq
+        self.frame_index = frame_index
+        self.sim_time_usec = sim_time_usec
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.image = image
+
+    def is_valid(self) -> bool:
+        """参照中に上書きされていなければ True（画像を使い終わった後に確認する）"""
+        return self._reader._slot_seq(self._offset) == self._seq
+
+    def copy(self) -> np.ndarray:
+        return self.image.copy()
+
+
+class FrameRingReader:
+    """
+    別プロセスからフレームを読むためのヘルパ。
+
+    使い方:
+        reader = FrameRingReader(path)
+        for frame in reader.frames():
+            process(frame.image)          # ゼロコピー参照
+            if not frame.is_valid():      # 処理中に上書きされた
+                continue
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slot_count, self.slot_stride, self.max_width, self.max_height, self.channels, _ = \
+            _FILE_HDR.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame ring (magic={magic!r}, version={version})")
+
+    @property
+    def latest_frame_index(self) -> int:
+        return struct.unpack_from("<q", self._mm, _LATEST_OFF)[0]
+
+    def _slot_seq(self, offset: int) -> int:
+        return struct.unpack_from("<Q", self._mm, offset)[0]
+
+    def read(self, frame_index: int) -> Optional[RingFrame]:
+        """指定フレームを返す。既に上書きされているか書き込み中なら None。"""
+        if frame_index < 0:
+            return None
+        off = _HDR_SIZE + (frame_index % self.slot_count) * self.slot_stride
+        seq, idx, sim_time, w, h, c, size = _SLOT_HDR.unpack_from(self._mm, off)
+        if seq & 1 or idx != frame_index or size == 0:
+            return None
+        image = np.frombuffer(self._mm, dtype=np.uint8, count=size, offset=off + _HDR_SIZE).reshape(h, w, c)
+        frame = RingFrame(self, off, seq, idx, sim_time, w, h, c, image)
+        return frame if frame.is_valid() else None
+
+    def latest(self) -> Optional[RingFrame]:
+        return self.read(self.latest_frame_index)
+
+    def frames(self, poll_interval: float = 0.001, timeout: Optional[float] = None) -> Iterator[RingFrame]:
+        """新しいフレームが書き込まれるたびに返すジェネレータ（追いつけない場合は最新へ飛ぶ）"""
+        last = self.latest_frame_index
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            cur = self.latest_frame_index
+            if cur > last:
+                frame = self.read(cur)
+                last = cur
+                if frame is not None:
+                    if deadline is not None:
+                        deadline = time.monotonic() + timeout
+                    yield frame
+                    continue
+            time.sleep(poll_interval)
+
+    def close(self):
+        self._mm.close()
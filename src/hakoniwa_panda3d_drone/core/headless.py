@@ -0,0 +1,58 @@
+"""
+ウィンドウを開かないヘッドレス実行（キャプチャ RPC・ストリーミング専用）の設定。
+ShowBase を作る前に configure_headless() で PRC を設定し、描画先を画面なしのバッファにする。
+表示の同期がないぶんのフレームレート制限は FrameLimiter（メインループの最後のタスク）で行う。
+
+  auto        : EGL（p3headlessgl）を試し、使えなければソフトウェア描画（p3tinydisplay）
+  egl         : EGL のオフスクリーンバッファ（GPU・ディスプレイなしの GL）
+  tinydisplay : ソフトウェアラスタライザ（GPU 不要。シェーダーは使えない）
+  gl          : 通常の pandagl（X はあるがウィンドウを出したくない場合）
+"""
+import time
+from panda3d.core import loadPrcFileData
+
+HEADLESS_PIPES = {
+    "auto": ("p3headlessgl", "p3tinydisplay"),
+    "egl": ("p3headlessgl", ""),
+    "tinydisplay": ("p3tinydisplay", ""),
+    "gl": ("pandagl", ""),
+}
+
+
+def configure_headless(pipe: str = "auto"):
+    if pipe not in HEADLESS_PIPES:
+        raise ValueError(f"unknown headless pipe: {pipe} (expected one of {tuple(HEADLESS_PIPES)})")
+    load_display, aux_display = HEADLESS_PIPES[pipe]
+    lines = [
+        "window-type offscreen",
+        f"load-display {load_display}",
+        "audio-library-name null",
+        # 画面がないので同期待ちをしない（フレームレートは App 側で制限する）
+        "sync-video false",
+    ]
+    if aux_display:
+        lines.append(f"aux-display {aux_display}")
+    loadPrcFileData("headless", "\n".join(lines))
+    print(f"[Visualizer] Headless mode: pipe={pipe} ({load_display}{', ' + aux_display if aux_display else ''})")
+
+
+class FrameLimiter:
+    """
+    メインループを frame_rate[fps] に抑えるタスク（ソート順を最後にして、フレームの残り時間だけ sleep する）。
+    ClockObject.MLimited は明示的な graphicsEngine.render_frame()（キャプチャ用の描画）まで
+    次のフレーム枠まで待たせるので使わない。
+    """
+    def __init__(self, frame_rate: float):
+        self.period = 1.0 / frame_rate
+        self._next = time.perf_counter()
+
+    def task(self, task):
+        now = time.perf_counter()
+        self._next += self.period
+        delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > self.period:
+            # 1 フレーム以上遅れたら予定時刻を作り直す（遅れを取り戻すための空回りをしない）
+            self._next = now
+        return task.cont
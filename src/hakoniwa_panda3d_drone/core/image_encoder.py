@@ -0,0 +1,173 @@
+import zlib
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Tuple
+import numpy as np
+from panda3d.core import PNMImage, StringStream, ConfigVariableInt
+from hakoniwa_panda3d_drone.core.metrics import get_metrics
+
+# image_type で指定できる形式
+#   "png"                : 可逆圧縮（既定）
+#   "jpeg" / "jpeg:<q>"  : 非可逆圧縮（q=品質 1〜100、既定 90）
+#   "raw_rgb"            : 無圧縮 RGB8（上の行から、ヘッダなし）
+#   "depth16"            : 距離[mm] の uint16（リトルエンディアン、0=無効）
+#   "depth32"            : 距離[m] の float32（リトルエンディアン、0=無効）
+IMAGE_FORMATS = ("png", "jpeg", "raw_rgb", "depth16", "depth32")
+DEFAULT_JPEG_QUALITY = 90
+
+
+def parse_image_type(image_type: Optional[str]) -> Tuple[str, Optional[int]]:
+    """
+    image_type 文字列を (形式, オプション) に分解する。未知の形式は png とみなす。
+    例: "JPEG:75" -> ("jpeg", 75), "jpg" -> ("jpeg", 90), "depth" -> ("depth32", None)
+    """
+    name, _, opt = (image_type or "png").strip().lower().partition(":")
+    name = {"jpg": "jpeg", "raw": "raw_rgb", "rgb": "raw_rgb", "depth": "depth32"}.get(name, name)
+    if name not in IMAGE_FORMATS:
+        return "png", None
+    if name == "jpeg":
+        quality = int(opt) if opt.isdigit() else DEFAULT_JPEG_QUALITY
+        return name, max(1, min(100, quality))
+    return name, None
+
+
+def is_depth_format(image_type: Optional[str]) -> bool:
+    return parse_image_type(image_type)[0].startswith("depth")
+
+
+class CapturedFrame:
+    """
+    GPU から読み戻した生画像。
+    data は Panda3D のテクスチャと同じく下の行から並ぶ（bottom-up）。
+    深度画像の場合は dtype が float32 などになり、depth_range に (near, far) を持つ。
+    """
+    __slots__ = ("data", "width", "height", "channels", "dtype", "depth_range")
+
+    def __init__(self, data, width: int, height: int, channels: int,
+                 dtype=np.uint8, depth_range: Optional[Tuple[float, float]] = None):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.depth_range = depth_range
+
+    def as_array(self) -> np.ndarray:
+        """上の行から並んだ (H, W, C) の配列（コピーなしのビュー）"""
+        a = np.frombuffer(self.data, dtype=self.dtype).reshape(self.height, self.width, self.channels)
+        return a[::-1]
+
+
+def _png_chunk(tag: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body) & 0xffffffff)
+
+
+def encode_png(frame: CapturedFrame, level: int = 6) -> bytes:
+    """
+    NumPy + zlib による PNG エンコード。
+    zlib は GIL を解放するため、ワーカースレッドで並列に実行できる。
+    各行に Up フィルタ（前の行との差分）をかけてから圧縮する。
+    """
+    img = frame.as_array()
+    h = frame.height
+    rows = img.reshape(h, -1)
+
+    filtered = np.empty((h, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 2  # Up
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+
+    color_type = {1: 0, 3: 2, 4: 6}[frame.channels]
+    ihdr = struct.pack(">IIBBBBB", frame.width, h, 8, color_type, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", ihdr),
+        _png_chunk(b"IDAT", zlib.compress(filtered, level)),
+        _png_chunk(b"IEND", b""),
+    ])
+
+
+_jpeg_lock = threading.Lock()
+
+
+def encode_jpeg(frame: CapturedFrame, quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+    """PNMImage による JPEG エンコード（品質は jpeg-quality 設定で渡すためロックする）"""
+    img = frame.as_array()
+    ppm = b"P6 %d %d 255\n" % (frame.width, frame.height) + np.ascontiguousarray(img[..., :3]).tobytes()
+    pnm = PNMImage()
+    pnm.read(StringStream(ppm), "ppm")
+    ss = StringStream()
+    with _jpeg_lock:
+        var = ConfigVariableInt("jpeg-quality")
+        prev = var.getValue()
+        var.setValue(quality)
+        try:
+            pnm.write(ss, "jpg")
+        finally:
+            var.setValue(prev)
+    return ss.getData()
+
+
+def encode_raw_rgb(frame: CapturedFrame) -> bytes:
+    """無圧縮 RGB8（上の行から）"""
+    return np.ascontiguousarray(frame.as_array()[..., :3]).tobytes()
+
+
+def linearize_depth(frame: CapturedFrame) -> np.ndarray:
+    """
+    深度バッファ値 [0,1] を透視投影の near/far から視線方向の距離[m]へ変換する。
+    背景（何も描画されていない画素）は 0 とする。
+    """
+    d = frame.as_array()[..., 0]
+    if d.dtype == np.uint32:
+        d = d / float(0xffffffff)
+    elif d.dtype == np.uint16:
+        d = d / float(0xffff)
+    d = d.astype(np.float32)
+    near, far = frame.depth_range
+    hit = d < 1.0
+    z = np.zeros_like(d)
+    z[hit] = (near * far) / (far - d[hit] * (far - near))
+    return z
+
+
+def encode_depth(frame: CapturedFrame, bits: int) -> bytes:
+    z = linearize_depth(frame)
+    if bits == 16:
+        return np.clip(np.rint(z * 1000.0), 0, 0xffff).astype("<u2").tobytes()
+    return z.astype("<f4").tobytes()
+
+
+def encode_image(frame: CapturedFrame, image_type: str) -> bytes:
+    """image_type に応じてエンコードする（未知の形式は png）"""
+    fmt, opt = parse_image_type(image_type)
+    if fmt == "jpeg":
+        return encode_jpeg(frame, opt)
+    if fmt == "raw_rgb":
+        return encode_raw_rgb(frame)
+    if fmt == "depth16":
+        return encode_depth(frame, 16)
+    if fmt == "depth32":
+        return encode_depth(frame, 32)
+    return encode_png(frame)
+
+
+def _encode_measured(frame: CapturedFrame, image_type: str) -> bytes:
+    metrics = get_metrics()
+    t0 = metrics.start()
+    data = encode_image(frame, image_type)
+    metrics.observe("capture_encode", t0)
+    return data
+
+
+class ImageEncoder:
+    """キャプチャ画像のエンコードを Panda3D のメインスレッドの外で行うワーカープール"""
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ImageEncoder")
+
+    def submit(self, frame: CapturedFrame, image_type: str) -> Future:
+        return self._pool.submit(_encode_measured, frame, image_type)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
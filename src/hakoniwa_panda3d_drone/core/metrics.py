@@ -0,0 +1,325 @@
+"""
+処理段ごとの所要時間・スループットの計測。
+
+  - Histogram : HDR 形式（2 の冪ごとに線形 16 分割、相対誤差 1/16 以下）のヒストグラム。値は usec の整数
+  - Metrics   : 名前 -> ヒストグラム / ゲージ / カウンタ。span() / start()+observe() で monotonic 時計の区間を測る
+  - MetricsDumper : 一定間隔で JSON と Prometheus テキスト形式のファイルへ書き出す
+無効時は span() が共有の空コンテキストを返し、start() / observe() / set_gauge() は何もしないので、
+計測箇所を残したままでもほぼコストがかからない。
+
+    metrics = get_metrics()
+    with metrics.span("pdu_read"):
+        ...
+    t0 = metrics.start()
+    ...
+    metrics.observe("capture_encode", t0)
+"""
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+# _SUB 未満はそのまま、それ以上は 2 の冪ごとに _HALF 分割（相対誤差 1/_HALF 以下）
+_SUB_BITS = 5
+_SUB = 1 << _SUB_BITS
+_HALF = _SUB >> 1
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _bucket_index(v: int) -> int:
+    if v < _SUB:
+        return v
+    shift = v.bit_length() - _SUB_BITS
+    return shift * _HALF + (v >> shift)
+
+
+def _bucket_range(index: int) -> tuple:
+    """バケットの値の範囲 [lo, hi)"""
+    if index < _SUB:
+        return index, index + 1
+    shift = index // _HALF - 1
+    m = index - shift * _HALF
+    return m << shift, (m + 1) << shift
+
+
+class Histogram:
+    """非負整数（usec）のヒストグラム。分位点は相対誤差 1/16 以内"""
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._counts: List[int] = []
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value_us: int):
+        v = value_us if value_us > 0 else 0
+        i = _bucket_index(v)
+        with self._lock:
+            counts = self._counts
+            if i >= len(counts):
+                counts.extend([0] * (i + 1 - len(counts)))
+            counts[i] += 1
+            if self.count == 0 or v < self.min:
+                self.min = v
+            if v > self.max:
+                self.max = v
+            self.count += 1
+            self.total += v
+
+    def quantiles(self, qs=QUANTILES) -> List[int]:
+        """各分位点の値（バケットの中央値を min..max に丸めたもの）"""
+        with self._lock:
+            counts = list(self._counts)
+            n, lo_v, hi_v = self.count, self.min, self.max
+        if n == 0:
+            return [0 for _ in qs]
+        out = []
+        for q in qs:
+            rank = max(1, int(q * n + 0.5))
+            seen = 0
+            for i, c in enumerate(counts):
+                seen += c
+                if seen >= rank:
+                    lo, hi = _bucket_range(i)
+                    out.append(min(max((lo + hi - 1) // 2, lo_v), hi_v))
+                    break
+        return out
+
+    def snapshot(self) -> dict:
+        p = self.quantiles()
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1e3, 3) if self.count else 0.0,
+            "p50_ms": p[0] / 1e3,
+            "p90_ms": p[1] / 1e3,
+            "p99_ms": p[2] / 1e3,
+            "p999_ms": p[3] / 1e3,
+            "max_ms": self.max / 1e3,
+            "sum_ms": self.total / 1e3,
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist: Histogram):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.record((time.perf_counter_ns() - self._t0) // 1000)
+        return False
+
+
+class Metrics:
+    """計測値の置き場所（プロセスで 1 つ。get_metrics() で取得する）"""
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self._hists: Dict[str, Histogram] = {}
+        self._gauges: Dict[str, float] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str = "") -> Histogram:
+        h = self._hists.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(name, Histogram(name, help))
+        return h
+
+    def span(self, name: str):
+        """with で囲んだ区間の所要時間を name のヒストグラムに記録する"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self.histogram(name))
+
+    def start(self) -> int:
+        """observe() と組で使う開始時刻[ns]（無効時は 0）"""
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def observe(self, name: str, t0_ns: int):
+        """start() からの経過時間を記録する"""
+        if self.enabled and t0_ns:
+            self.histogram(name).record((time.perf_counter_ns() - t0_ns) // 1000)
+
+    def observe_us(self, name: str, value_us: float):
+        if self.enabled:
+            self.histogram(name).record(int(value_us))
+
+    def set_gauge(self, name: str, value: float):
+        if self.enabled:
+            self._gauges[name] = value
+
+    def inc(self, name: str, n: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self):
+        """計測値を全て捨てる（ベンチマークのウォームアップ後などに使う）"""
+        with self._lock:
+            self._hists = {}
+            self._gauges = {}
+            self._counters = {}
+        self.started = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hists = list(self._hists.values())
+            counters = dict(self._counters)
+        return {
+            "time": time.time(),
+            "uptime_sec": round(time.time() - self.started, 3),
+            "histograms": {h.name: h.snapshot() for h in sorted(hists, key=lambda h: h.name)},
+            "gauges": dict(sorted(self._gauges.items())),
+            "counters": dict(sorted(counters.items())),
+        }
+
+
+def add_rates(snap: dict, prev: Optional[dict]) -> dict:
+    """前回のスナップショットとの差からヒストグラムごとの件数/秒（rate_per_sec）を付ける"""
+    dt = snap["time"] - prev["time"] if prev else snap["uptime_sec"]
+    prev_h = prev["histograms"] if prev else {}
+    for name, h in snap["histograms"].items():
+        delta = h["count"] - prev_h.get(name, {}).get("count", 0)
+        h["rate_per_sec"] = round(delta / dt, 2) if dt > 0 else 0.0
+    return snap
+
+
+def to_prometheus(snap: dict, prefix: str = "hako_visualizer") -> str:
+    """Prometheus のテキスト形式（ヒストグラムは summary として秒単位で出す）"""
+    lines = []
+    for name, h in snap["histograms"].items():
+        metric = f"{prefix}_{name}_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for q, key in zip(QUANTILES, ("p50_ms", "p90_ms", "p99_ms", "p999_ms")):
+            lines.append(f'{metric}{{quantile="{q}"}} {h[key] / 1e3:.6f}')
+        lines.append(f"{metric}_sum {h['sum_ms'] / 1e3:.6f}")
+        lines.append(f"{metric}_count {h['count']}")
+    for name, v in snap["gauges"].items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {v}")
+    for name, v in snap["counters"].items():
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {v}")
+    return "\n".join(lines) + "\n"
+
+
+def format_overlay(snap: dict) -> str:
+    """画面表示用の表（段ごとの p50 / p99 / max[ms] と件数/秒）"""
+    rows = [f"{'stage':<18}{'p50':>8}{'p99':>8}{'max':>8}{'/s':>8}"]
+    for name, h in snap["histograms"].items():
+        rows.append(f"{name:<18}{h['p50_ms']:>8.2f}{h['p99_ms']:>8.2f}{h['max_ms']:>8.2f}{h.get('rate_per_sec', 0):>8.1f}")
+    for name, v in snap["gauges"].items():
+        rows.append(f"{name:<18}{v:>8g}")
+    for name, v in snap["counters"].items():
+        rows.append(f"{name:<18}{v:>8d}")
+    return "\n".join(rows)
+
+
+def _write_atomic(path: str, text: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class MetricsDumper:
+    """
+    一定間隔でスナップショットをファイルに書き出すスレッド。
+    path が "out/metrics" なら out/metrics.json と out/metrics.prom（formats で選択）を上書きする。
+    """
+    def __init__(self, metrics: Metrics, path: str, interval_sec: float = 5.0,
+                 formats=("json", "prometheus")):
+        self.metrics = metrics
+        self.path = path
+        self.interval_sec = interval_sec
+        self.formats = tuple(formats)
+        self._prev: Optional[dict] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsDumper", daemon=True)
+
+    def start(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._thread.start()
+        print(f"[Metrics] Dumping {'/'.join(self.formats)} to {self.path}.* every {self.interval_sec}s")
+
+    def stop(self):
+        """スレッドを止めて最後の値を書き出す"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self.dump()
+
+    def dump(self):
+        snap = add_rates(self.metrics.snapshot(), self._prev)
+        self._prev = snap
+        if "json" in self.formats:
+            _write_atomic(self.path + ".json", json.dumps(snap, indent=2))
+        if "prometheus" in self.formats:
+            _write_atomic(self.path + ".prom", to_prometheus(snap))
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"[Metrics] Dump failed: {e}")
+
+
+_metrics: Optional[Metrics] = None
+_dumper: Optional[MetricsDumper] = None
+
+
+def get_metrics() -> Metrics:
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def configure_metrics(cfg: Optional[dict]) -> Metrics:
+    """
+    drone config の "metrics" で計測を有効にし、dump_path があれば定期書き出しを始める。
+    {"enabled": true, "dump_path": "metrics/visualizer", "interval_sec": 5, "formats": ["json", "prometheus"]}
+    """
+    global _dumper
+    metrics = get_metrics()
+    cfg = cfg or {}
+    metrics.enabled = bool(cfg.get('enabled', False))
+    if metrics.enabled and cfg.get('dump_path') and _dumper is None:
+        _dumper = MetricsDumper(metrics, cfg['dump_path'], cfg.get('interval_sec', 5.0),
+                                cfg.get('formats', ("json", "prometheus")))
+        _dumper.start()
+    return metrics
+
+
+def stop_metrics_dump():
+    global _dumper
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
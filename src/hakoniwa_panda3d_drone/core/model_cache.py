@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import panda3d
+from panda3d.core import NodePath, Filename, Point3
+
+# キャッシュの置き場所（環境変数で上書き可）
+CACHE_DIR_ENV = "HAKO_PANDA3D_CACHE_DIR"
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "hakoniwa_panda3d_drone" / "models"
+# フォーマットを変えたら上げる（古いキャッシュを無効化）
+CACHE_VERSION = 1
+
+
+def _file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk_size)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def _write_json_atomic(path: Path, data: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class CacheEntry:
+    """キャッシュ済みモデル 1 件分のメタデータ（.json として BAM の横に保存）"""
+    def __init__(self, cache: "ModelCache", key: str, meta: Dict[str, Any]):
+        self._cache = cache
+        self.key = key
+        self.meta = meta
+
+    @property
+    def tight_bounds(self) -> Optional[Tuple[Point3, Point3]]:
+        """モデル自身の座標系でのタイトバウンド（ジオメトリが無ければ None）"""
+        tb = self.meta.get("tight_bounds")
+        if not tb:
+            return None
+        return Point3(*tb[0]), Point3(*tb[1])
+
+    def has_auto_scale(self, placement: str) -> bool:
+        return placement in self.meta.get("auto_scale", {})
+
+    def get_auto_scale(self, placement: str) -> Optional[float]:
+        return self.meta.get("auto_scale", {}).get(placement)
+
+    def set_auto_scale(self, placement: str, scale: Optional[float]):
+        """配置（scale/hpr）ごとに求めた自動スケール係数を保存する。None は補正なし。"""
+        self.meta.setdefault("auto_scale", {})[placement] = scale
+        self._cache.save_meta(self)
+
+
+class ModelCache:
+    """
+    モデルファイルを .bam に変換して保存するディスクキャッシュ。
+    キーはファイル内容のハッシュ + ローダー設定 + Panda3D バージョン。
+    ファイルの (size, mtime) が変わっていなければ内容ハッシュの再計算も省略する。
+    """
+    def __init__(self, cache_dir: Optional[str] = None):
+        d = cache_dir or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        self.cache_dir = Path(d)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._stat_index_path = self.cache_dir / "stat_index.json"
+        try:
+            with open(self._stat_index_path, "r") as f:
+                self._stat_index: Dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            self._stat_index = {}
+
+    # --- キー計算 ---
+    def content_hash(self, path: Path) -> str:
+        st = path.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+        rec = self._stat_index.get(str(path))
+        if rec is not None and rec.get("stamp") == stamp:
+            return rec["sha256"]
+        digest = _file_sha256(path)
+        self._stat_index[str(path)] = {"stamp": stamp, "sha256": digest}
+        _write_json_atomic(self._stat_index_path, self._stat_index)
+        return digest
+
+    def make_key(self, path: Path, settings: Optional[dict] = None) -> str:
+        h = hashlib.sha256()
+        h.update(self.content_hash(path).encode())
+        h.update(json.dumps(settings or {}, sort_keys=True).encode())
+        h.update(f"{panda3d.__version__}:{CACHE_VERSION}".encode())
+        return h.hexdigest()[:32]
+
+    def _bam_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.bam"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def save_meta(self, entry: CacheEntry):
+        _write_json_atomic(self._meta_path(entry.key), entry.meta)
+
+    # --- 公開API ---
+    def load(self, loader, path: str, settings: Optional[dict] = None) -> Tuple[NodePath, CacheEntry]:
+        """
+        キャッシュがあれば .bam を直接ロードし、無ければ元ファイルをロードして .bam に変換する。
+        settings: ローダーへ渡した設定など、変換結果に影響する値（キーに含める）
+        """
+        src = Path(path)
+        key = self.make_key(src, settings)
+        bam = self._bam_path(key)
+        meta_path = self._meta_path(key)
+
+        if bam.exists() and meta_path.exists():
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                model_np = loader.loadModel(Filename.fromOsSpecific(str(bam)), noCache=True)
+                print(f"[ModelCache] Hit: {src.name} -> {bam.name}")
+                return model_np, CacheEntry(self, key, meta)
+            except (OSError, ValueError) as e:
+                print(f"[ModelCache] Broken cache entry {bam.name}: {e}. Rebuilding.")
+
+        print(f"[ModelCache] Miss: converting {src} to BAM...")
+        model_np = loader.loadModel(Filename.fromOsSpecific(str(src)), noCache=True)
+
+        bounds = model_np.getTightBounds(model_np)
+        meta: Dict[str, Any] = {
+            "source": str(src),
+            "settings": settings or {},
+            "tight_bounds": [list(bounds[0]), list(bounds[1])] if bounds else None,
+            "auto_scale": {},
+        }
+        tmp = bam.with_suffix(".bam.tmp")
+        if model_np.writeBamFile(Filename.fromOsSpecific(str(tmp))):
+            os.replace(tmp, bam)
+            _write_json_atomic(meta_path, meta)
+            print(f"[ModelCache] Stored: {bam}")
+        else:
+            print(f"[ModelCache] Warning: failed to write {bam}")
+        return model_np, CacheEntry(self, key, meta)
+
+    def load_derived(self, loader, path: str, settings: dict, build: Callable[[], NodePath]) -> NodePath:
+        """
+        元ファイルから作った派生シーン（チャンク分割など）を .bam としてキャッシュする。
+        キーは元ファイルの内容ハッシュ + settings。キャッシュが無ければ build() で作って保存する。
+        """
+        src = Path(path)
+        key = self.make_key(src, settings)
+        bam = self._bam_path(key)
+        if bam.exists():
+            try:
+                derived = loader.loadModel(Filename.fromOsSpecific(str(bam)), noCache=True)
+                print(f"[ModelCache] Hit: {src.name} ({settings.get('derived')}) -> {bam.name}")
+                return derived
+            except (OSError, ValueError) as e:
+                print(f"[ModelCache] Broken cache entry {bam.name}: {e}. Rebuilding.")
+
+        print(f"[ModelCache] Miss: building {settings.get('derived')} of {src}...")
+        derived = build()
+        tmp = bam.with_suffix(".bam.tmp")
+        if derived.writeBamFile(Filename.fromOsSpecific(str(tmp))):
+            os.replace(tmp, bam)
+            print(f"[ModelCache] Stored: {bam}")
+        else:
+            print(f"[ModelCache] Warning: failed to write {bam}")
+        return derived
+
+
+_default_cache: Optional[ModelCache] = None
+
+
+def get_model_cache() -> ModelCache:
+    """プロセス共通の ModelCache を返す"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ModelCache()
+    return _default_cache
@@ -0,0 +1,37 @@
+from pathlib import Path
+from typing import Dict
+from panda3d.core import NodePath
+
+
+class ModelRegistry:
+    """
+    解決済みパスをキーにモデルを 1 回だけロードして保持するレジストリ。
+    各エンティティは instance() で得たプロトタイプを instanceTo で共有するため、
+    同じ部品（ローター等）が何個あってもメモリ使用量とロード時間は増えない。
+    """
+    def __init__(self, loader):
+        self.loader = loader
+        self._models: Dict[str, NodePath] = {}
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, path: str) -> NodePath:
+        """プロトタイプ NodePath を返す（シーンには接続されていない）"""
+        key = str(Path(path).resolve())
+        model_np = self._models.get(key)
+        if model_np is not None:
+            self.hits += 1
+            return model_np
+
+        print(f"[ModelRegistry] Loading shared model: {key}")
+        model_np = self.loader.loadModel(key, noCache=True)
+        self._models[key] = model_np
+        self.loads += 1
+        return model_np
+
+    def instance(self, path: str, parent: NodePath) -> NodePath:
+        """parent 配下にモデルをインスタンスとしてぶら下げ、その NodePath を返す"""
+        return self.get(path).instanceTo(parent)
+
+    def __len__(self) -> int:
+        return len(self._models)
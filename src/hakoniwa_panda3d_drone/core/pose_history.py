@@ -0,0 +1,115 @@
+import math
+import threading
+from typing import Dict, Optional, Tuple
+import numpy as np
+from panda3d.core import Vec3, Quat
+from hakoniwa_panda3d_drone.core.state_mailbox import DronePose
+
+
+def slerp_hpr(hpr0: Vec3, hpr1: Vec3, t: float) -> Vec3:
+    """2 つの姿勢（HPR[deg]）をクォータニオンの球面線形補間で補間する"""
+    q0, q1 = Quat(), Quat()
+    q0.set_hpr(hpr0)
+    q1.set_hpr(hpr1)
+    a = np.array([q0[0], q0[1], q0[2], q0[3]])
+    b = np.array([q1[0], q1[1], q1[2], q1[3]])
+    dot = float(np.dot(a, b))
+    if dot < 0.0:  # 短い方の弧を通る
+        b, dot = -b, -dot
+    if dot > 0.9995:
+        q = a + (b - a) * t
+    else:
+        theta = math.acos(dot)
+        q = (a * math.sin((1.0 - t) * theta) + b * math.sin(t * theta)) / math.sin(theta)
+    q /= np.linalg.norm(q)
+    return Quat(*q).get_hpr()
+
+
+def lerp_vec3(p0: Vec3, p1: Vec3, t: float) -> Vec3:
+    return Vec3(p0 + (p1 - p0) * t)
+
+
+class _DroneRing:
+    """1 機分の固定長リングバッファ（時刻は単調増加で保持する）"""
+    def __init__(self, capacity: int):
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.pos = np.zeros((capacity, 3), dtype=np.float64)
+        self.hpr = np.zeros((capacity, 3), dtype=np.float64)
+        self.rotor = np.zeros(capacity, dtype=np.float64)
+        self.head = 0   # 次に書き込む位置
+        self.count = 0
+
+    def order(self) -> np.ndarray:
+        """古い順のインデックス"""
+        cap = len(self.times)
+        return (self.head - self.count + np.arange(self.count)) % cap
+
+
+class PoseHistory:
+    """
+    ドローンごとの姿勢履歴（箱庭のシミュレーション時刻付き）。
+    env_control_loop が受信したすべてのサンプルを record() し、
+    キャプチャ時に sample() で指定時刻の姿勢を補間して取り出す。
+    """
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[str, _DroneRing] = {}
+
+    def record(self, drone_name: str, pos: Vec3, hpr: Vec3, rotor_speed: float, sim_time_usec: int):
+        with self._lock:
+            ring = self._rings.get(drone_name)
+            if ring is None:
+                ring = self._rings[drone_name] = _DroneRing(self.capacity)
+            if ring.count > 0:
+                last = (ring.head - 1) % self.capacity
+                if sim_time_usec < ring.times[last]:
+                    # 時刻が巻き戻った（シミュレーションのリセット）ので履歴を捨てる
+                    ring.count = 0
+                elif sim_time_usec == ring.times[last]:
+                    # 同じ時刻は上書きする
+                    ring.head = last
+                    ring.count -= 1
+            i = ring.head
+            ring.times[i] = sim_time_usec
+            ring.pos[i] = (pos[0], pos[1], pos[2])
+            ring.hpr[i] = (hpr[0], hpr[1], hpr[2])
+            ring.rotor[i] = rotor_speed
+            ring.head = (i + 1) % self.capacity
+            ring.count = min(ring.count + 1, self.capacity)
+
+    def time_range(self, drone_name: str) -> Optional[Tuple[int, int]]:
+        """保持している (最古, 最新) の時刻。履歴がなければ None"""
+        with self._lock:
+            ring = self._rings.get(drone_name)
+            if ring is None or ring.count == 0:
+                return None
+            idx = ring.order()
+            return int(ring.times[idx[0]]), int(ring.times[idx[-1]])
+
+    def sample(self, drone_name: str, sim_time_usec: int) -> Optional[DronePose]:
+        """
+        指定時刻の姿勢を前後のサンプルから補間して返す。
+        最新より後の時刻は最新のサンプル、最古より前（破棄済み）や履歴なしは None。
+        返す DronePose の sim_time_usec は実際に使った時刻。
+        """
+        with self._lock:
+            ring = self._rings.get(drone_name)
+            if ring is None or ring.count == 0:
+                return None
+            idx = ring.order()
+            times = ring.times[idx]
+            if sim_time_usec < times[0]:
+                return None
+            k = int(np.searchsorted(times, sim_time_usec, side="right"))
+            if k >= len(times):
+                i = idx[-1]
+                return DronePose(Vec3(*ring.pos[i]), Vec3(*ring.hpr[i]), float(ring.rotor[i]), int(times[-1]))
+            i0, i1 = idx[k - 1], idx[k]
+            t0, t1 = times[k - 1], times[k]
+            p0, p1 = Vec3(*ring.pos[i0]), Vec3(*ring.pos[i1])
+            h0, h1 = Vec3(*ring.hpr[i0]), Vec3(*ring.hpr[i1])
+            r0, r1 = float(ring.rotor[i0]), float(ring.rotor[i1])
+
+        t = (sim_time_usec - t0) / float(t1 - t0)
+        return DronePose(lerp_vec3(p0, p1, t), slerp_hpr(h0, h1, t), r0 + (r1 - r0) * t, int(sim_time_usec))
@@ -0,0 +1,83 @@
+from typing import Dict
+from hakoniwa_panda3d_drone.core.state_mailbox import DronePose
+from hakoniwa_panda3d_drone.core.pose_history import lerp_vec3, slerp_hpr
+
+# 区間が極端に短いと補間が振動するため下限を設ける[sec]
+_MIN_SEGMENT_SEC = 0.001
+# 受信間隔の指数移動平均の重み（新しい間隔の割合）
+_PERIOD_EMA_ALPHA = 0.3
+# 表示中の姿勢が新しいサンプルからこのサンプル数分より遅れていたら、直前のサンプルまで飛ばす
+_MAX_LAG_SAMPLES = 2.0
+
+
+class _Segment:
+    """表示中の補間区間（start から end へ、end の受信時刻から duration 秒かけて進む）。period は受信間隔の平均[sec]"""
+    __slots__ = ("start", "end", "received_at", "duration", "period")
+
+    def __init__(self, start: DronePose, end: DronePose, received_at: float, duration: float, period: float = 0.0):
+        self.start = start
+        self.end = end
+        self.received_at = received_at
+        self.duration = duration
+        self.period = period
+
+
+def _blend(a: DronePose, b: DronePose, t: float) -> DronePose:
+    """t=0 で a、t=1 で b。t>1 は a→b の延長（外挿）。ローター速度は補間せず b の値を使う"""
+    return DronePose(
+        lerp_vec3(a.pos, b.pos, t),
+        slerp_hpr(a.hpr, b.hpr, t),
+        b.rotor_speed,
+        int(a.sim_time_usec + (b.sim_time_usec - a.sim_time_usec) * t),
+    )
+
+
+class PoseInterpolator:
+    """
+    PDU の受信周期と描画周期の差を埋める補間器。
+    新しいサンプルを受け取ると「いま表示している姿勢」から新しいサンプルへの区間を作り、
+    実時間で測った受信間隔（指数移動平均）をかけて描画フレームごとに補間する（表示は 1 サンプル分遅れる）。
+    区間の長さをシミュレーション時間で決めると、実時間より速く進むシミュレーションでは表示が際限なく遅れるため。
+    それでも表示中の姿勢が新しいサンプルより 2 サンプル分以上遅れたときは、直前のサンプルまで飛ばす。
+    位置は線形補間、姿勢はクォータニオンの球面線形補間。
+    区間の終わりまで次のサンプルが来なければ、extrapolate=True のとき最大 max_extrapolation_sec だけ
+    同じ速度で先へ進め（デッドレコニング）、それ以外は最後のサンプルで止める。
+    """
+    def __init__(self, enabled: bool = True, extrapolate: bool = False, max_extrapolation_sec: float = 0.1):
+        self.enabled = enabled
+        self.extrapolate = extrapolate
+        self.max_extrapolation_sec = max_extrapolation_sec
+        self._segments: Dict[str, _Segment] = {}
+
+    def push(self, drone_name: str, pose: DronePose, now: float):
+        """新しいサンプルを登録する（now は time.monotonic() の値）"""
+        seg = self._segments.get(drone_name)
+        if seg is None or not self.enabled:
+            self._segments[drone_name] = _Segment(pose, pose, now, _MIN_SEGMENT_SEC)
+            return
+        interval = now - seg.received_at
+        period = interval if seg.period <= 0.0 else seg.period + _PERIOD_EMA_ALPHA * (interval - seg.period)
+        shown = self._evaluate(seg, now)
+        sample_usec = pose.sim_time_usec - seg.end.sim_time_usec
+        if sample_usec > 0 and pose.sim_time_usec - shown.sim_time_usec > _MAX_LAG_SAMPLES * sample_usec:
+            shown = seg.end
+        self._segments[drone_name] = _Segment(shown, pose, now, max(period, _MIN_SEGMENT_SEC), period)
+
+    def _evaluate(self, seg: _Segment, now: float) -> DronePose:
+        t = (now - seg.received_at) / seg.duration
+        if t <= 0.0:
+            return seg.start
+        if t < 1.0:
+            return _blend(seg.start, seg.end, t)
+        if self.extrapolate and seg.start is not seg.end:
+            t_max = 1.0 + self.max_extrapolation_sec / seg.duration
+            return _blend(seg.start, seg.end, min(t, t_max))
+        return seg.end
+
+    def newest_sim_time_usec(self) -> Dict[str, int]:
+        """ドローンごとの最新サンプルのシミュレーション時刻（表示遅れの計測用）"""
+        return {name: seg.end.sim_time_usec for name, seg in self._segments.items()}
+
+    def evaluate(self, now: float) -> Dict[str, DronePose]:
+        """描画時刻 now におけるドローンごとの姿勢"""
+        return {name: self._evaluate(seg, now) for name, seg in self._segments.items()}
@@ -0,0 +1,160 @@
+"""
+姿勢ストリームの記録ファイル（リプレイ用）。
+
+env_control_loop が tick ごとに全ドローンの姿勢・ローター速度・カメラ上下ボタンを 1 レコードとして追記し、
+リプレイ側はファイルを np.memmap で開いて必要なレコードだけを読む。
+
+ファイルレイアウト（リトルエンディアン）:
+  [ファイルヘッダ 64B][ドローン名（JSON の配列, UTF-8）][0 埋めで header_size まで][レコード0][レコード1]...
+  ファイルヘッダ: magic, version, header_size, drone_count, record_size, delta_time_usec
+  レコード      : sim_time_usec(i8), pos(f4 N×3), hpr(f4 N×3)[deg], rotor_speed(f4 N), flags(u1 N), 0 埋め
+                  位置・姿勢は Panda3D 座標系、rotor_speed は hako_asset と同じ 1 サンプルあたりの回転角[deg]
+                  flags: FLAG_POSE（その tick に姿勢があった）/ FLAG_CTRL（ボタンの値があった）/ FLAG_UP / FLAG_DOWN
+
+時刻インデックス: レコードは固定長で sim_time_usec は単調増加（戻った tick は書かない）なので、
+mmap 上の sim_time_usec の列を二分探索すれば任意の時刻のレコード位置が O(log n) で求まる。
+別の索引を持たないため、記録中に落ちても最後の完全なレコードまでがそのまま読める。
+"""
+import os
+import json
+import time
+import struct
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+MAGIC = b"HKPOSE01"
+VERSION = 1
+_FILE_HDR = struct.Struct("<8sIIIIq")
+_HDR_SIZE = 64
+
+FLAG_POSE = 0x01
+FLAG_CTRL = 0x02
+FLAG_UP = 0x04
+FLAG_DOWN = 0x08
+
+
+def record_dtype(drone_count: int) -> np.dtype:
+    """N 機分の 1 レコードの dtype（8 バイト境界に揃える）"""
+    n = drone_count
+    offsets = [0, 8, 8 + 12 * n, 8 + 24 * n, 8 + 28 * n]
+    size = (8 + 29 * n + 7) & ~7
+    return np.dtype({
+        "names": ["sim_time_usec", "pos", "hpr", "rotor_speed", "flags"],
+        "formats": ["<i8", ("<f4", (n, 3)), ("<f4", (n, 3)), ("<f4", (n,)), ("u1", (n,))],
+        "offsets": offsets,
+        "itemsize": size,
+    })
+
+
+class PoseLogWriter:
+    """
+    記録ファイルへの追記（env_control_loop のスレッドから使う）。
+    書き込みはバッファリングし、flush_interval_sec ごとにファイルへ出す。
+    """
+    def __init__(self, path: str, drone_names: Sequence[str], delta_time_usec: int,
+                 flush_interval_sec: float = 1.0):
+        self.path = path
+        self.drone_names = list(drone_names)
+        self.delta_time_usec = delta_time_usec
+        self.flush_interval_sec = flush_interval_sec
+        self.records = 0
+        self.skipped = 0  # 時刻が戻った・進まなかった tick
+        self._slot: Dict[str, int] = {name: i for i, name in enumerate(self.drone_names)}
+        self._dtype = record_dtype(len(self.drone_names))
+        self._rec = np.zeros(1, dtype=self._dtype)
+        self._last_time: Optional[int] = None
+        self._last_flush = time.monotonic()
+
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        names = json.dumps(self.drone_names).encode("utf-8")
+        header_size = (_HDR_SIZE + len(names) + 63) & ~63
+        header = bytearray(header_size)
+        _FILE_HDR.pack_into(header, 0, MAGIC, VERSION, header_size, len(self.drone_names),
+                            self._dtype.itemsize, delta_time_usec)
+        header[_HDR_SIZE:_HDR_SIZE + len(names)] = names
+        self._f = open(path, "wb")
+        self._f.write(header)
+
+    def write(self, sim_time_usec: int, names: Sequence[str], positions, hprs, rotor_speeds,
+              buttons: Optional[Dict[str, tuple]] = None):
+        """1 tick 分を追記する（names と positions/hprs (N,3)・rotor_speeds (N,) は同じ順）"""
+        if self._last_time is not None and sim_time_usec <= self._last_time:
+            self.skipped += 1
+            return
+        self._last_time = sim_time_usec
+        rec = self._rec[0]
+        rec["flags"][:] = 0
+        idx = [self._slot.get(n, -1) for n in names]
+        rows = [i for i, s in enumerate(idx) if s >= 0]
+        slots = [idx[i] for i in rows]
+        rec["sim_time_usec"] = sim_time_usec
+        if slots:
+            rec["pos"][slots] = np.asarray(positions)[rows]
+            rec["hpr"][slots] = np.asarray(hprs)[rows]
+            rec["rotor_speed"][slots] = np.asarray(rotor_speeds)[rows]
+            rec["flags"][slots] = FLAG_POSE
+        for name, (up, down) in (buttons or {}).items():
+            s = self._slot.get(name)
+            if s is not None:
+                rec["flags"][s] |= FLAG_CTRL | (FLAG_UP if up else 0) | (FLAG_DOWN if down else 0)
+        self._f.write(self._rec.tobytes())
+        self.records += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval_sec:
+            self._f.flush()
+            self._last_flush = now
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def stats(self) -> dict:
+        return {"records": self.records, "skipped": self.skipped}
+
+
+class PoseLogReader:
+    """記録ファイルを mmap で読む。records は (レコード数,) の構造化配列（ファイルの内容を直接参照する）"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            head = f.read(_HDR_SIZE)
+            if len(head) < _HDR_SIZE:
+                raise ValueError(f"not a pose log: {path}")
+            magic, version, header_size, drone_count, record_size, delta = _FILE_HDR.unpack_from(head)
+            if magic != MAGIC:
+                raise ValueError(f"not a pose log: {path}")
+            if version != VERSION:
+                raise ValueError(f"unsupported pose log version: {version}")
+            names = f.read(header_size - _HDR_SIZE).rstrip(b"\0")
+        self.drone_names: List[str] = json.loads(names.decode("utf-8"))
+        self.delta_time_usec = delta
+        self.dtype = record_dtype(drone_count)
+        if self.dtype.itemsize != record_size:
+            raise ValueError(f"record size mismatch: {record_size} != {self.dtype.itemsize}")
+        # 書き込み途中の末尾（不完全なレコード）は読まない
+        count = (os.path.getsize(path) - header_size) // record_size
+        if count > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=header_size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        self.times = self.records["sim_time_usec"]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def time_range(self) -> tuple:
+        """(最初, 最後) の sim_time_usec"""
+        if len(self.records) == 0:
+            return 0, 0
+        return int(self.times[0]), int(self.times[-1])
+
+    def index_at(self, sim_time_usec: int) -> int:
+        """sim_time_usec 以前で最後のレコードの位置（先頭より前なら 0）"""
+        i = int(np.searchsorted(self.times, sim_time_usec, side="right")) - 1
+        return min(max(i, 0), len(self.records) - 1)
+
+    def close(self):
+        # 参照がなくなった時点で mmap が閉じられる
+        self.records = self.times = None
@@ -0,0 +1,150 @@
+"""
+ローター回転のシェーダー駆動アニメーション。
+
+回転角は頂点シェーダーで  phase + speed * (osg_FrameTime - t0)  として毎フレーム求め、
+ローターエンティティのローカル Z 軸まわりに回す（CPU 版の setH と同じ回り方）。
+Python 側は回転速度が変わったときだけ rotor_spin = (phase[deg], speed[deg/s], t0[sec]) を書き換える。
+GLSL 1.50 を使えない GSG（tinydisplay、macOS の legacy コンテキストなど）では DroneHandle.spin_rotors による CPU 回転に戻す。
+"""
+from typing import Iterable, Optional
+from panda3d.core import NodePath, Shader, LVecBase3f
+
+ROTOR_SPIN_VERT = """
+#version 150
+uniform mat4 trans_model_to_rotor;
+uniform mat4 trans_rotor_to_clip;
+uniform mat4 trans_rotor_to_apiview;
+uniform float osg_FrameTime;
+uniform vec3 rotor_spin;   // phase[deg], speed[deg/s], t0[sec]
+uniform float rotor_dir;   // -1: 時計回り, +1: 反時計回り
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec4 p3d_Color;
+in vec2 p3d_MultiTexCoord0;
+
+out vec3 v_pos;
+out vec3 v_normal;
+out vec4 v_color;
+out vec2 v_uv;
+
+void main() {
+    float a = radians(rotor_dir * (rotor_spin.x + rotor_spin.y * (osg_FrameTime - rotor_spin.z)));
+    float c = cos(a);
+    float s = sin(a);
+    mat4 spin = mat4(c, s, 0.0, 0.0,
+                     -s, c, 0.0, 0.0,
+                     0.0, 0.0, 1.0, 0.0,
+                     0.0, 0.0, 0.0, 1.0);
+    vec4 p = spin * (trans_model_to_rotor * p3d_Vertex);
+    gl_Position = trans_rotor_to_clip * p;
+    v_pos = (trans_rotor_to_apiview * p).xyz;
+    v_normal = mat3(trans_rotor_to_apiview) * (mat3(spin) * (mat3(trans_model_to_rotor) * p3d_Normal));
+    v_color = p3d_Color;
+    v_uv = p3d_MultiTexCoord0;
+}
+"""
+
+ROTOR_SPIN_FRAG = """
+#version 150
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+uniform struct {
+    vec4 ambient;
+} p3d_LightModel;
+uniform struct {
+    vec4 diffuse;
+} p3d_Material;
+uniform struct {
+    vec4 color;
+    vec4 position;
+} p3d_LightSource[4];
+
+in vec3 v_pos;
+in vec3 v_normal;
+in vec4 v_color;
+in vec2 v_uv;
+
+out vec4 o_color;
+
+void main() {
+    vec4 base = v_color * p3d_Material.diffuse * p3d_ColorScale * texture(p3d_Texture0, v_uv);
+    vec3 n = normalize(v_normal);
+    if (!gl_FrontFacing) {
+        n = -n;
+    }
+    vec3 light = p3d_LightModel.ambient.rgb;
+    for (int i = 0; i < p3d_LightSource.length(); ++i) {
+        vec4 lp = p3d_LightSource[i].position;
+        vec3 l = normalize(lp.xyz - v_pos * lp.w);
+        light += p3d_LightSource[i].color.rgb * max(dot(n, l), 0.0);
+    }
+    o_color = vec4(base.rgb * min(light, vec3(1.0)), base.a);
+}
+"""
+
+# 同じ速度のまま経過時間が長くなると float32 の角度計算が粗くなるので、この間隔で phase/t0 を取り直す[sec]
+_REBASE_SEC = 30.0
+
+_shader: Optional[Shader] = None
+
+
+def rotor_spin_shader() -> Shader:
+    global _shader
+    if _shader is None:
+        _shader = Shader.make(Shader.SL_GLSL, ROTOR_SPIN_VERT, ROTOR_SPIN_FRAG)
+    return _shader
+
+
+# シェーダーは #version 150 で書いているので、GLSL 1.20 までのコンテキスト（macOS の既定の legacy
+# コンテキストなど）では getSupportsGlsl() が True でもコンパイルできない
+REQUIRED_GLSL_VERSION = (1, 50)
+
+
+def driver_glsl_version(win) -> tuple:
+    """ウィンドウ（バッファ）の GSG が扱える GLSL のバージョン (major, minor)。GLSL を使えなければ (0, 0)"""
+    gsg = win.getGsg() if win is not None else None
+    if gsg is None or not gsg.getSupportsBasicShaders() or not gsg.getSupportsGlsl():
+        return (0, 0)
+    return (gsg.getDriverShaderVersionMajor(), gsg.getDriverShaderVersionMinor())
+
+
+def shader_spin_supported(win) -> bool:
+    """ウィンドウ（バッファ）の GSG でローター回転シェーダー（GLSL 1.50）を使えるか"""
+    return driver_glsl_version(win) >= REQUIRED_GLSL_VERSION
+
+
+class RotorSpin:
+    """1 機分のローター回転（GPU）。速度が変わったときだけシェーダー入力を更新する"""
+    __slots__ = ("np", "phase", "speed", "t0", "updates")
+
+    def __init__(self, drone_np: NodePath, rotors_cw: Iterable[NodePath], rotors_ccw: Iterable[NodePath]):
+        shader = rotor_spin_shader()
+        for direction, rotors in ((-1.0, rotors_cw), (1.0, rotors_ccw)):
+            for r in rotors:
+                # ジオメトリのラッパーノードの親（ローターエンティティ）の Z 軸まわりに回す
+                r.setShader(shader, 1)
+                r.setShaderInput("rotor", r.getParent())
+                r.setShaderInput("rotor_dir", direction)
+        self.np = drone_np
+        self.phase = 0.0
+        self.speed = 0.0
+        self.t0 = 0.0
+        self.updates = 0
+        self._write()
+
+    def set_speed(self, speed_dps: float, frame_time: float) -> bool:
+        """回転速度[deg/s] を設定する（frame_time は ClockObject のフレーム時刻）。入力を書き換えたら True"""
+        elapsed = frame_time - self.t0
+        if speed_dps == self.speed and elapsed < _REBASE_SEC:
+            return False
+        # 角度が連続するよう、いまの角度を新しい phase にする
+        self.phase = (self.phase + self.speed * elapsed) % 360.0
+        self.speed = speed_dps
+        self.t0 = frame_time
+        self._write()
+        return True
+
+    def _write(self):
+        self.np.setShaderInput("rotor_spin", LVecBase3f(self.phase, self.speed, self.t0))
+        self.updates += 1
@@ -0,0 +1,162 @@
+"""
+環境モデルのバックグラウンドロード。
+
+起動時はウィンドウとドローンを先に出し、環境（.glb / MJCF など）はローダー用のタスクチェーンで読み込む。
+  - ワーカー: 切り離した仮の親ノードの下で EnvironmentEntity を作る（ロード・チャンク分割・キャッシュ）。
+    Panda3D のスレッド（taskMgr のスレッド付きタスクチェーン）で動かす。Python の threading のスレッドは
+    Panda3D からは区別されないため、描画中に loadModel を呼ぶと落ちることがある
+  - メインスレッド: 毎フレームのタスクで完了したものを render に付け替える（シーングラフの変更は描画と同じスレッド）
+進捗は "[Environment] 1/3 Loaded town (2.41s)" のようにログへ出し、画面の進捗表示にも使う。
+全環境の処理が終わる（失敗を含む）と ready が True になり、キャプチャ RPC が受け付けられるようになる。
+"""
+import time
+import threading
+from typing import Callable, List, Optional
+from panda3d.core import NodePath
+from hakoniwa_panda3d_drone.core.environment import EnvironmentEntity
+
+
+def _environment_kwargs(env_config: dict) -> dict:
+    """drone config の environments の 1 要素を EnvironmentEntity の引数にする"""
+    return dict(
+        name=env_config.get('name', 'environment'),
+        model_path=env_config['model'],
+        pos=env_config.get('pos'),
+        hpr=env_config.get('hpr'),
+        scale=env_config.get('scale', 1.0),
+        cache=env_config.get('cache', False),
+        copy=env_config.get('copy', False),
+        batch=env_config.get('batch', False),
+        batch_chunk_size=env_config.get('batch_chunk_size', 100.0),
+        chunk=env_config.get('chunk', False),
+        chunk_size=env_config.get('chunk_size', 200.0),
+        lod_distances=env_config.get('lod_distances'),
+        proxy_grid=env_config.get('proxy_grid', 4),
+    )
+
+
+class _Job:
+    __slots__ = ("name", "kwargs", "elapsed", "done", "env", "error")
+
+    def __init__(self, env_config: dict):
+        self.kwargs = _environment_kwargs(env_config)
+        self.name = self.kwargs['name']
+        self.elapsed = 0.0
+        self.done = False
+        self.env: Optional[EnvironmentEntity] = None
+        self.error: Optional[Exception] = None
+
+
+class EnvironmentLoader:
+    """
+    環境の非同期ロード。start() でワーカーに投げ、poll() をメインスレッドから毎フレーム呼ぶ。
+    async_load=False なら start() の中で順に読み込んで付け替える（従来の同期ロード）。
+    """
+    TASK_CHAIN = "env_loader"
+
+    def __init__(self, render: NodePath, loader, task_mgr, env_configs: List[dict],
+                 async_load: bool = True, max_workers: int = 1,
+                 on_loaded: Optional[Callable[[EnvironmentEntity], None]] = None):
+        self.render = render
+        self.loader = loader
+        self.task_mgr = task_mgr
+        self.async_load = async_load
+        self.on_loaded = on_loaded
+        self.envs: List[EnvironmentEntity] = []
+        self.failed: List[str] = []
+        self._jobs = [_Job(c) for c in env_configs]
+        self._pending: List[_Job] = []
+        self._max_workers = max(1, int(max_workers))
+        self._t0 = 0.0
+        # RPC（別スレッド）から参照されるので、読み込み済みの数と完了フラグだけを書き換える
+        self._lock = threading.Lock()
+        self._done = 0
+        self._ready = len(self._jobs) == 0
+
+    @property
+    def total(self) -> int:
+        return len(self._jobs)
+
+    @property
+    def ready(self) -> bool:
+        """全環境の処理が終わったか（失敗したものも終わった扱い）"""
+        return self._ready
+
+    def progress(self) -> tuple:
+        """(処理済みの数, 全体の数)"""
+        with self._lock:
+            return self._done, len(self._jobs)
+
+    def status_text(self) -> str:
+        done, total = self.progress()
+        loading = [j.name for j in self._pending]
+        text = f"Loading environments {done}/{total}"
+        return f"{text}: {', '.join(loading)}" if loading else text
+
+    def start(self):
+        self._t0 = time.monotonic()
+        if not self._jobs:
+            return
+        if not self.async_load:
+            for job in self._jobs:
+                self._run(job)
+                self._finish(job)
+            return
+
+        self.task_mgr.setupTaskChain(self.TASK_CHAIN, numThreads=self._max_workers, frameSync=False)
+        for job in self._jobs:
+            self._pending.append(job)
+            self.task_mgr.add(self._job_task, f"env_load_{job.name}", extraArgs=[job],
+                              taskChain=self.TASK_CHAIN)
+        print(f"[Environment] Loading {len(self._jobs)} environment(s) in background (workers={self._max_workers})")
+
+    def poll(self) -> bool:
+        """完了したジョブを render に付け替える（メインスレッドから呼ぶ）。全て終わっていれば True"""
+        if self._pending:
+            finished = [j for j in self._pending if j.done]
+            for job in finished:
+                self._pending.remove(job)
+                self._finish(job)
+        return self._ready
+
+    def shutdown(self):
+        """まだ始まっていない読み込みを取り消す（実行中のものは終わるまで待たない）"""
+        for job in self._pending:
+            self.task_mgr.remove(f"env_load_{job.name}")
+        self._pending = []
+
+    def _job_task(self, job: _Job):
+        # ローダーのタスクチェーン（Panda3D のスレッド）で 1 回だけ実行される
+        self._run(job)
+        return None
+
+    def _run(self, job: _Job):
+        t0 = time.monotonic()
+        try:
+            # render に繋がっていない仮の親の下で作る（描画中のシーングラフには触れない）
+            staging = NodePath(f"staging_{job.name}")
+            job.env = EnvironmentEntity(render=staging, loader=self.loader, **job.kwargs)
+        except Exception as e:
+            job.error = e
+        job.elapsed = time.monotonic() - t0
+        job.done = True
+
+    def _finish(self, job: _Job):
+        env = job.env
+        if env is None:
+            self.failed.append(job.name)
+            status = f"Failed to load {job.name}: {job.error}"
+        else:
+            env.np.reparentTo(self.render)
+            self.envs.append(env)
+            status = f"Loaded {job.name}"
+        with self._lock:
+            self._done += 1
+            done = self._done
+        print(f"[Environment] {done}/{len(self._jobs)} {status} ({job.elapsed:.2f}s)")
+        if env is not None and self.on_loaded is not None:
+            self.on_loaded(env)
+        if done == len(self._jobs):
+            self._ready = True
+            print(f"[Environment] All environments ready in {time.monotonic() - self._t0:.2f}s"
+                  + (f" (failed: {', '.join(self.failed)})" if self.failed else ""))
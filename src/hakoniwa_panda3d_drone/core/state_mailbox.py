@@ -0,0 +1,65 @@
+import time
+import threading
+from typing import Any, Dict, Tuple
+from panda3d.core import Vec3
+
+
+class DronePose:
+    """ドローン1機分の表示用姿勢（Panda3D座標系）。posted は書き込んだ時刻（time.monotonic）"""
+    __slots__ = ("pos", "hpr", "rotor_speed", "sim_time_usec", "posted")
+
+    def __init__(self, pos: Vec3, hpr: Vec3, rotor_speed: float, sim_time_usec: int = 0, posted: float = 0.0):
+        self.pos = pos
+        self.hpr = hpr
+        self.rotor_speed = rotor_speed
+        self.sim_time_usec = sim_time_usec
+        self.posted = posted
+
+
+class DroneStateMailbox:
+    """
+    ドローンごとの「最新状態」だけを保持するメールボックス。
+    env_control_loop（asyncio スレッド）が put_* で上書きし、
+    Panda3D の UI タスクが 1 フレームに 1 回 take() でまとめて取り出す。
+    未適用のまま上書きされたサンプルは破棄（dropped）として数える。
+    これにより表示遅延はドローン数や描画速度によらず最大 1 フレームになる。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._poses: Dict[str, DronePose] = {}
+        self._game_ctrls: Dict[str, Any] = {}
+        # 統計
+        self.posted = 0
+        self.dropped = 0
+        self.applied = 0
+
+    def put_pose(self, drone_name: str, pos: Vec3, hpr: Vec3, rotor_speed: float, sim_time_usec: int = 0):
+        with self._lock:
+            if drone_name in self._poses:
+                self.dropped += 1
+            self._poses[drone_name] = DronePose(pos, hpr, rotor_speed, sim_time_usec, time.monotonic())
+            self.posted += 1
+
+    def put_game_controller(self, drone_name: str, game_ctrl: Any):
+        with self._lock:
+            self._game_ctrls[drone_name] = game_ctrl
+
+    def take(self) -> Tuple[Dict[str, DronePose], Dict[str, Any]]:
+        """溜まっている最新状態をすべて取り出し、メールボックスを空にする"""
+        with self._lock:
+            poses, self._poses = self._poses, {}
+            ctrls, self._game_ctrls = self._game_ctrls, {}
+        return poses, ctrls
+
+    def mark_applied(self, count: int):
+        with self._lock:
+            self.applied += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "posted": self.posted,
+                "dropped": self.dropped,
+                "applied": self.applied,
+                "pending": len(self._poses),
+            }
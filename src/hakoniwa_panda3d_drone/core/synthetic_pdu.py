@@ -0,0 +1,133 @@
+"""
+箱庭なしで hako_asset を動かすための合成 PDU（ShmPduServiceServerManager の代わり）。
+
+env_control_loop が使う run_nowait() / read_pdu_raw_data() だけを持ち、tick ごとに全ドローンの
+姿勢（Twist）・アクチュエータ（HakoHilActuatorControls）・ゲームコントローラの PDU を作る。
+PDU は本物と同じバイナリ形式（汎用コンバータで作った雛形に pdu_codec.encode_*_into で値を書く）なので、
+デコード経路も含めて実機と同じ処理を通る。
+
+  trajectory : "circle"（円周） / "figure8"（8 の字） / "hover"（その場で上下）
+  ドローンは grid 状に並べ、位相をずらして動かす。
+"""
+import math
+from typing import Dict, List, Optional
+import numpy as np
+from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_pytype_Twist import Twist
+from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_conv_Twist import py_to_pdu_Twist
+from hakoniwa_pdu.pdu_msgs.hako_mavlink_msgs.pdu_pytype_HakoHilActuatorControls import HakoHilActuatorControls
+from hakoniwa_pdu.pdu_msgs.hako_mavlink_msgs.pdu_conv_HakoHilActuatorControls import py_to_pdu_HakoHilActuatorControls
+from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
+from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_conv_GameControllerOperation import py_to_pdu_GameControllerOperation
+from hakoniwa_panda3d_drone.pdu_codec import (
+    encode_twist_into, encode_actuator_control0_into, encode_camera_pitch_buttons_into,
+)
+
+TRAJECTORIES = ("circle", "figure8", "hover")
+
+
+def _twist_template() -> bytearray:
+    return py_to_pdu_Twist(Twist())
+
+
+def _actuator_template() -> bytearray:
+    act = HakoHilActuatorControls()
+    act.controls = [0.0] * 16
+    return py_to_pdu_HakoHilActuatorControls(act)
+
+
+def _game_ctrl_template() -> bytearray:
+    game = GameControllerOperation()
+    game.axis = [0.0] * 6
+    game.button = [False] * 15
+    return py_to_pdu_GameControllerOperation(game)
+
+
+class SyntheticPduManager:
+    """
+    合成 PDU を返す PDU マネージャ。1 回の run_nowait() でシミュレーション時刻が delta_time_usec 進む。
+    read_pdu_raw_data() が返すバッファは次の run_nowait() で上書きされる（本物と同じく同じ tick 内で読む前提）。
+    """
+    def __init__(self, drone_names: List[str], delta_time_usec: int, trajectory: str = "circle",
+                 radius: float = 5.0, altitude: float = 3.0, period_sec: float = 10.0,
+                 spacing: float = 4.0, rotor_control: float = 0.6, game_ctrl_period_sec: float = 4.0):
+        if trajectory not in TRAJECTORIES:
+            raise ValueError(f"unknown trajectory: {trajectory} (expected one of {TRAJECTORIES})")
+        self.drone_names = list(drone_names)
+        self.delta_time_usec = delta_time_usec
+        self.trajectory = trajectory
+        self.radius = radius
+        self.altitude = altitude
+        self.omega = 2.0 * math.pi / period_sec
+        self.rotor_control = rotor_control
+        self.game_ctrl_period_sec = game_ctrl_period_sec
+        self.step = 0
+        self.reads = 0
+
+        n = len(self.drone_names)
+        cols = max(1, math.ceil(math.sqrt(n)))
+        pitch = 2.0 * radius + spacing
+        idx = np.arange(n)
+        # ROS 座標系（+X 前, +Y 左）で grid に並べる
+        self._center = np.stack([(idx % cols) * pitch, (idx // cols) * pitch], axis=1).astype(np.float64)
+        self._phase = idx * (2.0 * math.pi / max(n, 1))
+
+        self._pdus: Dict[str, Dict[str, bytearray]] = {
+            name: {"pos": _twist_template(), "motor": _actuator_template(), "hako_cmd_game": _game_ctrl_template()}
+            for name in self.drone_names
+        }
+
+    @property
+    def sim_time_usec(self) -> int:
+        return self.step * self.delta_time_usec
+
+    # --- ShmPduServiceServerManager と同じ呼び出し ---
+    def initialize_services(self, *args, **kwargs):
+        return True
+
+    def run_nowait(self):
+        """1 tick 進めて全ドローンの PDU を書き換える"""
+        self.step += 1
+        twists, controls = self.sample(self.sim_time_usec / 1e6)
+        t = self.sim_time_usec / 1e6
+        phase = (t / self.game_ctrl_period_sec) % 1.0 if self.game_ctrl_period_sec > 0 else 0.5
+        up, down = phase < 0.25, 0.5 <= phase < 0.75
+        for i, name in enumerate(self.drone_names):
+            pdus = self._pdus[name]
+            encode_twist_into(pdus["pos"], twists[i])
+            encode_actuator_control0_into(pdus["motor"], controls[i])
+            encode_camera_pitch_buttons_into(pdus["hako_cmd_game"], up, down)
+
+    def read_pdu_raw_data(self, robot_name: str, pdu_name: str) -> Optional[bytearray]:
+        pdus = self._pdus.get(robot_name)
+        if pdus is None:
+            return None
+        self.reads += 1
+        return pdus.get(pdu_name)
+
+    # --- 軌道 ---
+    def sample(self, t: float):
+        """時刻 t[sec] の全ドローンの Twist 値 (N,6)（ROS 座標系）と controls[0] (N,)"""
+        a = self.omega * t + self._phase
+        r = self.radius
+        n = len(self.drone_names)
+        if self.trajectory == "circle":
+            dx, dy = r * np.cos(a), r * np.sin(a)
+            vx, vy = -np.sin(a), np.cos(a)
+            z = np.full(n, self.altitude)
+        elif self.trajectory == "figure8":
+            dx, dy = r * np.sin(a), r * np.sin(a) * np.cos(a)
+            vx, vy = np.cos(a), np.cos(2.0 * a)
+            z = np.full(n, self.altitude)
+        else:
+            dx = dy = np.zeros(n)
+            vx, vy = np.ones(n), np.zeros(n)
+            z = self.altitude + 0.5 * np.sin(a)
+        yaw = np.arctan2(vy, vx)
+        # 進行方向へ少し前傾させる
+        pitch = np.full(n, 0.1 if self.trajectory != "hover" else 0.0)
+        twists = np.stack([
+            self._center[:, 0] + dx, self._center[:, 1] + dy, z,
+            np.zeros(n), pitch, yaw,
+        ], axis=1)
+        controls = np.clip(self.rotor_control + 0.1 * np.sin(a * 3.0), 0.0, 1.0)
+        return twists.tolist(), controls.tolist()
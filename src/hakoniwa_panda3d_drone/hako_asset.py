@@ -5,9 +5,11 @@ import threading
 from queue import SimpleQueue
 import sys
 import json
+import struct
+import numpy as np
+from panda3d.core import Vec3
 sys.stdout.reconfigure(line_buffering=True)
 
-import hakopy
 from hakoniwa_pdu.pdu_manager import PduManager
 from hakoniwa_pdu.impl.shm_communication_service import ShmCommunicationService
 from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_conv_Twist import pdu_to_py_Twist
@@ -25,26 +27,22 @@ from hakoniwa_pdu.rpc.protocol_server import ProtocolServerImmediate
 
 from hakoniwa_panda3d_drone.visualizer import App
 from hakoniwa_panda3d_drone.primitive.frame import Frame
+from hakoniwa_panda3d_drone.core.state_mailbox import DroneStateMailbox
+from hakoniwa_panda3d_drone.core.pose_history import PoseHistory
+from hakoniwa_panda3d_drone.core.pose_interpolator import PoseInterpolator
+from hakoniwa_panda3d_drone.core.image_encoder import ImageEncoder, parse_image_type
+from hakoniwa_panda3d_drone.core.metrics import get_metrics
+from hakoniwa_panda3d_drone.core.pose_log import PoseLogWriter
+from hakoniwa_panda3d_drone.core.capture_batch import (
+    CaptureEntry, parse_capture_spec, parse_batch_request, pack_batch_response, batch_response_size,
+)
+from hakoniwa_panda3d_drone.pdu_codec import (
+    install_fast_response_encoder, decode_twist, decode_actuator_control0, decode_camera_pitch_buttons,
+)
+from hakoniwa_panda3d_drone.hako_status import HakoniwaStatusWatcher
+from hakoniwa_panda3d_drone.tick_scheduler import TickScheduler
 
 
-def is_hakoniwa_running() -> bool:
-    import subprocess
-    result = subprocess.run(
-        ["hako-cmd", "status"],
-        capture_output=True,
-        text=True
-    )
-
-    output = result.stdout.strip()
-    print(output)
-
-    if "status=running" in output:
-        print("✅ Hakoniwa is running!")
-        return True
-    else:
-        print("❌ Hakoniwa is NOT running.")
-        return False
-
 # === globals ===
 delta_time_usec = 0
 drone_config_path = ''
@@ -55,22 +53,58 @@ visualizer_runner: App = None
 server_pdu_manager: ShmPduServiceServerManager = None
 protocol_server: ProtocolServerImmediate = None
 rpc_service_is_ready = False
+# RPC サービスごとの同時接続クライアント数（launcher_config/service.json の maxClients と合わせる）
+RPC_MAX_CLIENTS = 4
+CAPTURE_TIMEOUT_SEC = 5.0
+# サービス名 -> 応答 PDU の可変長データ領域[byte]（service.json の client.heapSize。rpc_server_task で読む）
+response_heap_sizes: dict = {}
 
-# Panda3D スレッドへ渡す更新/命令
+# Panda3D スレッドへ渡す命令（キャプチャ要求など）
 ui_queue: SimpleQueue = SimpleQueue()
+# ドローンごとの最新状態（姿勢・ローター速度・ゲームコントローラ）
+state_mailbox = DroneStateMailbox()
+# ドローンごとの姿勢履歴（時刻指定キャプチャ用。20ms 周期で約 10 秒分）
+pose_history = PoseHistory(capacity=512)
+# 描画フレームごとの姿勢補間（設定は main で drone config の pose_interpolation から読む）
+pose_interpolator = PoseInterpolator()
+# キャプチャ画像のエンコード用ワーカー（Panda3D スレッドでは読み戻しのみ行う）
+image_encoder = ImageEncoder()
+# 箱庭の実行状態（env_control_loop と rpc_server_task が共有する）
+hako_status = HakoniwaStatusWatcher()
+# env_control_loop の周期実行（main で drone config の scheduler から作る）
+tick_scheduler: TickScheduler = None
 # asyncio ループ参照（別スレッド）
 async_loop_holder = {"loop": None}
+# 処理段ごとの計測（drone config の metrics で有効化。App が設定する）
+metrics = get_metrics()
+# 姿勢ストリームの記録（setup で drone config の recording から作る。env_control_loop だけが書く）
+pose_recorder: PoseLogWriter = None
+
+# ========== PDU デコード（高速版、失敗したら汎用コンバータ） ==========
+def read_twist(raw_pose) -> tuple:
+    """(linear.x, linear.y, linear.z, angular.x, angular.y, angular.z)"""
+    try:
+        return decode_twist(raw_pose)
+    except (ValueError, struct.error):
+        t = pdu_to_py_Twist(raw_pose)
+        return (t.linear.x, t.linear.y, t.linear.z, t.angular.x, t.angular.y, t.angular.z)
 
-# ========== 非同期 sleep ==========
-async def my_sleep_async():
-    global delta_time_usec
-    # hakopy.usleep はブロッキングなので別スレッドで実行
-    ok = await asyncio.to_thread(hakopy.usleep, delta_time_usec)
-    if not ok:
-        return False
-    # シミュレータクロック分だけ await
-    await asyncio.sleep(delta_time_usec / 1_000_000.0)
-    return True
+def read_rotor_speed(raw_actuator) -> float:
+    try:
+        control0 = decode_actuator_control0(raw_actuator)
+    except (ValueError, struct.error):
+        actuator = pdu_to_py_HakoHilActuatorControls(raw_actuator)
+        if len(actuator.controls) < 4:
+            return 0.0
+        control0 = actuator.controls[0]
+    return control0 * 400.0
+
+def read_camera_pitch_buttons(raw_game_ctrl) -> tuple:
+    try:
+        return decode_camera_pitch_buttons(raw_game_ctrl)
+    except (ValueError, struct.error):
+        game_ctrl = pdu_to_py_GameControllerOperation(raw_game_ctrl)
+        return game_ctrl.button[11], game_ctrl.button[12]
 
 # ========== 環境制御ループ ==========
 async def env_control_loop(stop_event: asyncio.Event):
@@ -79,86 +113,239 @@ async def env_control_loop(stop_event: asyncio.Event):
 
     drone_config_dict = json.load(open(drone_config_path, 'r'))
     print(f"[Visualizer] Loaded drone config: {drone_config_path}")
+    drone_names = [drone.get('name', 'Drone') for drone in drone_config_dict['drones']]
 
-    while not is_hakoniwa_running():
-        print("[Visualizer] Waiting for Hakoniwa to start...")
-        await asyncio.sleep(1.0)
+    print("[Visualizer] Waiting for Hakoniwa to start...")
+    if not await hako_status.wait_running():
+        return
 
     while not rpc_service_is_ready:
         print("[Visualizer] Waiting for RPC service to be ready...")
         await asyncio.sleep(1.0)
 
     print("[Visualizer] RPC service is ready. Starting environment control loop.")
+    tick_scheduler.start(stop_event)
     while not stop_event.is_set():
         sys.stdout.flush()
-        if not await my_sleep_async():
+        sim_time_usec = await tick_scheduler.next_tick()
+        if sim_time_usec is None:
             break
 
-        server_pdu_manager.run_nowait()
+        tick_t0 = metrics.start()
 
-        for drone in drone_config_dict['drones']:
-            drone_name = drone.get('name', 'Drone')
- 
+        # 全ドローンの PDU を読んでから、デコードと座標変換をまとめて行う
+        t0 = metrics.start()
+        server_pdu_manager.run_nowait()
+        raws = []
+        for drone_name in drone_names:
             raw_pose = server_pdu_manager.read_pdu_raw_data(drone_name, 'pos')
-            pose = pdu_to_py_Twist(raw_pose) if raw_pose else None
-            if pose is None:
+            if not raw_pose:
                 print("[Visualizer] Warning: No pose PDU data: drone=", drone_name)
                 continue
 
-            rotor_speed = 0.0
             raw_actuator = server_pdu_manager.read_pdu_raw_data(drone_name, 'motor')
-            if raw_actuator:
-                actuator = pdu_to_py_HakoHilActuatorControls(raw_actuator)
-                if len(actuator.controls) >= 4:
-                    rotor_speed = actuator.controls[0] * 400.0
-            else:
+            if not raw_actuator:
                 print("[Visualizer] Warning: No actuator PDU data")
-            panda3d_pos, panda3d_orientation = Frame.to_panda3d(pose)
-            ui_queue.put(("pose", (drone_name, panda3d_pos, panda3d_orientation, rotor_speed)))
-
             try:
                 raw_game_ctrl = server_pdu_manager.read_pdu_raw_data(drone_name, 'hako_cmd_game')
-                game_ctrl = pdu_to_py_GameControllerOperation(raw_game_ctrl) if raw_game_ctrl else None
-                if game_ctrl is not None:
-                    # UI スレッドへ命令を投げる
-                    ui_queue.put(("game_controller", (drone_name, game_ctrl)))
             except Exception as e:
                 #print("[Visualizer] Warning: Exception reading game_controller robot_name:", drone_name)
                 #print(f"[Visualizer] Warning reading game controller PDU: {e}")
-                pass
-
+                raw_game_ctrl = None
+            raws.append((drone_name, raw_pose, raw_actuator, raw_game_ctrl))
+        metrics.observe("pdu_read", t0)
+
+        t0 = metrics.start()
+        names, twists, rotor_speeds, buttons = [], [], [], {}
+        for drone_name, raw_pose, raw_actuator, raw_game_ctrl in raws:
+            names.append(drone_name)
+            twists.append(read_twist(raw_pose))
+            rotor_speeds.append(read_rotor_speed(raw_actuator) if raw_actuator else 0.0)
+            if raw_game_ctrl:
+                try:
+                    # UI スレッドへ最新状態（カメラ上下ボタン）として渡す
+                    buttons[drone_name] = read_camera_pitch_buttons(raw_game_ctrl)
+                    state_mailbox.put_game_controller(drone_name, buttons[drone_name])
+                except Exception:
+                    pass
+
+        if names:
+            positions, hprs = Frame.to_panda3d_array(twists)
+            for i, drone_name in enumerate(names):
+                pos, hpr = Vec3(*positions[i]), Vec3(*hprs[i])
+                state_mailbox.put_pose(drone_name, pos, hpr, rotor_speeds[i], sim_time_usec)
+                pose_history.record(drone_name, pos, hpr, rotor_speeds[i], sim_time_usec)
+        metrics.observe("pdu_decode", t0)
+        if pose_recorder is not None and names:
+            with metrics.span("pose_record"):
+                pose_recorder.write(sim_time_usec, names, positions, hprs, rotor_speeds, buttons)
+        metrics.observe("tick", tick_t0)
+
+    if pose_recorder is not None:
+        pose_recorder.close()
+        print(f"[Recorder] Closed {pose_recorder.path}: {pose_recorder.stats()}")
     print("[Visualizer] Environment Control loop finished")
 
 # ========== RPC: カメラキャプチャ ==========
-async def handle_camera_capture(req: CameraCaptureImageRequest) -> CameraCaptureImageResponse:
+async def request_capture(entries: list) -> tuple:
     """
-    非同期ループ側で受けた RPC を Panda3D スレッドに依頼し、結果を await で待つ。
+    Panda3D スレッドにキャプチャを依頼し、entries と同じ順の (sim_time_usec, フレーム) のリストを待つ。
+    同じフレームに届いた同じ時刻の要求は、UI 側でまとめて 1 回の描画で処理される。
     """
     loop = async_loop_holder["loop"]
     fut: asyncio.Future = loop.create_future()
 
-    # UI スレッドへ要求を投げる（UI 側で画像バイト列を作ってくれる想定）
+    # UI スレッドへ要求を投げる（UI 側は描画と読み戻しだけを行い、生画像を返す）
     ui_queue.put(("capture_request", {
-        "drone_name": req.drone_name,
-        "image_type": req.image_type,
+        "entries": entries,
         "future": fut,  # UI 側が loop.call_soon_threadsafe で set_result する
     }))
+    return await asyncio.wait_for(fut, timeout=CAPTURE_TIMEOUT_SEC)
+
+def load_response_heap_sizes(path: str) -> dict:
+    """service.json から、サービスごとの応答 PDU の heap サイズを読む"""
+    with open(path, 'r') as f:
+        service_config = json.load(f)
+    return {svc['name']: svc['pduSize']['client']['heapSize'] for svc in service_config.get('services', [])}
+
+def oversize_message(service_name: str, size: int) -> str:
+    """応答データが PDU の heap に収まらなければ RPC に返すメッセージ、収まれば空文字"""
+    heap_size = response_heap_sizes.get(service_name)
+    if heap_size is None or size <= heap_size:
+        return ""
+    return f"Response too large: {size} bytes exceeds the {heap_size}-byte heap of {service_name}"
+
+def scene_not_ready_message() -> str:
+    """シーン（ドローン・環境）の準備ができていなければ RPC に返すメッセージ、できていれば空文字"""
+    runner = visualizer_runner
+    if runner is None:
+        return "Not ready: visualizer is starting"
+    if not runner.scene_ready:
+        return f"Not ready: {runner.scene_status()}"
+    return ""
 
+async def handle_camera_capture(req: CameraCaptureImageRequest) -> CameraCaptureImageResponse:
+    """
+    非同期ループ側で受けた RPC を Panda3D スレッドに依頼し、結果を await で待つ。
+    image_type には "<形式>@<幅>x<高さ>#<時刻>" で解像度（既定 1280x720）と
+    シミュレーション時刻[usec]（既定 latest）も指定できる。
+    """
+    t0 = metrics.start()
+    not_ready = scene_not_ready_message()
+    if not_ready:
+        res = CameraCaptureImageResponse()
+        res.ok = False
+        res.data = b""
+        res.message = not_ready
+        return res
     try:
-        image_bytes: bytes = await asyncio.wait_for(fut, timeout=5.0)  # 必要なら延長
+        image_type, w, h, when = parse_capture_spec(req.image_type)
+        results = await request_capture([CaptureEntry(req.drone_name, None, image_type, w, h, when)])
+        sim_time_usec, frame = results[0]
+        if isinstance(frame, Exception):
+            raise frame
+        # エンコードはワーカースレッドで行う
+        image_format, _ = parse_image_type(image_type)
+        image_bytes: bytes = await asyncio.wrap_future(image_encoder.submit(frame, image_type))
+        too_large = oversize_message("DroneService/CameraCaptureImage", len(image_bytes))
+        if too_large:
+            res = CameraCaptureImageResponse()
+            res.ok = False
+            res.data = b""
+            res.message = too_large
+            metrics.inc("rpc_capture_errors")
+            return res
         # レスポンス生成
         print(f"[RPC] Captured image for drone '{req.drone_name}', type='{req.image_type}', size={len(image_bytes)} bytes")
         res = CameraCaptureImageResponse()
         res.ok = True
-        res.data = list(image_bytes)
-        res.message = f"Captured type={req.image_type} from {req.drone_name} len={len(res.data)}"
+        # bytes のまま渡す（要素ごとの int リストにしない。エンコードは pdu_codec が一括コピー）
+        res.data = image_bytes
+        # raw_rgb / depth はヘッダを持たないため、解像度を message で返す
+        res.message = (f"Captured type={image_format} from {req.drone_name} len={len(res.data)} "
+                       f"width={frame.width} height={frame.height} sim_time_usec={sim_time_usec}")
+        metrics.observe("rpc_capture", t0)
+        return res
+    except ValueError as e:
+        res = CameraCaptureImageResponse()
+        res.ok = False
+        res.data = b""
+        res.message = f"Invalid request: {e}"
+        metrics.inc("rpc_capture_errors")
         return res
     except asyncio.TimeoutError:
         res = CameraCaptureImageResponse()
         res.ok = False
-        res.data = []
+        res.data = b""
+        res.message = "Capture timeout"
+        metrics.inc("rpc_capture_errors")
+        return res
+    except Exception as e:
+        # 存在しないドローン名・エンコード失敗など
+        res = CameraCaptureImageResponse()
+        res.ok = False
+        res.data = b""
+        res.message = f"Capture failed: {e}"
+        metrics.inc("rpc_capture_errors")
+        return res
+
+async def handle_camera_capture_batch(req: CameraCaptureImageRequest) -> CameraCaptureImageResponse:
+    """
+    複数ドローン・カメラの一括キャプチャ（要求・応答の形式は core/capture_batch.py を参照）。
+    全画像を 1 回の描画で取得し、同じシミュレーション時刻を付けて返す。
+    """
+    t0 = metrics.start()
+    res = CameraCaptureImageResponse()
+    res.data = b""
+    not_ready = scene_not_ready_message()
+    if not_ready:
+        res.ok = False
+        res.message = not_ready
+        return res
+    try:
+        entries = parse_batch_request(req.drone_name, req.image_type, list(visualizer_runner.drone_cam.keys()))
+        captured = await request_capture(entries)
+    except ValueError as e:
+        res.ok = False
+        res.message = f"Invalid batch request: {e}"
+        metrics.inc("rpc_capture_errors")
+        return res
+    except asyncio.TimeoutError:
+        res.ok = False
         res.message = "Capture timeout"
+        metrics.inc("rpc_capture_errors")
+        return res
+    except Exception as e:
+        res.ok = False
+        res.message = f"Batch capture failed: {e}"
+        metrics.inc("rpc_capture_errors")
+        return res
+
+    async def encode(entry: CaptureEntry, sim_time_usec: int, frame):
+        if isinstance(frame, Exception):
+            print(f"[RPC] Batch capture failed for {entry}: {frame}")
+            return (False, entry.image_type, 0, 0, b"", sim_time_usec)
+        try:
+            data = await asyncio.wrap_future(image_encoder.submit(frame, entry.image_type))
+        except Exception as e:
+            print(f"[RPC] Batch encode failed for {entry}: {e}")
+            return (False, entry.image_type, 0, 0, b"", sim_time_usec)
+        return (True, entry.image_type, frame.width, frame.height, data, sim_time_usec)
+
+    results = await asyncio.gather(*(encode(e, t, f) for e, (t, f) in zip(entries, captured)))
+    too_large = oversize_message("DroneService/CameraCaptureImageBatch", batch_response_size(results))
+    if too_large:
+        res.ok = False
+        res.message = too_large
+        metrics.inc("rpc_capture_errors")
         return res
+    n_ok = sum(1 for r in results if r[0])
+    res.ok = n_ok > 0
+    res.data = pack_batch_response(results)
+    res.message = f"Captured {n_ok}/{len(results)} sim_time_usec={results[0][5]} len={len(res.data)}"
+    print(f"[RPC] Batch capture: {res.message}")
+    metrics.observe("rpc_capture_batch", t0)
+    return res
 
 async def rpc_server_task(stop_event: asyncio.Event):
     global server_pdu_manager, protocol_server, rpc_service_is_ready
@@ -167,17 +354,24 @@ async def rpc_server_task(stop_event: asyncio.Event):
     箱庭 RPC の起動・待受けを行うタスク。
     """
     print("[RPC] Starting RPC server...")
-    while not is_hakoniwa_running():
-        print("[RPC] Waiting for Hakoniwa to start...")
-        await asyncio.sleep(1.0)
+    print("[RPC] Waiting for Hakoniwa to start...")
+    if not await hako_status.wait_running():
+        return
 
     await asyncio.sleep(1.0)  # 少し待つ
+    response_heap_sizes.update(load_response_heap_sizes(service_config_path))
     services = [
         {
             "service_name": "DroneService/CameraCaptureImage",
             "srv": "CameraCaptureImage",
-            "max_clients": 1,
-        }
+            "max_clients": RPC_MAX_CLIENTS,
+        },
+        {
+            # 一括キャプチャ（PDU 型は CameraCaptureImage を流用）
+            "service_name": "DroneService/CameraCaptureImageBatch",
+            "srv": "CameraCaptureImage",
+            "max_clients": RPC_MAX_CLIENTS,
+        },
     ]
 
     protocol_server = make_protocol_servers(
@@ -186,6 +380,8 @@ async def rpc_server_task(stop_event: asyncio.Event):
         ProtocolServerClass=ProtocolServerImmediate,
         pkg="hakoniwa_pdu.pdu_msgs.drone_srv_msgs"
     )
+    install_fast_response_encoder(protocol_server, "DroneService/CameraCaptureImage")
+    install_fast_response_encoder(protocol_server, "DroneService/CameraCaptureImageBatch")
     protocol_server.start_services()
 
     print("[RPC] RPC server is running.")
@@ -195,8 +391,9 @@ async def rpc_server_task(stop_event: asyncio.Event):
     # serve() はハンドラマップを受け取って待受
     serve_task = asyncio.create_task(protocol_server.serve({
         "DroneService/CameraCaptureImage": handle_camera_capture,
+        "DroneService/CameraCaptureImageBatch": handle_camera_capture_batch,
     }))
-    print("[RPC] Service server started for DroneService/CameraCaptureImage")
+    print("[RPC] Service server started for DroneService/CameraCaptureImage, DroneService/CameraCaptureImageBatch")
 
 
     # 停止指示を待つ
@@ -216,50 +413,97 @@ def panda3d_ui_task(task):
     global visualizer_runner
     from direct.task.Task import cont
 
+    # 最新状態を 1 フレームに 1 回だけ取り出し（古いサンプルは mailbox 側で破棄済み）、
+    # 補間器を通して描画時刻の姿勢を毎フレーム適用する
+    if visualizer_runner is not None:
+        t0 = metrics.start()
+        now = time.monotonic()
+        poses, game_ctrls = state_mailbox.take()
+        for drone_name, pose in poses.items():
+            pose_interpolator.push(drone_name, pose, now)
+        state_mailbox.mark_applied(len(poses))
+        if metrics.enabled:
+            # env_control_loop が書き込んでから UI スレッドが取り出すまでの時間
+            for pose in poses.values():
+                metrics.observe_us("pose_age", (now - pose.posted) * 1e6)
+            metrics.set_gauge("poses_per_frame", len(poses))
+            metrics.set_gauge("ui_queue_depth", ui_queue.qsize())
+
+        # rotor_speed は 1 サンプル（delta_time_usec）あたりの回転角[deg] なので deg/s に直して渡す
+        rotor_scale = 1e6 / delta_time_usec if delta_time_usec > 0 else 1.0
+        shown = pose_interpolator.evaluate(now)
+        if shown:
+            poses_now = list(shown.values())
+            visualizer_runner.apply_poses(
+                list(shown.keys()),
+                np.array([p.pos for p in poses_now]),
+                np.array([p.hpr for p in poses_now]),
+                np.array([p.rotor_speed for p in poses_now]) * rotor_scale,
+            )
+            visualizer_runner.sim_time_usec = max(visualizer_runner.sim_time_usec, max(p.sim_time_usec for p in poses_now))
+            if metrics.enabled:
+                # 最新サンプルと表示中の姿勢の時刻差（補間による遅れ）を実時間に直したもの。
+                # sim モードの speed は設定値（既定 1.0）なので、実際の倍速とずれる分は近似になる
+                speed = tick_scheduler.speed if tick_scheduler is not None else 1.0
+                newest = pose_interpolator.newest_sim_time_usec()
+                for drone_name, pose in shown.items():
+                    metrics.observe_us("display_lag", (newest[drone_name] - pose.sim_time_usec) / speed)
+        for drone_name, (up, down) in game_ctrls.items():
+            visualizer_runner.update_camera_pitch(drone_name, up, down)
+        metrics.observe("scene_update", t0)
+
     MAX_APPLY = 8
     n = 0
+    captures = []
     while n < MAX_APPLY:
         try:
             kind, payload = ui_queue.get_nowait()
         except Exception:
             break
 
-        if kind == "pose" and visualizer_runner is not None:
-            drone_name, pos, orient, rotor_speed = payload
-            visualizer_runner.set_pose_and_rotation(drone_name, pos, orient, rotor_speed)
-        elif kind == "game_controller" and visualizer_runner is not None:
-            drone_name, game_ctrl = payload
-            visualizer_runner.update_game_controller_ui(drone_name, game_ctrl)
-        elif kind == "capture_request":
-            # payload: {drone_name, image_type, future}
-            drone_name = payload["drone_name"]
-            image_type = payload["image_type"]
-            fut: asyncio.Future = payload["future"]
-            try:
-                image_bytes = visualizer_runner.capture_camera(image_type=image_type, drone_name=drone_name)
-                loop = async_loop_holder["loop"]
-                if loop is not None and not fut.done():
-                    loop.call_soon_threadsafe(fut.set_result, image_bytes)
-            except Exception as e:
-                loop = async_loop_holder["loop"]
-                if loop is not None and not fut.done():
-                    loop.call_soon_threadsafe(fut.set_exception, e)
+        if kind == "capture_request":
+            # payload: {entries, future}。このフレームの要求はまとめて描画する
+            captures.append(payload)
 
         n += 1
 
+    if captures:
+        _serve_capture_requests(captures)
+
     return cont
 
+def _serve_capture_requests(captures: list):
+    """複数のキャプチャ要求をまとめて描画し（時刻ごとに 1 回）、それぞれの future に結果を返す"""
+    loop = async_loop_holder["loop"]
+    entries = [e for payload in captures for e in payload["entries"]]
+    try:
+        frames = visualizer_runner.capture_camera_frames(entries, pose_history)
+    except Exception as e:
+        for payload in captures:
+            fut: asyncio.Future = payload["future"]
+            if loop is not None and not fut.done():
+                loop.call_soon_threadsafe(fut.set_exception, e)
+        return
+
+    i = 0
+    for payload in captures:
+        n = len(payload["entries"])
+        fut: asyncio.Future = payload["future"]
+        if loop is not None and not fut.done():
+            loop.call_soon_threadsafe(fut.set_result, frames[i:i + n])
+        i += n
+
 # ========== 非同期ランタイム起動（別スレッド） ==========
-def start_asyncio_runtime(loop_holder: dict, stop_event: asyncio.Event):
+def start_asyncio_runtime(loop_holder: dict, stop_event: asyncio.Event, coroutines=None):
+    """coroutines は stop_event を受け取るコルーチン関数のリスト（既定は状態監視・環境制御・RPC）"""
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     loop_holder["loop"] = loop
 
-    # 並列に環境制御と RPC を起動
-    tasks = [
-        loop.create_task(env_control_loop(stop_event)),
-        loop.create_task(rpc_server_task(stop_event)),
-    ]
+    # 並列に箱庭の状態監視・環境制御・RPC を起動
+    if coroutines is None:
+        coroutines = [hako_status.run, env_control_loop, rpc_server_task]
+    tasks = [loop.create_task(coro(stop_event)) for coro in coroutines]
 
     try:
         loop.run_until_complete(asyncio.gather(*tasks))
@@ -267,22 +511,50 @@ def start_asyncio_runtime(loop_holder: dict, stop_event: asyncio.Event):
         loop.stop()
         loop.close()
 
+# ========== 設定 ==========
+def setup(drone_config_path_: str, delta_time_msec: int) -> dict:
+    """drone config を読み、周期・姿勢補間・tick スケジューラ・記録を設定する（main とベンチマークで共用）"""
+    global delta_time_usec, drone_config_path, pose_interpolator, tick_scheduler, pose_recorder
+    drone_config_path = drone_config_path_
+    delta_time_usec = int(delta_time_msec) * 1000
+
+    with open(drone_config_path, 'r') as f:
+        drone_config = json.load(f)
+    interp_cfg = drone_config.get('pose_interpolation', {})
+    pose_interpolator = PoseInterpolator(
+        enabled=interp_cfg.get('enabled', True),
+        extrapolate=interp_cfg.get('extrapolate', False),
+        max_extrapolation_sec=interp_cfg.get('max_extrapolation_sec', 0.1),
+    )
+    sched_cfg = drone_config.get('scheduler', {})
+    tick_scheduler = TickScheduler(delta_time_usec, mode=sched_cfg.get('mode', 'sim'),
+                                   speed=sched_cfg.get('speed', 1.0))
+    rec_cfg = drone_config.get('recording', {})
+    if rec_cfg.get('enabled', False) and rec_cfg.get('path'):
+        path = time.strftime(rec_cfg['path'])
+        drone_names = [drone.get('name', 'Drone') for drone in drone_config['drones']]
+        pose_recorder = PoseLogWriter(path, drone_names, delta_time_usec, rec_cfg.get('flush_interval_sec', 1.0))
+        print(f"[Recorder] Recording poses of {len(drone_names)} drone(s) to {path}")
+    return drone_config
+
 # ========== エントリポイント ==========
 def main():
-    global delta_time_usec, drone_config_path
     global service_config_path, pdu_config_path, pdu_offset_path
     global visualizer_runner
     global server_pdu_manager, protocol_server
+    import hakopy
 
-    if len(sys.argv) != 6:
-        print(f"Usage: {sys.argv[0]} <drone_config_path> <delta_time_msec> <service.json> <pdu_config.json> <pdu_offset_dir>")
+    # --headless はどの位置に置いてもよい（残りは従来どおり 5 個の位置引数）
+    headless = "--headless" in sys.argv[1:]
+    args = [a for a in sys.argv[1:] if a != "--headless"]
+    if len(args) != 5:
+        print(f"Usage: {sys.argv[0]} [--headless] <drone_config_path> <delta_time_msec> <service.json> <pdu_config.json> <pdu_offset_dir>")
         return 1
 
-    drone_config_path  = sys.argv[1]
-    delta_time_usec    = int(sys.argv[2]) * 1000
-    service_config_path = sys.argv[3]
-    pdu_config_path     = sys.argv[4]
-    pdu_offset_path     = sys.argv[5]
+    service_config_path = args[2]
+    pdu_config_path     = args[3]
+    pdu_offset_path     = args[4]
+    setup(args[0], int(args[1]))
 
     asset_name = 'Visualizer'
     print(f"[Visualizer] Registering asset '{asset_name}'")
@@ -305,7 +577,7 @@ def main():
     t_async.start()
 
     # Panda3D（メインスレッド）
-    visualizer_runner = App(drone_config_path)
+    visualizer_runner = App(drone_config_path, headless=headless)
     visualizer_runner.taskMgr.add(panda3d_ui_task, "ApplyUIUpdates")
     try:
         visualizer_runner.run()
@@ -316,6 +588,10 @@ def main():
         t_async.join(timeout=3.0)
         if t_async.is_alive():
             print("Warning: asyncio loop thread still alive.")
+        image_encoder.shutdown()
+        visualizer_runner.close()
+        print(f"[Visualizer] Pose updates: {state_mailbox.stats()}")
+        print(f"[Visualizer] Ticks: {tick_scheduler.stats()}")
 
     return 0
 
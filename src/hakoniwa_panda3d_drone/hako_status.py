@@ -0,0 +1,90 @@
+"""
+箱庭（コンダクタ）の実行状態の監視。
+hakopy から状態を直接読めればそれを使い、読めない環境では hako-cmd status を
+asyncio のサブプロセスとして実行する（イベントループを止めない）。
+1 つの監視タスクが状態の変化を待っている全タスクへ通知する。
+"""
+import asyncio
+from typing import Optional
+
+# hakoniwa-core の HakoSimulationStateType
+HAKO_STATE_RUNNING = 2
+
+
+def _read_state_via_hakopy() -> Optional[int]:
+    """hakopy.state() で状態を読む。API がない・失敗した場合は None"""
+    try:
+        import hakopy
+        fn = getattr(hakopy, "state", None)
+        return None if fn is None else int(fn())
+    except Exception:
+        return None
+
+
+async def _probe_via_hako_cmd() -> bool:
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "hako-cmd", "status",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError as e:
+        print(f"[HakoStatus] Warning: cannot run hako-cmd: {e}")
+        return False
+    out, _ = await proc.communicate()
+    return "status=running" in out.decode(errors="replace")
+
+
+class HakoniwaStatusWatcher:
+    """
+    箱庭が running かどうかを周期的に調べ、変化を wait_running() の待ち手へ通知する。
+    hakopy で読める場合は poll_interval、サブプロセスの場合は fallback_interval 秒ごとに調べる。
+    """
+    def __init__(self, poll_interval: float = 0.1, fallback_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self.fallback_interval = fallback_interval
+        self.running = False
+        self._stopped = False
+        self._use_hakopy = True
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Condition はイベントループのスレッドで作る
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def probe(self) -> bool:
+        if self._use_hakopy:
+            state = _read_state_via_hakopy()
+            if state is not None:
+                return state == HAKO_STATE_RUNNING
+            self._use_hakopy = False
+            print("[HakoStatus] hakopy state is not available; falling back to hako-cmd status")
+        return await _probe_via_hako_cmd()
+
+    async def run(self, stop_event: asyncio.Event):
+        """監視タスク本体（stop_event が立つまで状態を調べ続ける）"""
+        cond = self._condition()
+        while not stop_event.is_set():
+            running = await self.probe()
+            if running != self.running:
+                print("[HakoStatus] Hakoniwa is running" if running else "[HakoStatus] Hakoniwa is NOT running")
+                async with cond:
+                    self.running = running
+                    cond.notify_all()
+            interval = self.poll_interval if self._use_hakopy else self.fallback_interval
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        async with cond:
+            self._stopped = True
+            cond.notify_all()
+
+    async def wait_running(self) -> bool:
+        """箱庭が running になるまで待つ。監視が先に終了した場合は False"""
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.running or self._stopped)
+            return self.running
@@ -0,0 +1,119 @@
+"""
+ホットパス向けの PDU 変換。
+hakoniwa_pdu の汎用コンバータは配列を要素ごとの Python オブジェクトとして扱うため、
+大きなバイト列や毎 tick 読む PDU では専用の変換を使う。
+"""
+import struct
+from hakoniwa_pdu.pdu_msgs.binary_io import PduMetaData
+from hakoniwa_pdu.pdu_msgs.drone_srv_msgs.pdu_pytype_CameraCaptureImageResponsePacket import CameraCaptureImageResponsePacket
+from hakoniwa_pdu.pdu_msgs.drone_srv_msgs.pdu_conv_CameraCaptureImageResponsePacket import py_to_pdu_CameraCaptureImageResponsePacket
+
+# CameraCaptureImageResponsePacket のレイアウト（pdu_conv_CameraCaptureImageResponsePacket より）
+#   header: ServiceResponseHeader  offset=0   size=268（可変長配列なし）
+#   body:   CameraCaptureImageResponse offset=268
+#     data: varray<uint8> offset=4 -> (array_size:int32, offset_from_heap:int32)
+_META_TOTAL_SIZE_OFF = 16
+_CAPTURE_RES_DATA_OFF = PduMetaData.PDU_META_DATA_SIZE + 268 + 4
+_U32 = struct.Struct("<I")
+
+# --- 毎 tick 読む PDU の高速デコード ---
+# 汎用コンバータ（pdu_to_py_*）はオブジェクトツリー全体を作るため、必要なフィールドだけを
+# 既知のオフセットから struct で直接読む。オフセットは各 pdu_conv_* のコメントより（ベース部先頭から）。
+#   geometry_msgs/Twist                   : linear(x,y,z) float64 @0, angular(x,y,z) float64 @24
+#   hako_mavlink_msgs/HakoHilActuatorControls: controls[16] float32 @8
+#   hako_msgs/GameControllerOperation      : button[15] bool（4 バイト/要素）@48
+_BASE_OFF = PduMetaData.PDU_META_DATA_SIZE
+_META_HEAD = struct.Struct("<II")
+_TWIST = struct.Struct("<6d")
+_ACTUATOR_CONTROL0 = struct.Struct("<f")
+_ACTUATOR_CONTROL0_OFF = _BASE_OFF + 8
+_GAME_BUTTON_OFF = _BASE_OFF + 48
+_GAME_BUTTON_SIZE = 4
+_GAME_BUTTON_PAIR = struct.Struct("<ii")
+GAME_BUTTON_CAMERA_UP = 11
+GAME_BUTTON_CAMERA_DOWN = 12
+
+
+def encode_camera_capture_response_packet(packet: CameraCaptureImageResponsePacket) -> bytearray:
+    """
+    CameraCaptureImageResponsePacket をエンコードする。
+    body.data が bytes / bytearray / memoryview の場合は要素ごとの変換をせず、
+    ヒープ領域の末尾にそのまま 1 回でコピーする。
+    list の場合は従来の汎用コンバータにそのまま任せる。
+    """
+    data = packet.body.data
+    if isinstance(data, list):
+        return py_to_pdu_CameraCaptureImageResponsePacket(packet)
+
+    # data を空にしてヘッダ・固定長部分だけを汎用コンバータで作る（ヒープは空）
+    packet.body.data = b""
+    try:
+        buf = py_to_pdu_CameraCaptureImageResponsePacket(packet)
+    finally:
+        packet.body.data = data
+
+    payload = memoryview(data).cast("B")
+    buf.extend(payload)
+    _U32.pack_into(buf, _CAPTURE_RES_DATA_OFF, len(payload))
+    _U32.pack_into(buf, _META_TOTAL_SIZE_OFF, len(buf))
+    return buf
+
+
+def install_fast_response_encoder(protocol_server, service_name: str) -> bool:
+    """ProtocolServer のサービスのレスポンスエンコーダを高速版に差し替える"""
+    services = getattr(protocol_server, "services", None)
+    ctx = services.get(service_name) if services else None
+    if ctx is None:
+        print(f"[RPC] Warning: cannot install fast encoder for {service_name}")
+        return False
+    ctx.res_encoder = encode_camera_capture_response_packet
+    return True
+
+
+def _check_meta(raw, min_size: int):
+    if len(raw) < min_size:
+        raise ValueError(f"PDU too short: {len(raw)} < {min_size}")
+    magicno, version = _META_HEAD.unpack_from(raw, 0)
+    if magicno != PduMetaData.PDU_META_DATA_MAGICNO or version != PduMetaData.PDU_META_DATA_VERSION:
+        raise ValueError("Invalid PDU binary data: MetaData not found or corrupted")
+
+
+def decode_twist(raw) -> tuple:
+    """Twist を (linear.x, linear.y, linear.z, angular.x, angular.y, angular.z) として読む"""
+    _check_meta(raw, _BASE_OFF + _TWIST.size)
+    return _TWIST.unpack_from(raw, _BASE_OFF)
+
+
+def decode_actuator_control0(raw) -> float:
+    """HakoHilActuatorControls の controls[0] だけを読む"""
+    _check_meta(raw, _ACTUATOR_CONTROL0_OFF + _ACTUATOR_CONTROL0.size)
+    return _ACTUATOR_CONTROL0.unpack_from(raw, _ACTUATOR_CONTROL0_OFF)[0]
+
+
+def decode_camera_pitch_buttons(raw) -> tuple:
+    """GameControllerOperation のカメラ上下ボタン（button[11], button[12]）を (up, down) として読む"""
+    off = _GAME_BUTTON_OFF + GAME_BUTTON_CAMERA_UP * _GAME_BUTTON_SIZE
+    _check_meta(raw, off + _GAME_BUTTON_PAIR.size)
+    up, down = _GAME_BUTTON_PAIR.unpack_from(raw, off)
+    return up != 0, down != 0
+
+
+# --- 上の decode_* と対になる書き込み（合成 PDU・記録の再生用） ---
+# buf は汎用コンバータ（py_to_pdu_*）で作った同じ型の PDU。固定長部分だけを上書きする。
+def encode_twist_into(buf: bytearray, values) -> None:
+    """(linear.x, linear.y, linear.z, angular.x, angular.y, angular.z) を Twist PDU に書き込む"""
+    _check_meta(buf, _BASE_OFF + _TWIST.size)
+    _TWIST.pack_into(buf, _BASE_OFF, *values)
+
+
+def encode_actuator_control0_into(buf: bytearray, control0: float) -> None:
+    """HakoHilActuatorControls PDU の controls[0] を書き込む"""
+    _check_meta(buf, _ACTUATOR_CONTROL0_OFF + _ACTUATOR_CONTROL0.size)
+    _ACTUATOR_CONTROL0.pack_into(buf, _ACTUATOR_CONTROL0_OFF, control0)
+
+
+def encode_camera_pitch_buttons_into(buf: bytearray, up: bool, down: bool) -> None:
+    """GameControllerOperation PDU の button[11], button[12] を書き込む"""
+    off = _GAME_BUTTON_OFF + GAME_BUTTON_CAMERA_UP * _GAME_BUTTON_SIZE
+    _check_meta(buf, off + _GAME_BUTTON_PAIR.size)
+    _GAME_BUTTON_PAIR.pack_into(buf, off, int(bool(up)), int(bool(down)))
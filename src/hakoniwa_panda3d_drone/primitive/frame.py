@@ -2,6 +2,7 @@ from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_pytype_Twist import Twist
 from panda3d.core import Vec3
 from typing import Tuple
 from math import pi
+import numpy as np
 
 class Frame:
     """
@@ -23,12 +24,27 @@ class Frame:
 
     @staticmethod
     def to_panda3d(ros_twist: Twist) -> Tuple[Vec3, Vec3]:
-        pos = Vec3(
-            -ros_twist.linear.y, 
-            ros_twist.linear.x, 
-            ros_twist.linear.z)
+        return Frame.to_panda3d_values(
+            ros_twist.linear.x, ros_twist.linear.y, ros_twist.linear.z,
+            ros_twist.angular.x, ros_twist.angular.y, ros_twist.angular.z)
+
+    @staticmethod
+    def to_panda3d_values(lx: float, ly: float, lz: float, ax: float, ay: float, az: float) -> Tuple[Vec3, Vec3]:
+        """Twist の各値（pdu_codec.decode_twist の戻り値）から変換する"""
+        pos = Vec3(-ly, lx, lz)
         orientation = Vec3(
-            ros_twist.angular.z * 180.0 / pi, #heading
-            -ros_twist.angular.y * 180.0 / pi, #pitch
-            ros_twist.angular.x * 180.0 / pi)  #roll
+            az * 180.0 / pi, #heading
+            -ay * 180.0 / pi, #pitch
+            ax * 180.0 / pi)  #roll
         return pos, orientation
+
+    @staticmethod
+    def to_panda3d_array(twists: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        to_panda3d の一括版。twists は (N,6) の [linear.x, linear.y, linear.z, angular.x, angular.y, angular.z]。
+        (位置 (N,3), HPR[deg] (N,3)) を返す。
+        """
+        t = np.asarray(twists, dtype=np.float64).reshape(-1, 6)
+        pos = np.stack([-t[:, 1], t[:, 0], t[:, 2]], axis=1)
+        hpr = np.degrees(np.stack([t[:, 5], -t[:, 4], t[:, 3]], axis=1))
+        return pos, hpr
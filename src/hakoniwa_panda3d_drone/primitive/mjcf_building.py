@@ -1,10 +1,19 @@
+import os
+import hashlib
+import zipfile
 import xml.etree.ElementTree as ET
-from typing import List, Tuple, cast
-from panda3d.core import Vec3, Vec4, NodePath
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from panda3d.core import Vec3, NodePath, Point3
 
-from .polygon import Cube
+from .polygon import Cube, make_cubes_geom_node, hpr_to_matrices
 from .render import RenderEntity
 
+BUILDING_PREFIX = "geom_bldg_"
+# .npz キャッシュの形式を変えたら上げる（古いキャッシュを無効化）
+BUILDING_CACHE_VERSION = 1
+
+
 class BuildingData:
     """MJCFから抽出した建物の情報を格納するデータクラス"""
     def __init__(self, name: str, size: Tuple[float, float, float], pos: Vec3, hpr: Vec3, color: Tuple[float, float, float, float]):
@@ -14,68 +23,226 @@ class BuildingData:
         self.hpr = hpr
         self.color = color
 
-def _parse_vector(s: str) -> List[float]:
-    """スペース区切りの文字列をfloatのリストに変換する"""
-    return [float(x) for x in s.split()]
+
+class BuildingTable:
+    """
+    建物情報を列ごとの NumPy 配列で持つ表（Panda3D 座標系に変換済み）。
+    names (N,) / size (N,3) 各軸の長さ / pos (N,3) / hpr (N,3)[deg] / rgba (N,4)
+    """
+    def __init__(self, names: np.ndarray, size: np.ndarray, pos: np.ndarray, hpr: np.ndarray, rgba: np.ndarray):
+        self.names = names
+        self.size = size
+        self.pos = pos
+        self.hpr = hpr
+        self.rgba = rgba
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def row(self, i: int) -> BuildingData:
+        return BuildingData(
+            name=str(self.names[i]),
+            size=tuple(float(v) for v in self.size[i]),
+            pos=Vec3(*self.pos[i]),
+            hpr=Vec3(*self.hpr[i]),
+            color=tuple(float(v) for v in self.rgba[i]),
+        )
+
+    def __iter__(self) -> Iterator[BuildingData]:
+        return (self.row(i) for i in range(len(self)))
+
+    def to_building_data(self) -> List[BuildingData]:
+        return list(self)
+
+    @classmethod
+    def from_building_data(cls, buildings: Sequence[BuildingData]) -> "BuildingTable":
+        return cls(
+            names=np.array([d.name for d in buildings], dtype=str),
+            size=np.array([d.size for d in buildings], dtype=np.float64).reshape(-1, 3),
+            pos=np.array([tuple(d.pos) for d in buildings], dtype=np.float64).reshape(-1, 3),
+            hpr=np.array([tuple(d.hpr) for d in buildings], dtype=np.float64).reshape(-1, 3),
+            rgba=np.array([d.color for d in buildings], dtype=np.float64).reshape(-1, 4),
+        )
+
+
+def _parse_vectors(strings: List[str], width: int) -> np.ndarray:
+    """スペース区切りの数値文字列の並びを (N,width) の配列へ一括変換する"""
+    if not strings:
+        return np.zeros((0, width), dtype=np.float64)
+    return np.array(" ".join(strings).split(), dtype=np.float64).reshape(-1, width)
+
+
+class _VectorColumns:
+    """属性文字列を一定数ずつ NumPy 配列へ変換して貯める（文字列のまま大量に持たない）"""
+    BLOCK = 8192
+
+    def __init__(self, widths: Sequence[int]):
+        self.widths = widths
+        self._pending: List[List[str]] = [[] for _ in widths]
+        self._blocks: List[List[np.ndarray]] = [[] for _ in widths]
+
+    def append(self, values: Sequence[str]):
+        for col, v in zip(self._pending, values):
+            col.append(v)
+        if len(self._pending[0]) >= self.BLOCK:
+            self._flush()
+
+    def _flush(self):
+        for pending, blocks, width in zip(self._pending, self._blocks, self.widths):
+            if pending:
+                blocks.append(_parse_vectors(pending, width))
+                pending.clear()
+
+    def arrays(self) -> List[np.ndarray]:
+        self._flush()
+        return [np.concatenate(blocks) if blocks else np.zeros((0, width), dtype=np.float64)
+                for blocks, width in zip(self._blocks, self.widths)]
+
+
+def parse_buildings_mjcf(filepath: str) -> BuildingTable:
+    """
+    MuJoCo MJCF を iterparse で先頭から読み、建物（geom_bldg_*）の属性だけを集めて BuildingTable を作る。
+    読み終えた要素はすぐ捨てるので、DOM 全体をメモリに持たない。
+    MuJoCo の座標系（x=前, y=左, z=上）から Panda3D の座標系（x=右, y=前, z=上）への変換も行う。
+    """
+    names: List[str] = []
+    columns = _VectorColumns((3, 3, 3, 4))   # size, pos, euler, rgba
+
+    # 読み終えた要素は親から外す（clear() だけでは空の要素が親に残り続ける）
+    stack: List[ET.Element] = []
+    for event, elem in ET.iterparse(filepath, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == "geom":
+            name = elem.get("name")
+            if name and name.startswith(BUILDING_PREFIX):
+                values = (elem.get("size"), elem.get("pos"), elem.get("euler"), elem.get("rgba"))
+                if all(values):
+                    # 要素数の違う属性が 1 つでもあると、まとめて変換したときに後続の建物の値がずれる
+                    if all(len(v.split()) == w for v, w in zip(values, columns.widths)):
+                        names.append(name)
+                        columns.append(values)
+                    else:
+                        print(f"[MJCF] Warning: skipping {name}: expected size/pos/euler/rgba with "
+                              f"{'/'.join(map(str, columns.widths))} values, got {values}")
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+    size_mj, pos_mj, euler_mj, rgba = columns.arrays()  # euler は degrees
+    return BuildingTable(
+        names=np.array(names, dtype=str),
+        # --- サイズ変換（MuJoCo の size は半分の長さ） ---
+        size=size_mj[:, [1, 0, 2]] * 2.0,
+        # --- 位置変換 ---
+        pos=np.stack([pos_mj[:, 1], -pos_mj[:, 0], pos_mj[:, 2]], axis=1),
+        # --- 回転変換 ---
+        hpr=euler_mj[:, [2, 1, 0]].copy(),
+        rgba=rgba,
+    )
+
+
+def _file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk_size)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def building_cache_path(filepath: str) -> str:
+    """MJCF の横に置く .npz キャッシュのパス"""
+    return filepath + ".buildings.npz"
+
+
+def _read_building_cache(cache_path: str) -> Optional[Tuple[dict, BuildingTable]]:
+    try:
+        with np.load(cache_path, allow_pickle=False) as z:
+            meta = {
+                "version": int(z["version"]),
+                "mtime_ns": int(z["mtime_ns"]),
+                "file_size": int(z["file_size"]),
+                "sha256": str(z["sha256"]),
+            }
+            table = BuildingTable(z["names"], z["size"], z["pos"], z["hpr"], z["rgba"])
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # 読めないキャッシュ（書きかけ・空ファイルなど）は無いものとして MJCF を読み直す
+        return None
+    return meta, table
+
+
+def _write_building_cache(cache_path: str, table: BuildingTable, st: os.stat_result, digest: str):
+    tmp = cache_path + ".tmp.npz"
+    try:
+        np.savez(
+            tmp,
+            version=BUILDING_CACHE_VERSION, mtime_ns=st.st_mtime_ns, file_size=st.st_size, sha256=digest,
+            names=table.names, size=table.size, pos=table.pos, hpr=table.hpr, rgba=table.rgba,
+        )
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"[MJCF] Warning: cannot write building cache {cache_path}: {e}")
+
+
+def load_building_table(filepath: str, use_cache: bool = True) -> BuildingTable:
+    """
+    建物の表を返す。use_cache=True なら MJCF の横の .npz キャッシュを使う。
+    キャッシュは (mtime, サイズ) が一致すればそのまま使い、違っても内容ハッシュが同じなら使う（時刻だけ更新）。
+    """
+    if not use_cache:
+        return parse_buildings_mjcf(filepath)
+
+    cache_path = building_cache_path(filepath)
+    st = os.stat(filepath)
+    cached = _read_building_cache(cache_path)
+    if cached is not None and cached[0]["version"] == BUILDING_CACHE_VERSION:
+        meta, table = cached
+        if meta["mtime_ns"] == st.st_mtime_ns and meta["file_size"] == st.st_size:
+            print(f"[MJCF] Building cache hit: {os.path.basename(cache_path)} ({len(table)} buildings)")
+            return table
+        digest = _file_sha256(filepath)
+        if meta["sha256"] == digest:
+            _write_building_cache(cache_path, table, st, digest)
+            print(f"[MJCF] Building cache hit (content unchanged): {os.path.basename(cache_path)}")
+            return table
+    else:
+        digest = _file_sha256(filepath)
+
+    table = parse_buildings_mjcf(filepath)
+    _write_building_cache(cache_path, table, st, digest)
+    print(f"[MJCF] Parsed {len(table)} buildings from {os.path.basename(filepath)} -> {os.path.basename(cache_path)}")
+    return table
+
 
 def load_buildings_from_mjcf(filepath: str) -> List[BuildingData]:
     """
     MuJoCo MJCFファイルを解析し、建物の情報を抽出してリストとして返す。
-    この際、MuJoCoの座標系からPanda3Dの座標系への変換も行う。
+    （互換用。大量の建物を扱う場合は load_building_table の表をそのまま使う）
 
     :param filepath: MJCFファイルのパス
     :return: BuildingDataオブジェクトのリスト
     """
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    buildings: List[BuildingData] = []
-
-    for geom in root.findall(".//geom"):
-        name = geom.get("name")
-        if name and name.startswith("geom_bldg_"):
-            size_str = geom.get("size")
-            pos_str = geom.get("pos")
-            euler_str = geom.get("euler")
-            rgba_str = geom.get("rgba")
-
-            if not all([size_str, pos_str, euler_str, rgba_str]):
-                continue
-
-            # 属性をパース
-            size_mj = _parse_vector(size_str)
-            pos_mj = _parse_vector(pos_str)
-            euler_mj = _parse_vector(euler_str)  # degrees
-            color = cast(Tuple[float, float, float, float], tuple(_parse_vector(rgba_str)))
-
-            # --- サイズ変換 ---
-            size_pd = (size_mj[1] * 2, size_mj[0] * 2, size_mj[2] * 2)
-
-            # --- 位置変換 ---
-            # MuJoCo: x=前, y=左, z=上
-            # Panda3D: x=右, y=前, z=上
-            pos_pd = Vec3(pos_mj[1], -pos_mj[0], pos_mj[2])
-
-            # --- 回転変換 ---
-            hpr_pd = Vec3(euler_mj[2], euler_mj[1], euler_mj[0])
-
-            green_color = (0.0, 1.0, 0.0, 1.0)
-            building_data = BuildingData(
-                name=name,
-                size=size_pd,
-                pos=pos_pd,
-                hpr=hpr_pd,
-                color=green_color
-            )
-            buildings.append(building_data)
-
-    return buildings
-
-def create_building_renders(parent_np: NodePath, building_data_list: List[BuildingData]) -> List[RenderEntity]:
+    return load_building_table(filepath).to_building_data()
+
+
+Buildings = Union[BuildingTable, Sequence[BuildingData]]
+
+
+def _as_table(buildings: Buildings) -> BuildingTable:
+    return buildings if isinstance(buildings, BuildingTable) else BuildingTable.from_building_data(buildings)
+
+
+def create_building_renders(parent_np: NodePath, building_data_list: Buildings) -> List[RenderEntity]:
     """
     BuildingDataのリストからRenderEntityを生成し、シーンに配置する。
 
     :param parent_np: 親となるNodePath
-    :param building_data_list: 建物のデータリスト
+    :param building_data_list: 建物のデータリスト（BuildingTable も可）
     :return: 生成されたRenderEntityのリスト
     """
     renders: List[RenderEntity] = []
@@ -92,5 +259,100 @@ def create_building_renders(parent_np: NodePath, building_data_list: List[Buildi
         entity.set_pos(data.pos.x, data.pos.y, data.pos.z)
         entity.set_hpr(data.hpr.x, data.hpr.y, data.hpr.z)
         renders.append(entity)
-    
+
     return renders
+
+class BuildingIndex:
+    """
+    バッチ描画した建物の索引。
+    ジオメトリはチャンク単位で結合されるため、建物名による検索や
+    ピッキング（座標→建物名）はこの索引で行う。建物情報は BuildingTable の行として持つ。
+    """
+    def __init__(self, table: BuildingTable):
+        self._table = table
+        self._row: Dict[str, int] = {}
+        self._chunk_of: Dict[str, NodePath] = {}
+        self._rows: List[int] = []
+        self._inv_rot: Optional[np.ndarray] = None
+
+    def add_rows(self, rows: Sequence[int], chunk_np: NodePath):
+        for i in rows:
+            name = str(self._table.names[i])
+            self._row[name] = int(i)
+            self._chunk_of[name] = chunk_np
+            self._rows.append(int(i))
+        self._inv_rot = None
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._row
+
+    def names(self) -> List[str]:
+        return list(self._row.keys())
+
+    def get(self, name: str) -> Optional[BuildingData]:
+        i = self._row.get(name)
+        return None if i is None else self._table.row(i)
+
+    def chunk_of(self, name: str) -> Optional[NodePath]:
+        return self._chunk_of.get(name)
+
+    def pick(self, point: Point3) -> Optional[str]:
+        """
+        親ノード座標系の点を含む建物名を返す（なければ None）。
+        コリジョンレイの交点などを渡して使う想定。複数に含まれる場合は索引に先に入った建物。
+        """
+        if not self._rows:
+            return None
+        rows = np.asarray(self._rows)
+        if self._inv_rot is None:
+            # 行ベクトル規約 world = local @ M なので local = world @ M^T
+            self._inv_rot = np.transpose(hpr_to_matrices(self._table.hpr[rows]), (0, 2, 1))
+        d = np.asarray(tuple(point), dtype=np.float64) - self._table.pos[rows]
+        local = np.einsum("ni,nij->nj", d, self._inv_rot)
+        inside = np.all(np.abs(local) <= self._table.size[rows] * 0.5 + 1e-6, axis=1)
+        hit = np.flatnonzero(inside)
+        return str(self._table.names[rows[hit[0]]]) if len(hit) else None
+
+def create_batched_building_renders(
+    parent_np: NodePath,
+    building_data_list: Buildings,
+    chunk_size: float = 100.0,
+) -> Tuple[List[NodePath], BuildingIndex]:
+    """
+    建物を XY 平面のグリッド（chunk_size 四方）ごとにまとめ、
+    位置・回転・色を頂点に焼き込んだ 1 つのジオメトリへ結合する。
+    チャンク単位でバウンディングを持つため視錐台カリングは有効なまま、
+    ドローコール数とシーングラフのノード数を建物数からチャンク数に減らす。
+
+    :param parent_np: 親となるNodePath
+    :param building_data_list: 建物のデータリスト（BuildingTable ならそのまま列を使う）
+    :param chunk_size: チャンク一辺の長さ[m]
+    :return: (チャンクのNodePathリスト, 建物名の索引)
+    """
+    table = _as_table(building_data_list)
+    keys = np.floor(table.pos[:, :2] / chunk_size).astype(np.int64)
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for i, (ix, iy) in enumerate(keys.tolist()):
+        groups.setdefault((ix, iy), []).append(i)
+
+    chunks: List[NodePath] = []
+    index = BuildingIndex(table)
+    for (ix, iy), rows in sorted(groups.items()):
+        chunk_name = f"bldg_chunk_{ix}_{iy}"
+        # 位置・回転・色を頂点に焼き込んだ 1 つの GeomNode をまとめて生成
+        node = make_cubes_geom_node(
+            chunk_name,
+            sizes=table.size[rows].astype(np.float32),
+            pos=table.pos[rows].astype(np.float32),
+            hpr=table.hpr[rows].astype(np.float32),
+            colors=table.rgba[rows].astype(np.float32),
+        )
+        chunk_np = parent_np.attachNewNode(node)
+        chunk_np.setTwoSided(False)
+        index.add_rows(rows, chunk_np)
+        chunks.append(chunk_np)
+
+    return chunks, index
@@ -1,39 +1,172 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+import numpy as np
 from panda3d.core import (
-    GeomNode, Geom, GeomVertexData, GeomVertexFormat, GeomVertexWriter,
+    GeomNode, Geom, GeomVertexData, GeomVertexFormat,
     GeomTriangles, Vec3, Vec4
 )
 Color = Tuple[float, float, float, float]
 
-class Polygon(ABC):
-    """形状の抽象：GeomNode を作って返す責務だけを持つ"""
-    def make_geom_node(self, name: str = "polygon") -> GeomNode:
-        vformat = GeomVertexFormat.getV3n3c4()
-        vdata = GeomVertexData(name, vformat, Geom.UH_static)
-        vdata.setNumRows(len(self.vtx))
+# GeomVertexFormat.getV3n3c4() のインターリーブ配列（stride=28）と同じレイアウト
+V3N3C4_DTYPE = np.dtype([
+    ("vertex", "<f4", (3,)),
+    ("normal", "<f4", (3,)),
+    ("color", "u1", (4,)),
+])
+
+# Cube の 8 頂点（単位立方体の半分＝±1）と 12 三角形（6面×2）
+_CUBE_CORNERS = np.array([
+    (-1, -1, -1), ( 1, -1, -1), ( 1,  1, -1), (-1,  1, -1),
+    (-1, -1,  1), ( 1, -1,  1), ( 1,  1,  1), (-1,  1,  1),
+], dtype=np.float32)
+_CUBE_TRIS = np.array([
+    (0,1,2), (0,2,3),     # -Z
+    (4,6,5), (4,7,6),     # +Z
+    (1,5,6), (1,6,2),     # +X
+    (0,3,7), (0,7,4),     # -X
+    (3,2,6), (3,6,7),     # +Y
+    (0,4,5), (0,5,1),     # -Y
+], dtype=np.uint32)
+
+
+def smooth_normals(vtx: np.ndarray, tris: np.ndarray) -> np.ndarray:
+    """
+    三角形の面法線を頂点ごとに集計してスムーズ法線を求める。
+    vtx は (V,3) または (N,V,3)。後者は N 個の形状をまとめて計算する。
+    """
+    vtx = np.asarray(vtx, dtype=np.float32)
+    single = vtx.ndim == 2
+    v = vtx[None] if single else vtx
+    tris = np.asarray(tris, dtype=np.intp)
+    pa, pb, pc = v[:, tris[:, 0]], v[:, tris[:, 1]], v[:, tris[:, 2]]
+    n = np.cross(pb - pa, pc - pa)
+    ln = np.linalg.norm(n, axis=-1, keepdims=True)
+    n = np.divide(n, ln, out=np.zeros_like(n), where=ln > 0)
+
+    normals = np.zeros_like(v)
+    for k in range(3):
+        np.add.at(normals, (slice(None), tris[:, k]), n)
+    ln = np.linalg.norm(normals, axis=-1, keepdims=True)
+    normals = np.divide(normals, ln, out=np.zeros_like(normals), where=ln > 0)
+    return normals[0] if single else normals
+
+
+def hpr_to_matrices(hpr: np.ndarray) -> np.ndarray:
+    """
+    (N,3) の HPR[deg] から (N,3,3) の回転行列を作る。
+    Panda3D と同じ行ベクトル規約（v' = v @ M, 適用順は R→P→H）。
+    """
+    h, p, r = np.radians(np.asarray(hpr, dtype=np.float64)).T
+    ch, sh = np.cos(h), np.sin(h)
+    cp, sp = np.cos(p), np.sin(p)
+    cr, sr = np.cos(r), np.sin(r)
+    m = np.empty((len(h), 3, 3), dtype=np.float64)
+    m[:, 0, 0] = cr * ch - sr * sp * sh
+    m[:, 0, 1] = cr * sh + sr * sp * ch
+    m[:, 0, 2] = -sr * cp
+    m[:, 1, 0] = -cp * sh
+    m[:, 1, 1] = cp * ch
+    m[:, 1, 2] = sp
+    m[:, 2, 0] = sr * ch + cr * sp * sh
+    m[:, 2, 1] = sr * sh - cr * sp * ch
+    m[:, 2, 2] = cr * cp
+    return m
+
+
+def make_geom_node_from_arrays(
+    name: str,
+    vertices: np.ndarray,
+    normals: np.ndarray,
+    colors: np.ndarray,
+    tris: np.ndarray,
+) -> GeomNode:
+    """
+    NumPy 配列から V3N3C4 の GeomNode を作る。
+    頂点配列・インデックス配列ともに memoryview 経由で一括コピーする。
+
+    :param vertices: (N,3) 頂点座標
+    :param normals: (N,3) 法線
+    :param colors: (N,4) 頂点カラー（0.0〜1.0）
+    :param tris: (M,3) 三角形の頂点インデックス
+    """
+    vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+    n_vtx = len(vertices)
+
+    buf = np.empty(n_vtx, dtype=V3N3C4_DTYPE)
+    buf["vertex"] = vertices
+    buf["normal"] = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+    rgba = np.asarray(colors, dtype=np.float32).reshape(-1, 4)
+    # GeomVertexWriter と同じく 255 倍して切り捨てる（四捨五入すると 1 LSB ずれる）
+    buf["color"] = np.clip(rgba * 255.0, 0, 255).astype(np.uint8)
 
-        vw = GeomVertexWriter(vdata, "vertex")
-        nw = GeomVertexWriter(vdata, "normal")
-        cw = GeomVertexWriter(vdata, "color")
+    vformat = GeomVertexFormat.getV3n3c4()
+    assert vformat.getArray(0).getStride() == V3N3C4_DTYPE.itemsize
+    vdata = GeomVertexData(name, vformat, Geom.UH_static)
+    vdata.uncleanSetNumRows(n_vtx)
+    memoryview(vdata.modifyArray(0)).cast("B")[:] = buf.view(np.uint8)
 
+    if n_vtx > 0xffff:
+        index_type, index_dtype = Geom.NT_uint32, np.uint32
+    else:
+        index_type, index_dtype = Geom.NT_uint16, np.uint16
+    indices = np.ascontiguousarray(np.asarray(tris).reshape(-1), dtype=index_dtype)
 
-        # 書き込み
-        for p, n, col in zip(self.vtx, self.normals, self.colors):
-            vw.addData3f(p)
-            nw.addData3f(n)
-            cw.addData4f(*col)
+    prim = GeomTriangles(Geom.UH_static)
+    prim.setIndexType(index_type)
+    iarr = prim.modifyVertices()
+    iarr.uncleanSetNumRows(len(indices))
+    memoryview(iarr).cast("B")[:] = indices.view(np.uint8)
 
-        prim = GeomTriangles(Geom.UH_static)
-        for a, b, c in self.tris:
-            prim.addVertices(a, b, c)
-        prim.closePrimitive()
+    geom = Geom(vdata)
+    geom.addPrimitive(prim)
+    node = GeomNode(name)
+    node.addGeom(geom)
+    return node
 
-        geom = Geom(vdata)
-        geom.addPrimitive(prim)
-        node = GeomNode(name)
-        node.addGeom(geom)
-        return node
+
+def make_cubes_geom_node(
+    name: str,
+    sizes: np.ndarray,
+    pos: np.ndarray,
+    hpr: np.ndarray,
+    colors: Optional[np.ndarray] = None,
+) -> GeomNode:
+    """
+    N 個の直方体を位置・回転を焼き込んだ 1 つの GeomNode にまとめて生成する。
+
+    :param sizes: (N,3) 各軸の長さ
+    :param pos: (N,3) 中心位置
+    :param hpr: (N,3) 姿勢[deg]
+    :param colors: (N,4) 直方体ごとの色（None なら白）
+    """
+    sizes = np.asarray(sizes, dtype=np.float32).reshape(-1, 3)
+    n = len(sizes)
+    local = _CUBE_CORNERS[None, :, :] * (sizes[:, None, :] * 0.5)   # (N,8,3)
+    local_n = smooth_normals(local, _CUBE_TRIS)                      # (N,8,3)
+
+    rot = hpr_to_matrices(hpr).astype(np.float32)                   # (N,3,3)
+    world = local @ rot + np.asarray(pos, dtype=np.float32).reshape(-1, 1, 3)
+    world_n = local_n @ rot
+
+    if colors is None:
+        colors = np.ones((n, 4), dtype=np.float32)
+    vcolors = np.repeat(np.asarray(colors, dtype=np.float32).reshape(-1, 4), 8, axis=0)
+
+    offsets = (np.arange(n, dtype=np.uint32) * 8)[:, None, None]
+    tris = _CUBE_TRIS[None, :, :] + offsets                          # (N,12,3)
+    return make_geom_node_from_arrays(name, world, world_n, vcolors, tris)
+
+
+class Polygon(ABC):
+    """形状の抽象：GeomNode を作って返す責務だけを持つ"""
+    def make_geom_node(self, name: str = "polygon") -> GeomNode:
+        return make_geom_node_from_arrays(
+            name,
+            np.asarray(self.vtx, dtype=np.float32),
+            np.asarray(self.normals, dtype=np.float32),
+            np.asarray(self.colors, dtype=np.float32),
+            np.asarray(self.tris, dtype=np.uint32),
+        )
 
 class Cube(Polygon):
     def __init__(self, size: Tuple[float, float, float] = (0.2, 0.2, 0.2), vertex_colors: List[Color] | None = None):
@@ -45,14 +178,7 @@ class Cube(Polygon):
             Vec3(-sx, -sy,  sz), Vec3( sx, -sy,  sz), Vec3( sx,  sy,  sz), Vec3(-sx,  sy,  sz),
         ]
         # 12三角形（6面×2）
-        self.tris: List[Tuple[int,int,int]] = [
-            (0,1,2), (0,2,3),     # -Z
-            (4,6,5), (4,7,6),     # +Z
-            (1,5,6), (1,6,2),     # +X
-            (0,3,7), (0,7,4),     # -X
-            (3,2,6), (3,6,7),     # +Y
-            (0,4,5), (0,5,1),     # -Y
-        ]
+        self.tris: List[Tuple[int,int,int]] = [tuple(t) for t in _CUBE_TRIS.tolist()]
         if vertex_colors is None:
             white = (1, 1, 1, 1)
             self.colors: List[Color] = [white for _ in range(8)]
@@ -61,19 +187,9 @@ class Cube(Polygon):
             self.colors = vertex_colors
 
         # --- 頂点法線を三角形から集計して求める（スムーズシェーディング） ---
-        normals = [Vec3(0, 0, 0) for _ in self.vtx]
-        for a, b, c in self.tris:
-            pa, pb, pc = self.vtx[a], self.vtx[b], self.vtx[c]
-            n = (pb - pa).cross(pc - pa)
-            if n.length_squared() > 0:
-                n.normalize()
-                normals[a] += n; normals[b] += n; normals[c] += n
-        for i in range(len(normals)):
-            if normals[i].length_squared() > 0:
-                normals[i].normalize()
-        self.normals = normals
-
-    
+        self.normals = smooth_normals(np.asarray(self.vtx, dtype=np.float32), _CUBE_TRIS)
+
+
 class Plane(Polygon):
     """Unity の Plane に相当（XZ 平面・原点中心）。size は一辺の長さ。"""
     def __init__(self, size: float = 2.0, color: Color = (0.2, 0.6, 0.6, 1.0)):
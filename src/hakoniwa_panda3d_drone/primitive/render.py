@@ -12,6 +12,7 @@ class RenderEntity:
         self._geom_np: Optional[NodePath] = None  # 子ジオメトリの NodePath
         self.children = []
         self.purpose = None
+        self.model_cache_entry = None  # BAM キャッシュ経由でロードした場合のメタデータ
 
     def set_purpose(self, purpose: str):
         """NodePath の Purpose を設定"""
@@ -45,11 +46,29 @@ class RenderEntity:
 
 
     def load_model(self, loader, path: str, copy: bool = True, cache: bool = False):
-        """loader.loadModel(path) して set_model までを一手に。"""
+        """
+        loader.loadModel(path) して set_model までを一手に。
+        cache=True なら内容ハッシュ付きの BAM キャッシュ（core/model_cache.py）を経由する。
+        """
         print(f"Loading model from: {path}")
-        model_np = loader.loadModel(path, noCache=not cache)
+        if cache:
+            from hakoniwa_panda3d_drone.core.model_cache import get_model_cache
+            model_np, self.model_cache_entry = get_model_cache().load(loader, path)
+        else:
+            model_np = loader.loadModel(path, noCache=True)
         self._set_model(model_np, copy=copy)
 
+    def instance_model(self, registry, path: str):
+        """
+        ModelRegistry が保持する共有モデルをインスタンスとしてぶら下げる。
+        ジオメトリは共有し、姿勢を持つラッパーノードはエンティティごとに分けるので
+        rotate_child_yaw などの個別アニメーションはそのまま使える。
+        """
+        if self._geom_np is not None:
+            self._geom_np.removeNode()
+        self._geom_np = self.np.attachNewNode(f"{self.name}_geom")
+        registry.instance(path, self._geom_np)
+
     def clear(self):
         """現在の子モデル/ジオメトリを外す"""
         if self._geom_np is not None:
@@ -0,0 +1,284 @@
+"""
+姿勢の記録ファイル（core/pose_log.py）から App を動かすリプレイ。箱庭・hakopy は不要。
+
+    python -m hakoniwa_panda3d_drone.replay [--headless] <drone_config_path> <recording> [options]
+
+  --speed N        : 実時間の N 倍で再生する（既定 1）。レコードの間は補間して表示する
+  --step           : 1 フレームに --every レコードずつ進める（実時間によらず描画できる最速で進む）。
+                     描画の時計も記録の時刻に合わせて進めるので、同じ記録からは同じ画像になる
+  --start / --end  : 再生範囲（記録の先頭からの秒）
+  --loop           : 最後まで再生したら先頭に戻る（ヘッドレスでなければ、指定がなくても最後で一時停止する）
+  --capture-dir D  : レコードを適用するたびに全カメラの画像を D/<ドローン>/<カメラ>/<sim_time_usec>.<拡張子> に保存する
+  --image-type T   : 保存する画像の "<形式>[@<幅>x<高さ>]"（既定 png@1280x720）
+キー（ウィンドウ表示時）: space 一時停止 / → ← 1 レコード進む・戻る / ] [ 10 秒進む・戻る / + - 速度を 2 倍・半分
+"""
+import sys
+import time
+import argparse
+from collections import deque
+from pathlib import Path
+import numpy as np
+from panda3d.core import ClockObject, Vec3
+
+from hakoniwa_panda3d_drone.visualizer import App
+from hakoniwa_panda3d_drone.core.pose_log import PoseLogReader, FLAG_POSE, FLAG_CTRL, FLAG_UP, FLAG_DOWN
+from hakoniwa_panda3d_drone.core.pose_history import slerp_hpr
+from hakoniwa_panda3d_drone.core.capture_batch import CaptureEntry, parse_capture_spec
+from hakoniwa_panda3d_drone.core.image_encoder import ImageEncoder, parse_image_type
+
+SEEK_STEP_SEC = 10.0
+# エンコード待ちの画像の上限（これを超えたら古いものの完了を待つ）
+MAX_PENDING_IMAGES = 32
+
+
+class CaptureWriter:
+    """全カメラの画像を描画し、エンコードをワーカーに任せてファイルに書き出す"""
+    def __init__(self, app: App, out_dir: str, image_spec: str):
+        self.app = app
+        self.out_dir = Path(out_dir)
+        self.image_type, self.width, self.height, _ = parse_capture_spec(image_spec)
+        fmt, _ = parse_image_type(self.image_type)
+        self.ext = {"jpeg": "jpg", "raw_rgb": "rgb"}.get(fmt, fmt)
+        self.encoder = ImageEncoder()
+        self.pending = deque()
+        self.saved = 0
+        self.failed = 0
+
+    def capture(self, sim_time_usec: int):
+        entries = [CaptureEntry(drone, cam, self.image_type, self.width, self.height)
+                   for drone, cams in self.app.drone_cams.items() for cam in cams]
+        for entry, (_, frame) in zip(entries, self.app.capture_camera_frames(entries)):
+            if isinstance(frame, Exception):
+                print(f"[Replay] Capture failed for {entry}: {frame}")
+                self.failed += 1
+                continue
+            path = self.out_dir / entry.drone_name / entry.camera_name / f"{sim_time_usec:012d}.{self.ext}"
+            self.pending.append((path, self.encoder.submit(frame, self.image_type)))
+            while len(self.pending) > MAX_PENDING_IMAGES:
+                self._write_oldest()
+
+    def _write_oldest(self):
+        path, fut = self.pending.popleft()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(fut.result())
+        self.saved += 1
+
+    def close(self):
+        while self.pending:
+            self._write_oldest()
+        self.encoder.shutdown()
+        print(f"[Replay] Saved {self.saved} image(s) to {self.out_dir}" + (f" ({self.failed} failed)" if self.failed else ""))
+
+
+class PoseReplayer:
+    """
+    記録ファイルのレコードを App に適用する Panda3D のタスク。
+    index は最後に適用した（補間中は直前の）レコード、実時間再生では (anchor_wall, anchor_sim) からの経過で表示時刻を決める。
+    """
+    def __init__(self, app: App, reader: PoseLogReader, speed: float = 1.0, step: bool = False, every: int = 1,
+                 start_sec: float = 0.0, end_sec: float = None, loop: bool = False,
+                 capture: CaptureWriter = None):
+        if len(reader) == 0:
+            raise ValueError(f"recording has no records: {reader.path}")
+        self.app = app
+        self.reader = reader
+        self.speed = speed
+        self.step = step
+        self.every = max(1, every)
+        self.loop = loop
+        self.capture = capture
+        self.paused = False
+        self.finished = False
+        self.applied = 0
+        first, last = reader.time_range()
+        self.start_usec = first + int(start_sec * 1e6)
+        self.end_usec = last if end_sec is None else min(last, first + int(end_sec * 1e6))
+        self.rotor_scale = 1e6 / reader.delta_time_usec if reader.delta_time_usec > 0 else 1.0
+        self.index = -1
+        self.current_usec = self.start_usec  # 表示中の時刻（補間中はレコードの間）
+        self.anchor_wall = 0.0
+        self.anchor_sim = 0.0
+        self._started = False
+
+        self._clock = None
+        if step:
+            # 描画の時計を実時間から切り離し、適用したレコードの時刻にする（ローター回転も決定的になる）
+            self._clock = ClockObject.getGlobalClock()
+            self._clock.setMode(ClockObject.MSlave)
+        if not app.headless:
+            app.accept("space", self.toggle_pause)
+            app.accept("arrow_right", self.step_by, [1])
+            app.accept("arrow_left", self.step_by, [-1])
+            app.accept("]", self.seek_by, [SEEK_STEP_SEC])
+            app.accept("[", self.seek_by, [-SEEK_STEP_SEC])
+            app.accept("+", self.scale_speed, [2.0])
+            app.accept("-", self.scale_speed, [0.5])
+        print(f"[Replay] {reader.path}: {len(reader)} records, {len(reader.drone_names)} drone(s), "
+              f"{(self.end_usec - self.start_usec) / 1e6:.1f}s, "
+              + (f"step every {self.every} record(s)" if step else f"speed {speed}x"))
+
+    @property
+    def sim_time_usec(self) -> int:
+        return self.current_usec
+
+    # --- 操作 ---
+    def toggle_pause(self):
+        self.paused = not self.paused
+        if not self.paused and self.sim_time_usec >= self.end_usec:
+            self.seek(self.start_usec)
+        self._reanchor()
+        print(f"[Replay] {'Paused' if self.paused else 'Resumed'} at {self.sim_time_usec / 1e6:.3f}s")
+
+    def step_by(self, n: int):
+        """一時停止して n レコード進む（負なら戻る）"""
+        self.paused = True
+        i = min(max(self.index + n, 0), len(self.reader) - 1)
+        self._apply_index(i)
+
+    def seek(self, sim_time_usec: int):
+        t = min(max(int(sim_time_usec), self.start_usec), self.end_usec)
+        self._apply_index(self.reader.index_at(t))
+        self.anchor_sim = float(t)
+        self.anchor_wall = time.monotonic()
+
+    def seek_by(self, sec: float):
+        self.seek(self.sim_time_usec + int(sec * 1e6))
+        print(f"[Replay] Seek to {(self.sim_time_usec - self.reader.time_range()[0]) / 1e6:.3f}s")
+
+    def scale_speed(self, factor: float):
+        self._reanchor()
+        self.speed *= factor
+        print(f"[Replay] Speed {self.speed}x")
+
+    def _reanchor(self):
+        self.anchor_sim = float(self.sim_time_usec)
+        self.anchor_wall = time.monotonic()
+
+    # --- タスク ---
+    def task(self, task):
+        if self.finished or not self.app.scene_ready:
+            return task.cont
+        if not self._started:
+            self._started = True
+            self.seek(self.start_usec)
+            return task.cont
+        if self.paused:
+            return task.cont
+
+        if self.step:
+            i = self.index + self.every
+            if i >= len(self.reader) or self.reader.times[i] > self.end_usec:
+                self._end()
+            else:
+                self._apply_index(i)
+            return task.cont
+
+        target = self.anchor_sim + (time.monotonic() - self.anchor_wall) * self.speed * 1e6
+        if target >= self.end_usec:
+            self._apply_index(self.reader.index_at(self.end_usec))
+            self._end()
+            return task.cont
+        self._apply_time(target)
+        return task.cont
+
+    def _end(self):
+        if self.loop:
+            self.seek(self.start_usec)
+            return
+        if self.app.headless:
+            self.finished = True
+            self.app.taskMgr.stop()
+        elif not self.paused:
+            self.paused = True
+            print(f"[Replay] End of recording at {self.sim_time_usec / 1e6:.3f}s (space to replay from start)")
+
+    # --- 適用 ---
+    def _apply_index(self, i: int):
+        """レコード i をそのまま適用する（キャプチャ指定があれば保存する）"""
+        rec = self.reader.records[i]
+        self.index = i
+        self._apply(rec, rec["pos"], rec["hpr"], int(rec["sim_time_usec"]))
+        if self.capture is not None:
+            self.capture.capture(int(rec["sim_time_usec"]))
+
+    def _apply_time(self, target: float):
+        """表示時刻 target[usec] の姿勢を前後のレコードから補間して適用する"""
+        i = self.reader.index_at(int(target))
+        rec0 = self.reader.records[i]
+        t0 = int(rec0["sim_time_usec"])
+        if i + 1 >= len(self.reader) or target <= t0:
+            if i != self.index:
+                self._apply_index(i)
+            return
+        rec1 = self.reader.records[i + 1]
+        frac = (target - t0) / (int(rec1["sim_time_usec"]) - t0)
+        pos0, pos1 = np.asarray(rec0["pos"], dtype=np.float64), np.asarray(rec1["pos"], dtype=np.float64)
+        pos = pos0 + (pos1 - pos0) * frac
+        hpr = np.asarray(rec0["hpr"], dtype=np.float64).copy()
+        both = (rec0["flags"] & rec1["flags"] & FLAG_POSE) != 0
+        for k in np.nonzero(both)[0]:
+            hpr[k] = slerp_hpr(Vec3(*rec0["hpr"][k]), Vec3(*rec1["hpr"][k]), frac)
+        pos[~both] = pos0[~both]
+        buttons_changed = i != self.index
+        self.index = i
+        self._apply(rec0, pos, hpr, int(target), buttons=buttons_changed)
+
+    def _apply(self, rec, pos, hpr, sim_time_usec: int, buttons: bool = True):
+        if self._clock is not None:
+            self._clock.setFrameTime(sim_time_usec / 1e6)
+        flags = rec["flags"]
+        valid = np.nonzero(flags & FLAG_POSE)[0]
+        names = self.reader.drone_names
+        if len(valid):
+            self.app.apply_poses([names[k] for k in valid], np.asarray(pos)[valid], np.asarray(hpr)[valid],
+                                 np.asarray(rec["rotor_speed"], dtype=np.float64)[valid] * self.rotor_scale)
+        if buttons:
+            for k in np.nonzero(flags & FLAG_CTRL)[0]:
+                self.app.update_camera_pitch(names[k], bool(flags[k] & FLAG_UP), bool(flags[k] & FLAG_DOWN))
+        self.app.sim_time_usec = sim_time_usec
+        self.current_usec = sim_time_usec
+        self.applied += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded pose stream in the visualizer")
+    parser.add_argument("drone_config_path")
+    parser.add_argument("recording")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--step", action="store_true")
+    parser.add_argument("--every", type=int, default=1)
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--end", type=float, default=None)
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--capture-dir")
+    parser.add_argument("--image-type", default="png@1280x720")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    if args.capture_dir and not args.step:
+        parser.error("--capture-dir requires --step")
+
+    reader = PoseLogReader(args.recording)
+    app = App(args.drone_config_path, headless=args.headless)
+    missing = [n for n in reader.drone_names if app.drone_registry.get(n) is None]
+    if missing:
+        print(f"[Replay] Warning: drones not in config are skipped: {', '.join(missing)}")
+    capture = CaptureWriter(app, args.capture_dir, args.image_type) if args.capture_dir else None
+    replayer = PoseReplayer(app, reader, speed=args.speed, step=args.step, every=args.every,
+                            start_sec=args.start, end_sec=args.end, loop=args.loop, capture=capture)
+    app.taskMgr.add(replayer.task, "ReplayPoses")
+    t0 = time.monotonic()
+    try:
+        app.run()
+    finally:
+        elapsed = time.monotonic() - t0
+        if capture is not None:
+            capture.close()
+        app.close()
+        print(f"[Replay] Applied {replayer.applied} frame(s) in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Visualizer アセットの周期実行（env_control_loop の tick）を管理するスケジューラ。
+
+  sim  : シミュレーション時刻の進み（hakopy.usleep の戻り）で起床する。wall-clock の sleep は挟まない。
+         hakopy.usleep は専用スレッド 1 本で呼び続け、tick をイベントループへ通知する。
+         処理が追いつかない間に進んだ tick はまとめて 1 回にする（シミュレーションを待たせない）。
+  free : wall-clock の一定周期で起床する（リプレイ・シミュレータなしの実行用）。
+         起床予定時刻を累積で決めるため、処理時間で周期がずれない。
+         speed を指定すると実時間の speed 倍で進む（周期 delta_time_usec / speed、時刻は delta_time_usec ずつ進む）。
+"""
+import asyncio
+import threading
+import time
+from typing import Optional
+
+SCHEDULER_MODES = ("sim", "free")
+
+
+def read_sim_time_usec(fallback_usec: int) -> int:
+    """箱庭のシミュレーション時刻[usec]。取得できない環境では tick 数から求めた値を使う。"""
+    try:
+        import hakopy
+        return int(hakopy.simulation_time())
+    except Exception:
+        return fallback_usec
+
+
+class TickJitter:
+    """起床間隔の統計（平均・標準偏差・最大）"""
+    def __init__(self):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.max_interval = 0.0
+        self._last: Optional[float] = None
+
+    def mark(self, now: float):
+        if self._last is not None:
+            dt = now - self._last
+            # Welford 法
+            self.count += 1
+            d = dt - self._mean
+            self._mean += d / self.count
+            self._m2 += d * (dt - self._mean)
+            self.max_interval = max(self.max_interval, dt)
+        self._last = now
+
+    def stats(self) -> dict:
+        std = (self._m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+        return {
+            "interval_mean_ms": round(self._mean * 1e3, 3),
+            "jitter_ms": round(std * 1e3, 3),
+            "interval_max_ms": round(self.max_interval * 1e3, 3),
+        }
+
+
+class TickScheduler:
+    def __init__(self, delta_time_usec: int, mode: str = "sim", speed: float = 1.0):
+        if mode not in SCHEDULER_MODES:
+            raise ValueError(f"unknown scheduler mode: {mode} (expected one of {SCHEDULER_MODES})")
+        if speed <= 0:
+            raise ValueError(f"scheduler speed must be positive: {speed}")
+        self.delta_time_usec = delta_time_usec
+        self.mode = mode
+        self.speed = speed
+        self.ticks = 0
+        self.coalesced = 0  # 追いつけずにまとめた sim tick 数
+        self.jitter = TickJitter()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._pending: Optional[int] = None
+        self._ended = False
+        self._thread: Optional[threading.Thread] = None
+        self._next_deadline = 0.0
+        self._free_time_usec = 0
+
+    def start(self, stop_event: asyncio.Event):
+        """イベントループのスレッドから呼ぶ"""
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._loop.create_task(self._watch_stop(stop_event))
+        if self.mode == "sim":
+            self._thread = threading.Thread(target=self._sim_clock_thread, name="SimClock", daemon=True)
+            self._thread.start()
+        else:
+            self._next_deadline = self._loop.time()
+        print(f"[Scheduler] mode={self.mode} delta_time_usec={self.delta_time_usec}"
+              + (f" speed={self.speed}x" if self.mode == "free" else ""))
+
+    async def _watch_stop(self, stop_event: asyncio.Event):
+        await stop_event.wait()
+        self._ended = True
+        self._event.set()
+
+    # --- sim モード ---
+    def _sim_clock_thread(self):
+        import hakopy
+        tick = 0
+        while not self._ended:
+            if not hakopy.usleep(self.delta_time_usec):
+                self._post(None)
+                return
+            tick += 1
+            self._post(read_sim_time_usec(tick * self.delta_time_usec))
+
+    def _post(self, sim_time_usec: Optional[int]):
+        try:
+            self._loop.call_soon_threadsafe(self._on_sim_tick, sim_time_usec)
+        except RuntimeError:
+            pass  # ループ終了後
+
+    def _on_sim_tick(self, sim_time_usec: Optional[int]):
+        if sim_time_usec is None:
+            self._ended = True
+        elif self._pending is not None:
+            self.coalesced += 1
+        if sim_time_usec is not None:
+            self._pending = sim_time_usec
+        self._event.set()
+
+    async def _next_sim_tick(self) -> Optional[int]:
+        while self._pending is None and not self._ended:
+            await self._event.wait()
+            self._event.clear()
+        if self._ended:
+            return None
+        sim_time_usec, self._pending = self._pending, None
+        return sim_time_usec
+
+    # --- free モード ---
+    async def _next_free_tick(self) -> Optional[int]:
+        period = self.delta_time_usec / 1e6 / self.speed
+        self._next_deadline += period
+        delay = self._next_deadline - self._loop.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # 1 周期以上遅れたら予定時刻を作り直す（遅れを取り戻すための連続実行をしない）
+            if -delay > period:
+                self._next_deadline = self._loop.time()
+            # 遅れていても RPC などの他のタスクに 1 回は処理を譲る
+            await asyncio.sleep(0)
+        if self._ended:
+            return None
+        self._free_time_usec += self.delta_time_usec
+        return self._free_time_usec
+
+    async def next_tick(self) -> Optional[int]:
+        """次の tick まで待ち、その時点のシミュレーション時刻[usec] を返す。終了時は None。"""
+        if self.mode == "sim":
+            sim_time_usec = await self._next_sim_tick()
+        else:
+            sim_time_usec = await self._next_free_tick()
+        if sim_time_usec is not None:
+            self.ticks += 1
+            self.jitter.mark(time.perf_counter())
+        return sim_time_usec
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "ticks": self.ticks, "coalesced": self.coalesced, **self.jitter.stats()}
@@ -8,13 +8,22 @@ from hakoniwa_panda3d_drone.core.camera import OrbitCamera
 from hakoniwa_panda3d_drone.core.light import LightRig
 import panda3d
 import json
+from contextlib import contextmanager
 from pathlib import Path
-from panda3d.core import Camera, NodePath, PerspectiveLens, DisplayRegion, LineSegs
+from panda3d.core import Camera, NodePath, PerspectiveLens, DisplayRegion, LineSegs, ClockObject
 from hakoniwa_panda3d_drone.core.attach_camera import AttachCamera
-from hakoniwa_panda3d_drone.core.environment import EnvironmentEntity
+from hakoniwa_panda3d_drone.core.image_encoder import CapturedFrame, encode_image, is_depth_format
+from hakoniwa_panda3d_drone.core.scene_loader import EnvironmentLoader
+from hakoniwa_panda3d_drone.core.model_registry import ModelRegistry
+from hakoniwa_panda3d_drone.core.drone_registry import DroneRegistry
+from hakoniwa_panda3d_drone.core.rotor_spin import REQUIRED_GLSL_VERSION, driver_glsl_version, shader_spin_supported
+from hakoniwa_panda3d_drone.core.headless import FrameLimiter, configure_headless
+from hakoniwa_panda3d_drone.core.frame_ring import FrameRingWriter, default_ring_path
+from hakoniwa_panda3d_drone.core.metrics import configure_metrics, stop_metrics_dump, add_rates, format_overlay
 from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
 
 import sys
+import time
 import argparse
 
 print(f"--- Running Panda3D Version: {panda3d.__version__} ---")
@@ -26,12 +35,12 @@ class App(ShowBase):
         for drone_cfg in config['drones']:
             droen_name = drone_cfg.get('name', 'Drone')
             print(f"[Visualizer] Building drone model: {droen_name}")
-            drone_model = self._create_entity_from_config(drone_cfg, copy=True)
+            drone_model = self._create_entity_from_config(drone_cfg)
             drone_model.set_purpose('drone')
 
             if 'rotors' in drone_cfg:
                 for child_config in drone_cfg['rotors']:
-                    child_entity = self._create_entity_from_config(child_config, copy=True)
+                    child_entity = self._create_entity_from_config(child_config)
                     child_entity.set_purpose('rotor')
                     drone_model.add_child(child_entity)
 
@@ -49,8 +58,10 @@ class App(ShowBase):
                     far=cam_config.get('far', 1000.0),
                     background_color=self.background_color,
                     model_config=cam_config.get('model', None),
+                    model_registry=self.model_registry,
+                    capture_pool_size=cam_config.get('capture_pool_size', 2),
                 )
-                if 'window' in cam_config:
+                if 'window' in cam_config and not self.headless:
                     attach_cam.set_display_region(
                         win=self.win,
                         sort=cam_config.get('sort', 20),
@@ -65,13 +76,36 @@ class App(ShowBase):
                 attach_cam.set_hpr(*hpr)
                 if self.drone_cam is None or self.drone_cam.get(droen_name) is None:
                     self.drone_cam[droen_name] = attach_cam
+                self.drone_cams.setdefault(droen_name, {})[attach_cam.name] = attach_cam
                 drone_model.add_child(attach_cam)
+
+                # 共有メモリへの連続ストリーミング（任意）
+                stream_cfg = cam_config.get('stream')
+                if stream_cfg and stream_cfg.get('enabled', True):
+                    self._start_camera_stream(droen_name, attach_cam, stream_cfg)
             drone_models.append(drone_model)
+            self.drone_registry.add(drone_model)
 
         self.drone_models = drone_models
 
-    def __init__(self, drone_config_path: str):
-        super().__init__()
+    def __init__(self, drone_config_path: str, headless: bool = False):
+        # 起動からの時間（最初のフレーム・最初の姿勢適用までをログに出す）
+        self.startup_time = time.monotonic()
+        self._first_pose_applied = False
+        self.drone_config_path = drone_config_path
+        with open(drone_config_path, 'r') as f:
+            config = json.load(f)
+        metrics_cfg = config.get('metrics', {})
+        self.metrics = configure_metrics(metrics_cfg)
+        self.metrics_text = None
+        self._metrics_prev = None
+
+        # ヘッドレス: ウィンドウ・UI テキスト・オービットカメラなしでキャプチャとストリーミングだけ行う
+        self.headless = headless
+        headless_cfg = config.get('headless', {})
+        if headless:
+            configure_headless(headless_cfg.get('pipe', 'auto'))
+        super().__init__(windowType='offscreen' if headless else None)
         self.disableMouse()
 
         self.background_color = (0.7, 0.7, 0.7, 1)
@@ -80,33 +114,59 @@ class App(ShowBase):
         self.set_background_color(*self.background_color)
         self.render.setShaderAuto()
 
-        self.drone_config_path = drone_config_path
-        with open(drone_config_path, 'r') as f:
-            config = json.load(f)
-
         self.drone_cam = {}
+        # ドローン名 -> 描画ノード（ローター一覧は事前に作る）
+        self.drone_registry = DroneRegistry()
+        # ドローンごとの全カメラ（カメラ名 -> AttachCamera）。drone_cam は先頭のカメラ
+        self.drone_cams: dict[str, dict[str, AttachCamera]] = {}
+        self.streaming_cams: list[AttachCamera] = []
+        # 箱庭のシミュレーション時刻（hako_asset から更新される）
+        self.sim_time_usec = 0
+        # 同一モデル（ローター等）は 1 回だけロードしてインスタンス共有する
+        self.model_registry = ModelRegistry(self.loader)
+        # ローター回転: "shader"（GPU で角度を計算）/ "cpu"（毎フレーム setH）
+        rotor_spin = config.get('rotor_spin', 'shader')
+        if rotor_spin == 'shader' and shader_spin_supported(self.win):
+            self.drone_registry.enable_shader_spin()
+        elif rotor_spin == 'shader':
+            major, minor = driver_glsl_version(self.win)
+            print(f"[Visualizer] GLSL {REQUIRED_GLSL_VERSION[0]}.{REQUIRED_GLSL_VERSION[1]} is not available "
+                  f"(driver supports {major}.{minor}); rotors are spun on the CPU")
         self.build_drone_model(config)
+        print(f"[Visualizer] Shared models: {len(self.model_registry)} loaded, {self.model_registry.hits} instanced from cache")
 
         # --- 照明セットアップ（先に設定） ---
         self.lights = LightRig(self.render, shadows=False)
 
-        self.envs = []
-        for env_config in config.get('environments', []):
-            env = EnvironmentEntity(
-                render=self.render,
-                name=env_config.get('name', 'environment'),
-                model_path=env_config['model'],
-                pos=env_config.get('pos'),
-                hpr=env_config.get('hpr'),
-                scale=env_config.get('scale', 1.0),
-                cache=env_config.get('cache', False),
-                copy=env_config.get('copy', False),
-                loader=self.loader,
-            )
-            self.envs.append(env)
+        # --- 環境はバックグラウンドで読み込み、できたものから render に付ける ---
+        loading_cfg = config.get('loading', {})
+        self.load_text = None
+        self.env_loader = EnvironmentLoader(
+            self.render, self.loader, self.taskMgr, config.get('environments', []),
+            async_load=loading_cfg.get('async', True),
+            max_workers=loading_cfg.get('workers', 1),
+        )
+        self.envs = self.env_loader.envs
+        if not self.env_loader.async_load:
+            self.env_loader.start()
+        if not self.env_loader.ready:
+            self.taskMgr.add(self._env_loader_task, "env_loader_task", sort=10)
 
         sys.stdout.flush()
 
+        # 描画（igLoop, sort=50）の後にストリーム画像を書き出す
+        self.taskMgr.add(self._camera_stream_task, "camera_stream_task", sort=60)
+        self.taskMgr.add(self._first_frame_task, "first_frame_task", sort=55)
+        if self.metrics.enabled:
+            # igLoop（sort=50）の前後で描画時間を測る
+            self._render_t0 = 0
+            self.taskMgr.add(self._render_begin_task, "metrics_render_begin", sort=49)
+            self.taskMgr.add(self._render_end_task, "metrics_render_end", sort=51)
+        self.active_drone = "Drone"
+        if headless:
+            self._setup_headless(headless_cfg)
+            return
+
         # --- ここからカメラ ---
         target = Point3(self.drone_models[0].np.getPos(self.render))
         self.cam_ctrl = OrbitCamera(
@@ -128,8 +188,125 @@ class App(ShowBase):
             scale=0.05, fg=(1, 1, 1, 1), align=TextNode.ARight, mayChange=True
         )
         self.taskMgr.add(self.update_text, "update_text_task")
-        self.active_drone = "Drone"
+        # 環境の読み込み進捗（左上。読み込み完了で消す）
+        if not self.env_loader.ready:
+            self.load_text = OnscreenText(
+                text=self.env_loader.status_text(), pos=(-1.3, 0.92),
+                scale=0.05, fg=(1, 1, 1, 1), align=TextNode.ALeft, mayChange=True
+            )
         self.accept("s", lambda: self.snapshot_attach_camera(self.active_drone, "cam.png"))
+        # 計測値のオーバーレイ（左下。キーで表示を切り替え）
+        if self.metrics.enabled:
+            self.accept(metrics_cfg.get('overlay_key', 'm'), self.toggle_metrics_overlay)
+
+    def _setup_headless(self, headless_cfg: dict):
+        """
+        メインのオフスクリーンバッファは描画しない（GSG の持ち主としてだけ残す）。
+        キャプチャ・ストリーム用のバッファは個別にアクティブになるのでそのまま動く。
+        表示の同期がないため、igLoop が空回りしないようフレームレートを制限する
+        （キャプチャの render_frame() は待たせないよう、時計ではなくループ最後のタスクで sleep する）。
+        """
+        self.win.setActive(False)
+        frame_rate = headless_cfg.get('frame_rate', 60)
+        if frame_rate:
+            self.frame_limiter = FrameLimiter(frame_rate)
+            self.taskMgr.add(self.frame_limiter.task, "frame_limit_task", sort=1000)
+        gsg = self.win.getGsg()
+        print(f"[Visualizer] Headless: {self.pipe.getType().getName()} / {gsg.getDriverRenderer() or gsg.getType().getName()}, "
+              f"frame_rate={frame_rate or 'unlimited'}")
+
+    @property
+    def scene_ready(self) -> bool:
+        """環境の読み込みが終わったか（キャプチャ RPC はそれまで受け付けない）"""
+        return self.env_loader.ready
+
+    def scene_status(self) -> str:
+        done, total = self.env_loader.progress()
+        return f"environments loaded {done}/{total}"
+
+    def _env_loader_task(self, task):
+        ready = self.env_loader.poll()
+        if self.load_text is not None:
+            if ready:
+                self.load_text.destroy()
+                self.load_text = None
+            else:
+                self.load_text.setText(self.env_loader.status_text())
+        return task.done if ready else task.cont
+
+    def _render_begin_task(self, task):
+        self._render_t0 = self.metrics.start()
+        return task.cont
+
+    def _render_end_task(self, task):
+        self.metrics.observe("render_frame", self._render_t0)
+        self.metrics.observe_us("frame_interval", ClockObject.getGlobalClock().getDt() * 1e6)
+        return task.cont
+
+    def toggle_metrics_overlay(self):
+        if self.metrics_text is not None:
+            self.taskMgr.remove("metrics_overlay_task")
+            self.metrics_text.destroy()
+            self.metrics_text = None
+            return
+        font = self.loader.loadFont("cmtt12", okMissing=True)
+        self.metrics_text = OnscreenText(
+            text="", pos=(-1.3, -0.3), scale=0.04, fg=(1, 1, 1, 1), bg=(0, 0, 0, 0.5),
+            align=TextNode.ALeft, mayChange=True, font=font,
+        )
+        self.taskMgr.doMethodLater(0.0, self._metrics_overlay_task, "metrics_overlay_task")
+
+    def _metrics_overlay_task(self, task):
+        snap = add_rates(self.metrics.snapshot(), self._metrics_prev)
+        self._metrics_prev = snap
+        self.metrics_text.setText(format_overlay(snap))
+        task.delayTime = 0.5
+        return task.again
+
+    def _first_frame_task(self, task):
+        print(f"[Visualizer] Time to first frame: {(time.monotonic() - self.startup_time) * 1000:.0f} ms")
+        # 最初のフレーム（シェーダー生成などを含む）を描き終えてから環境の読み込みを始める
+        if self.env_loader.async_load:
+            self.env_loader.start()
+        return task.done
+
+    def _start_camera_stream(self, drone_name: str, cam: AttachCamera, stream_cfg: dict):
+        w = stream_cfg.get('width', 640)
+        h = stream_cfg.get('height', 480)
+        path = stream_cfg.get('path') or default_ring_path(f"{drone_name}_{cam.name}")
+        writer = FrameRingWriter(path, w, h, channels=3, slot_count=stream_cfg.get('slots', 4))
+        cam.start_stream(self, writer, w, h, every_n_frames=stream_cfg.get('every_n_frames', 1))
+        self.streaming_cams.append(cam)
+        print(f"[Visualizer] Streaming {drone_name}/{cam.name} {w}x{h} -> {path}")
+
+    def _camera_stream_task(self, task):
+        for cam in self.streaming_cams:
+            cam.stream_frame(self.sim_time_usec)
+        return task.cont
+
+    def close(self):
+        """終了処理（読み込み中の環境は破棄し、ストリームとキャプチャ用バッファを解放する）"""
+        self.env_loader.shutdown()
+        self.stop_streams()
+        stop_metrics_dump()
+
+    def stop_streams(self):
+        for cam in self.streaming_cams:
+            cam.stop_stream(self)
+        self.streaming_cams = []
+        for cams in self.drone_cams.values():
+            for cam in cams.values():
+                cam.release_capture_targets(self)
+
+    @contextmanager
+    def streams_suspended(self):
+        """キャプチャ用の render_frame() でストリーム用バッファを描画しない（次のメインループの描画で従来どおり更新される）"""
+        streams = [(cam, cam.suspend_stream()) for cam in self.streaming_cams]
+        try:
+            yield
+        finally:
+            for cam, active in streams:
+                cam.resume_stream(active)
 
     def snapshot_attach_camera(self, drone_name: str, path: str, w: int = 1280, h: int = 720):
         from direct.task import Task
@@ -139,7 +316,8 @@ class App(ShowBase):
                 print(f"[snapshot] ERROR: camera for {drone_name} not found")
                 return Task.done
 
-            png = cam.capture_png_bytes(self, w, h)
+            with self.streams_suspended():
+                png = cam.capture_png_bytes(self, w, h)
             with open(path, "wb") as f:
                 f.write(png)
             print(f"[snapshot] saved: {path}")
@@ -148,23 +326,124 @@ class App(ShowBase):
         self.taskMgr.add(_do, "snapshot_once")
 
 
-    def capture_camera(self, drone_name: str, image_type: str, w: int = 1280, h: int = 720) -> bytes:
+    def get_attach_camera(self, drone_name: str, camera_name: str = None) -> AttachCamera:
+        cam = (self.drone_cam.get(drone_name) if camera_name is None
+               else self.drone_cams.get(drone_name, {}).get(camera_name))
+        if cam is None:
+            target = drone_name if camera_name is None else f"{drone_name}/{camera_name}"
+            raise RuntimeError(f"Attached camera is not found: {target}")
+        return cam
+
+    def capture_camera_frames(self, entries, pose_history=None) -> list:
+        """
+        複数カメラをまとめてキャプチャする（entries は CaptureEntry のリスト）。
+        同じ時刻を指定したエントリごとに、対象のバッファだけをアクティブにして render_frame() を 1 回
+        （新規バッファがあれば 2 回）行うため、同じ時刻の画像は同じ姿勢・同じフレームのものになる。
+        時刻を指定したエントリは pose_history から補間した姿勢に全ドローンを一時的に戻して描画する。
+        戻り値は entries と同じ順の (実際に使った sim_time_usec, CapturedFrame)、失敗した要素のフレームは例外オブジェクト。
         """
-        カメラ画像をバイト列で取得。
-        image_type: "png" | "jpeg" などを想定
+        groups: dict = {}
+        for i, e in enumerate(entries):
+            groups.setdefault(e.sim_time_usec, []).append(i)
+
+        results: list = [None] * len(entries)
+        for when, indices in groups.items():
+            if when is None:
+                used = {i: self.sim_time_usec for i in indices}
+                frames = self._render_captures([entries[i] for i in indices])
+                for i, frame in zip(indices, frames):
+                    results[i] = (used[i], frame)
+                continue
+
+            saved = []
+            try:
+                used = self._apply_history_poses(pose_history, when, saved)
+                targets = []
+                for i in indices:
+                    if entries[i].drone_name in used:
+                        targets.append(i)
+                    else:
+                        results[i] = (when, ValueError(f"sim time {when} is not in pose history of {entries[i].drone_name}"))
+                frames = self._render_captures([entries[i] for i in targets])
+            except Exception as ex:
+                for i in indices:
+                    results[i] = (when, ex)
+                continue
+            finally:
+                for model, pos, hpr in saved:
+                    model.np.setPosHpr(pos, hpr)
+            for i, frame in zip(targets, frames):
+                results[i] = (used[entries[i].drone_name], frame)
+        return results
+
+    def _apply_history_poses(self, pose_history, sim_time_usec: int, saved: list) -> dict:
+        """
+        全ドローンを指定時刻の姿勢にする（元の姿勢は saved に積む）。
+        戻り値はドローン名 -> 実際に使った時刻（最新より後の時刻は最新に丸められる）。
+        """
+        if pose_history is None:
+            raise RuntimeError("pose history is not available")
+        used = {}
+        for model in self.drone_models:
+            pose = pose_history.sample(model.name, sim_time_usec)
+            if pose is None:
+                continue
+            saved.append((model, model.np.getPos(), model.np.getHpr()))
+            model.np.setPosHpr(pose.pos, pose.hpr)
+            used[model.name] = pose.sim_time_usec
+        return used
+
+    def _render_captures(self, entries) -> list:
+        """entries のバッファだけを 1 回の描画で更新して読み戻す（失敗した要素は例外オブジェクト）"""
+        pending = []
+        results: list = [None] * len(entries)
+        try:
+            for i, e in enumerate(entries):
+                try:
+                    cam = self.get_attach_camera(e.drone_name, e.camera_name)
+                    depth = is_depth_format(e.image_type)
+                    pending.append((i, cam, cam.begin_capture(self, e.width, e.height, depth), depth))
+                except Exception as ex:
+                    results[i] = ex
+
+            if pending:
+                with self.streams_suspended(), self.metrics.span("capture_render"):
+                    self.graphicsEngine.render_frame()
+                    if not all(target.initialized for _, _, target, _ in pending):
+                        self.graphicsEngine.render_frame()
+                for _, _, target, _ in pending:
+                    target.initialized = True
+        finally:
+            for _, _, target, _ in pending:
+                target.deactivate()
+
+        t0 = self.metrics.start()
+        for i, cam, target, depth in pending:
+            try:
+                results[i] = cam.finish_capture(self, target, depth)
+            except Exception as ex:
+                results[i] = ex
+        self.metrics.observe("capture_readback", t0)
+        return results
+
+    def capture_camera_frame(self, drone_name: str, w: int = 1280, h: int = 720, image_type: str = "png") -> CapturedFrame:
+        """
+        カメラ画像を描画して生データを読み戻す（エンコードは呼び出し側で別スレッドに任せる）。
+        image_type が depth16/depth32 の場合は深度バッファを返す。
         """
         if self.drone_cam is None or self.drone_cam.get(drone_name) is None:
-            # 空画像を返す／例外を投げる等、方針に合わせて
             # ここでは例外で返して RPC 側でメッセージにするのがわかりやすい
             raise RuntimeError("Attached camera is not initialized")
+        with self.streams_suspended():
+            return self.drone_cam[drone_name].capture_frame(self, w, h, depth=is_depth_format(image_type))
 
-        # AttachCamera 側に jpeg 版があるなら使う。なければ png を共通化でもOK
-        itype = (image_type or "png").lower()
-        if itype in ("jpg", "jpeg") and hasattr(self.drone_cam, "capture_jpeg_bytes"):
-            return self.drone_cam[drone_name].capture_jpeg_bytes(self, w, h)
-
-        # 既存の png をデフォルトに
-        return self.drone_cam[drone_name].capture_png_bytes(self, w, h)
+    def capture_camera(self, drone_name: str, image_type: str, w: int = 1280, h: int = 720) -> bytes:
+        """
+        カメラ画像をバイト列で取得（同期エンコード版）。
+        image_type: "png" | "jpeg[:quality]" | "raw_rgb" | "depth16" | "depth32"
+        """
+        frame = self.capture_camera_frame(drone_name, w, h, image_type)
+        return encode_image(frame, image_type)
 
     def _resolve_model_path(self, path: str) -> str:
         p = Path(path)
@@ -175,9 +454,9 @@ class App(ShowBase):
         print(f"Resolved model path: {rp}")
         return rp
 
-    def _create_entity_from_config(self, config, copy=False):
+    def _create_entity_from_config(self, config):
         entity = RenderEntity(self.render, config['name'])
-        entity.load_model(self.loader, self._resolve_model_path(config['model']), copy=copy)
+        entity.instance_model(self.model_registry, self._resolve_model_path(config['model']))
         if 'pos' in config:
             entity.set_pos(*config['pos'])
         if 'hpr' in config:
@@ -185,28 +464,34 @@ class App(ShowBase):
         return entity
 
     def set_pose_and_rotation(self, drone_name: str, pos: Vec3, hpr: Vec3, rotation_speed: float = 1.0):
-        for drone_model in self.drone_models:
-            if drone_model.name == drone_name:
-                drone_model.set_pos(x=pos.x, y=pos.y, z=pos.z)
-                drone_model.set_hpr(h=hpr.x, p=hpr.y, r=hpr.z)
-                index = 0
-                for rotor in drone_model.children:
-                    if rotor.purpose != 'rotor':
-                        continue
-                    if index % 2 == 0:
-                        rotor.rotate_child_yaw(-rotation_speed)
-                    else:
-                        rotor.rotate_child_yaw(rotation_speed)
-                    index += 1
+        handle = self.drone_registry.get(drone_name)
+        if handle is None:
+            return
+        handle.np.setPosHpr(pos, hpr)
+        handle.spin_rotors(rotation_speed)
+
+    def apply_poses(self, names, positions, hprs, rotor_speeds=None) -> int:
+        """
+        複数ドローンの姿勢を一括で適用する（positions/hprs は (N,3)、rotor_speeds は (N,)[deg/s]）。
+        ROS 座標系の値からは Frame.to_panda3d_array で変換してから渡す。
+        """
+        applied = self.drone_registry.apply_poses(names, positions, hprs, rotor_speeds)
+        if applied and not self._first_pose_applied:
+            self._first_pose_applied = True
+            print(f"[Visualizer] Time to first pose applied: {(time.monotonic() - self.startup_time) * 1000:.0f} ms")
+        return applied
 
     def update_game_controller_ui(self, drone_name: str, game_ctrl: GameControllerOperation):
+        #up down drone camera pitch based on buttons: up=11, down=12
+        self.update_camera_pitch(drone_name, game_ctrl.button[11], game_ctrl.button[12])
+        #print(f"Game Controller State: {drone_name} {game_ctrl}")
+
+    def update_camera_pitch(self, drone_name: str, up: bool, down: bool):
         if self.drone_cam is not None and self.drone_cam.get(drone_name) is not None:
-            #up down drone camera pitch based on buttons: up=11, down=12
-            if game_ctrl.button[11]:
+            if up:
                 self.drone_cam[drone_name].rotate_pitch(1.0)
-            if game_ctrl.button[12]:
+            if down:
                 self.drone_cam[drone_name].rotate_pitch(-1.0)
-        #print(f"Game Controller State: {drone_name} {game_ctrl}")
 
 
     def update_text(self, task):
@@ -223,6 +508,11 @@ if __name__ == "__main__":
         default="../drone_config/drone_config-1.json",
         help="Path to the drone configuration JSON file."
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Render offscreen without a window (capture/streaming only)."
+    )
     args = parser.parse_args()
     
     # Resolve the path relative to the current working directory if it's not absolute
@@ -235,4 +525,8 @@ if __name__ == "__main__":
         print(f"Error: Configuration file not found at {config_path}")
         sys.exit(1)
 
-    App(str(config_path)).run()
\ No newline at end of file
+    app = App(str(config_path), headless=args.headless)
+    try:
+        app.run()
+    finally:
+        app.close()
\ No newline at end of file
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+CameraCaptureImage レスポンスのシリアライズ性能を比較するベンチマーク。
+
+  before: res.data = list(image_bytes) + 汎用コンバータ
+  after : res.data = image_bytes       + pdu_codec.encode_camera_capture_response_packet
+
+各ケースは別プロセスで実行し、スループット[MB/s]とピーク RSS[MB] を表示する。
+hakopy / 箱庭コンダクタは不要（hakoniwa_pdu のみ使用）。
+
+使い方:
+    python work/bench_capture_payload.py [--repeat 10]
+"""
+import sys
+import time
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS は byte 単位
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def _make_payload(w: int, h: int) -> bytes:
+    # ノイズ画像の PNG はほぼ無圧縮で、数 MB の最悪ケースになる
+    import numpy as np
+    from hakoniwa_panda3d_drone.core.image_encoder import CapturedFrame, encode_png
+    rgb = np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)
+    return encode_png(CapturedFrame(rgb.tobytes(), w, h, 3), level=1)
+
+
+def run_case(mode: str, res_name: str, repeat: int):
+    from hakoniwa_pdu.pdu_msgs.drone_srv_msgs.pdu_pytype_CameraCaptureImageResponsePacket import CameraCaptureImageResponsePacket
+    from hakoniwa_pdu.pdu_msgs.drone_srv_msgs.pdu_conv_CameraCaptureImageResponsePacket import (
+        py_to_pdu_CameraCaptureImageResponsePacket, pdu_to_py_CameraCaptureImageResponsePacket,
+    )
+    from hakoniwa_panda3d_drone.pdu_codec import encode_camera_capture_response_packet
+
+    w, h = RESOLUTIONS[res_name]
+    image_bytes = _make_payload(w, h)
+    base_rss = _peak_rss_mb()
+
+    packet = CameraCaptureImageResponsePacket()
+    packet.body.ok = True
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        if mode == "before":
+            packet.body.data = list(image_bytes)
+            pdu = py_to_pdu_CameraCaptureImageResponsePacket(packet)
+        else:
+            packet.body.data = image_bytes
+            pdu = encode_camera_capture_response_packet(packet)
+    elapsed = time.perf_counter() - t0
+    peak_rss = _peak_rss_mb()
+
+    # 生成した PDU が汎用デコーダで正しく読めることを確認（計測後に行う）
+    decoded = pdu_to_py_CameraCaptureImageResponsePacket(pdu)
+    assert bytes(decoded.body.data) == image_bytes
+
+    mb = len(image_bytes) * repeat / (1024.0 * 1024.0)
+    print(f"{mode:6s} {res_name:5s} payload={len(image_bytes)/1e6:6.2f}MB "
+          f"throughput={mb/elapsed:9.1f}MB/s  per_capture={elapsed/repeat*1e3:8.2f}ms  "
+          f"peak_rss={peak_rss:7.1f}MB (+{peak_rss-base_rss:.1f}MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture response payload benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--case", nargs=2, metavar=("MODE", "RES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case[0], args.case[1], args.repeat)
+        return 0
+
+    for res_name in RESOLUTIONS:
+        for mode in ("before", "after"):
+            subprocess.run([sys.executable, __file__, "--repeat", str(args.repeat), "--case", mode, res_name],
+                           check=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
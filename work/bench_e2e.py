@@ -0,0 +1,310 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Visualizer の end-to-end ベンチマーク（箱庭コンダクタ・hakopy なしで実行できる）。
+
+core/synthetic_pdu.py の合成 PDU を hako_asset の env_control_loop に流し、ヘッドレスの App で描画しながら
+カメラキャプチャ RPC のハンドラ（handle_camera_capture）を指定の並列数で呼び続ける。
+RPC の通信路（共有メモリ）は通さず、ハンドラを直接 await する。
+
+drone config の最初のドローンを --drones 個に複製し（名前は Drone, Drone1, Drone2, ...）、
+scheduler は free モード（--speed 倍速）、metrics は有効にして実行する。
+ウォームアップ後の --duration 秒間について、tick/s・描画 fps・キャプチャ/s と各処理段の分位点を出す。
+
+使い方:
+    python work/bench_e2e.py --config drone_config/drone_config-1.json --drones 8 --duration 10 \\
+        --capture-concurrency 2 --image-type jpeg@640x480 --json out/bench.json
+    # 前回の結果と比べ、tolerance を超えて悪化していたら終了コード 1
+    # （キャプチャの描画が描画フレームレートの周期に引きずられている場合も終了コード 1）
+    python work/bench_e2e.py --config ... --baseline out/bench.json --tolerance 0.15
+"""
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from hakoniwa_pdu.pdu_msgs.drone_srv_msgs.pdu_pytype_CameraCaptureImageRequest import CameraCaptureImageRequest
+from hakoniwa_panda3d_drone import hako_asset
+from hakoniwa_panda3d_drone.visualizer import App
+from hakoniwa_panda3d_drone.core.metrics import add_rates, format_overlay
+from hakoniwa_panda3d_drone.core.synthetic_pdu import SyntheticPduManager, TRAJECTORIES
+
+# 大きいほど良い値 / 小さいほど良い値（baseline との比較に使う。後者は各処理段の p99）
+HIGHER_IS_BETTER = ("ticks_per_sec", "frames_per_sec", "captures_per_sec")
+LOWER_IS_BETTER_STAGES = ("tick", "pdu_read", "pdu_decode", "pose_age", "display_lag", "scene_update",
+                          "render_frame", "rpc_capture")
+
+
+def build_config(src_path: str, drones: int, frame_rate, speed: float) -> dict:
+    with open(src_path, 'r') as f:
+        cfg = json.load(f)
+    base = cfg['drones'][0]
+    base_name = base.get('name', 'Drone')
+    cfg['drones'] = []
+    for i in range(drones):
+        drone = copy.deepcopy(base)
+        drone['name'] = base_name if i == 0 else f"{base_name}{i}"
+        # 映像ストリームの出力先が重ならないようにする
+        for cam in drone.get('cameras', []):
+            stream = cam.get('stream')
+            if i > 0 and stream and stream.get('path'):
+                p = Path(stream['path'])
+                stream['path'] = str(p.with_name(f"{p.stem}_{drone['name']}{p.suffix}"))
+        cfg['drones'].append(drone)
+    headless_cfg = cfg.setdefault('headless', {})
+    if frame_rate is not None:
+        headless_cfg['frame_rate'] = frame_rate
+    cfg['scheduler'] = {"mode": "free", "speed": speed}
+    cfg['metrics'] = {"enabled": True}
+    # 環境は同期ロードにして、計測区間に読み込みを含めない
+    cfg['loading'] = {"async": False}
+    return cfg
+
+
+class CaptureLoad:
+    """handle_camera_capture を concurrency 本並列で呼び続ける"""
+    def __init__(self, drone_names, image_type: str, concurrency: int):
+        self.drone_names = drone_names
+        self.image_type = image_type
+        self.concurrency = concurrency
+        self.ok = 0
+        self.errors = 0
+        self.last_error = ""
+
+    async def run(self, stop_event: asyncio.Event):
+        if self.concurrency <= 0:
+            return
+        while not stop_event.is_set():
+            runner = hako_asset.visualizer_runner
+            if runner is not None and runner.scene_ready:
+                break
+            await asyncio.sleep(0.05)
+        workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        await stop_event.wait()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, index: int):
+        i = index
+        while True:
+            req = CameraCaptureImageRequest()
+            req.drone_name = self.drone_names[i % len(self.drone_names)]
+            req.image_type = self.image_type
+            i += self.concurrency
+            res = await hako_asset.handle_camera_capture(req)
+            if res.ok:
+                self.ok += 1
+            else:
+                self.errors += 1
+                self.last_error = res.message
+
+
+class Measurement:
+    """ウォームアップ後に計測値をリセットし、duration 秒後に結果を取って Panda3D を止める（Panda3D のタスク）"""
+    def __init__(self, app: App, pdu: SyntheticPduManager, load: CaptureLoad, warmup: float, duration: float):
+        self.app = app
+        self.pdu = pdu
+        self.load = load
+        self.warmup = warmup
+        self.duration = duration
+        self.t_ready = None
+        self.t_start = None
+        self.start_counts = None
+        self.frames = 0
+        self.result = None
+
+    def _counts(self):
+        # 描画フレーム数はこのタスクの実行回数で数える（キャプチャの描画は含めない）
+        return (hako_asset.tick_scheduler.ticks, self.frames,
+                self.load.ok, self.load.errors, self.pdu.step)
+
+    def task(self, task):
+        now = time.monotonic()
+        self.frames += 1
+        if self.t_ready is None:
+            if self.app.scene_ready and hako_asset.tick_scheduler.ticks > 0:
+                self.t_ready = now
+            return task.cont
+        if self.t_start is None:
+            if now - self.t_ready >= self.warmup:
+                hako_asset.metrics.reset()
+                self.t_start = now
+                self.start_counts = self._counts()
+            return task.cont
+        elapsed = now - self.t_start
+        if elapsed >= self.duration:
+            ticks, frames, ok, errors, steps = (b - a for a, b in zip(self.start_counts, self._counts()))
+            self.result = dict(elapsed_sec=elapsed, ticks=ticks, frames=frames, captures=ok,
+                               capture_errors=errors, sim_sec=steps * self.pdu.delta_time_usec / 1e6,
+                               snapshot=add_rates(hako_asset.metrics.snapshot(), None))
+            self.app.taskMgr.stop()
+            return task.done
+        return task.cont
+
+
+def make_report(args, m: Measurement, delta_time_usec: int) -> dict:
+    r = m.result
+    sec = r['elapsed_sec']
+    stages = {name: {k: h[k] for k in ("count", "p50_ms", "p90_ms", "p99_ms", "max_ms")}
+              for name, h in r['snapshot']['histograms'].items()}
+    return {
+        "params": {
+            "drones": args.drones, "duration": args.duration, "delta_msec": args.delta_msec,
+            "speed": args.speed, "trajectory": args.trajectory, "frame_rate": args.frame_rate,
+            "capture_concurrency": args.capture_concurrency, "image_type": args.image_type,
+        },
+        "elapsed_sec": round(sec, 3),
+        "ticks_per_sec": round(r['ticks'] / sec, 2),
+        "target_ticks_per_sec": round(1e6 / delta_time_usec * args.speed, 2),
+        "sim_speed": round(r['sim_sec'] / sec, 3),
+        "frames_per_sec": round(r['frames'] / sec, 2),
+        "captures_per_sec": round(r['captures'] / sec, 2),
+        "capture_errors": r['capture_errors'],
+        "stages": stages,
+        "gauges": r['snapshot']['gauges'],
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """tolerance（割合）を超えて悪化した項目の説明のリスト"""
+    regressions = []
+    for key in HIGHER_IS_BETTER:
+        old, new = baseline.get(key), report.get(key)
+        if old and new is not None and new < old * (1.0 - tolerance):
+            regressions.append(f"{key}: {old} -> {new}")
+    for name in LOWER_IS_BETTER_STAGES:
+        old = baseline.get("stages", {}).get(name, {}).get("p99_ms")
+        new = report["stages"].get(name, {}).get("p99_ms")
+        # 0.1ms 未満の差は揺らぎとして扱う
+        if old is not None and new is not None and new > old * (1.0 + tolerance) and new - old > 0.1:
+            regressions.append(f"{name} p99_ms: {old} -> {new}")
+    return regressions
+
+
+def check_capture_render(report: dict, frame_rate) -> list:
+    """
+    キャプチャの描画（capture_render）がフレームレート制限で待たされていないか。
+    p50 が 1 フレーム周期の 8 割以上なら、render_frame() がフレーム枠まで sleep しているとみなす。
+    """
+    stage = report["stages"].get("capture_render")
+    if not frame_rate or stage is None or stage["count"] == 0:
+        return []
+    period_ms = 1e3 / frame_rate
+    if stage["p50_ms"] >= 0.8 * period_ms:
+        return [f"capture_render p50_ms {stage['p50_ms']} follows the frame period {period_ms:.2f} ms "
+                f"(frame_rate {frame_rate})"]
+    return []
+
+
+def print_report(report: dict, snapshot: dict):
+    print("\n=== bench_e2e ===")
+    print(f"params       : {report['params']}")
+    print(f"ticks/s      : {report['ticks_per_sec']} (target {report['target_ticks_per_sec']}, "
+          f"sim speed {report['sim_speed']}x)")
+    print(f"frames/s     : {report['frames_per_sec']}")
+    print(f"captures/s   : {report['captures_per_sec']} (errors {report['capture_errors']})")
+    print(format_overlay(snapshot))
+
+
+def run(args, cfg: dict, cfg_path: str) -> int:
+    """合成 PDU・キャプチャ負荷・計測タスクを組み立てて App を動かし、結果を出す（終了コードを返す）"""
+    hako_asset.setup(cfg_path, args.delta_msec)
+    drone_names = [d['name'] for d in cfg['drones']]
+    pdu = SyntheticPduManager(drone_names, hako_asset.delta_time_usec, trajectory=args.trajectory)
+    hako_asset.server_pdu_manager = pdu
+    hako_asset.rpc_service_is_ready = True
+    hako_asset.hako_status.running = True
+    load = CaptureLoad(drone_names, args.image_type, args.capture_concurrency)
+
+    stop_event = asyncio.Event()
+    t_async = threading.Thread(
+        target=hako_asset.start_asyncio_runtime,
+        args=(hako_asset.async_loop_holder, stop_event, [hako_asset.env_control_loop, load.run]),
+        name="EnvControl+Load",
+        daemon=True,
+    )
+    t_async.start()
+
+    app = App(cfg_path, headless=True)
+
+    hako_asset.visualizer_runner = app
+    app.taskMgr.add(hako_asset.panda3d_ui_task, "ApplyUIUpdates")
+    measurement = Measurement(app, pdu, load, args.warmup, args.duration)
+    app.taskMgr.add(measurement.task, "BenchMeasurement", sort=60)
+    try:
+        app.run()
+    finally:
+        loop = hako_asset.async_loop_holder.get("loop")
+        if loop and loop.is_running():
+            loop.call_soon_threadsafe(stop_event.set)
+        t_async.join(timeout=3.0)
+        hako_asset.image_encoder.shutdown()
+        app.close()
+
+    if measurement.result is None:
+        print("[Bench] Measurement did not complete")
+        return 1
+    report = make_report(args, measurement, hako_asset.delta_time_usec)
+    print_report(report, measurement.result['snapshot'])
+    if load.errors:
+        print(f"[Bench] Last capture error: {load.last_error}")
+    problems = check_capture_render(report, cfg.get('headless', {}).get('frame_rate', 60))
+    for p in problems:
+        print(f"[Bench] {p}")
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Bench] Wrote {args.json}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[Bench] Regressions (tolerance {args.tolerance:.0%}):")
+            for r in regressions:
+                print(f"  {r}")
+            return 1
+        print(f"[Bench] No regressions against {args.baseline}")
+    return 1 if problems else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Visualizer end-to-end benchmark with synthetic PDUs")
+    parser.add_argument("--config", required=True, help="drone config（最初のドローンを複製して使う）")
+    parser.add_argument("--drones", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="計測時間[sec]")
+    parser.add_argument("--warmup", type=float, default=2.0, help="計測前の助走[sec]")
+    parser.add_argument("--delta-msec", type=int, default=20, help="tick 周期[msec]")
+    parser.add_argument("--speed", type=float, default=1.0, help="実時間の何倍で tick を進めるか")
+    parser.add_argument("--trajectory", choices=TRAJECTORIES, default="circle")
+    parser.add_argument("--frame-rate", type=float, default=None, help="描画 fps の上限（0 で無制限。既定は config のまま）")
+    parser.add_argument("--capture-concurrency", type=int, default=1, help="キャプチャ要求の並列数（0 で要求しない）")
+    parser.add_argument("--image-type", default="jpeg@640x480")
+    parser.add_argument("--json", help="結果を書き出す JSON ファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果（--json の出力）")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="悪化とみなす割合")
+    args = parser.parse_args()
+
+    cfg = build_config(args.config, args.drones, args.frame_rate, args.speed)
+    # モデルの相対パスが解決できるよう、元の config と同じディレクトリに置く
+    with tempfile.NamedTemporaryFile("w", suffix=".json", prefix=".bench_e2e_",
+                                     dir=str(Path(args.config).resolve().parent), delete=False) as f:
+        json.dump(cfg, f)
+        cfg_path = f.name
+    try:
+        return run(args, cfg, cfg_path)
+    finally:
+        Path(cfg_path).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
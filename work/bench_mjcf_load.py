@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+MJCF の建物読み込み性能の比較と検証。
+
+  dom      : ET.parse で DOM 全体を作り、.//geom を走査して建物ごとに float へ変換（従来の方式）
+  iterparse: mjcf_building.parse_buildings_mjcf（要素を読み捨てながら NumPy 配列へ集める）
+  npz      : mjcf_building.load_building_table のキャッシュヒット（.npz の読み込みのみ）
+
+合成した MJCF（建物 --buildings 棟）を使い、3 方式の結果が一致することを確認してから
+時間とピークメモリ（tracemalloc）を表示する。
+
+使い方:
+    python work/bench_mjcf_load.py [--buildings 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from hakoniwa_panda3d_drone.primitive.mjcf_building import (
+    parse_buildings_mjcf, load_building_table, building_cache_path,
+)
+
+
+def write_world(path: str, n: int, rng: np.random.Generator):
+    with open(path, "w") as f:
+        f.write("<mujoco>\n  <worldbody>\n")
+        f.write('    <geom name="floor" type="plane" size="0 0 .05"/>\n')
+        for i in range(n):
+            sx, sy, sz = rng.uniform(1, 20, 3)
+            x, y = rng.uniform(-5000, 5000, 2)
+            yaw = rng.uniform(-180, 180)
+            f.write(f'    <geom name="geom_bldg_{i:08d}" type="box" size="{sx:.6f} {sy:.6f} {sz:.6f}" '
+                    f'pos="{x:.6f} {y:.6f} {sz:.6f}" euler="0 0 {yaw:.6f}" rgba="0.82 0.82 0.86 1" '
+                    f'contype="1" conaffinity="0" />\n')
+        f.write("  </worldbody>\n</mujoco>\n")
+
+
+def parse_dom(path: str):
+    root = ET.parse(path).getroot()
+    rows = []
+    for geom in root.findall(".//geom"):
+        name = geom.get("name")
+        if name and name.startswith("geom_bldg_"):
+            s = [float(v) for v in geom.get("size").split()]
+            p = [float(v) for v in geom.get("pos").split()]
+            e = [float(v) for v in geom.get("euler").split()]
+            rows.append((name, (s[1] * 2, s[0] * 2, s[2] * 2), (p[1], -p[0], p[2]), (e[2], e[1], e[0])))
+    return rows
+
+
+def measure(fn, *args):
+    """時間は tracemalloc なしで測り、ピークメモリは別にもう 1 回実行して測る"""
+    t = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MJCF building loader benchmark")
+    parser.add_argument("--buildings", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "world.xml")
+        write_world(path, args.buildings, np.random.default_rng(0))
+        print(f"world: {args.buildings} buildings, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        dom, t_dom, m_dom = measure(parse_dom, path)
+        table, t_iter, m_iter = measure(parse_buildings_mjcf, path)
+        load_building_table(path)   # キャッシュを作る
+        cached, t_npz, m_npz = measure(load_building_table, path)
+        assert os.path.exists(building_cache_path(path))
+
+        names = [r[0] for r in dom]
+        for t in (table, cached):
+            assert list(t.names) == names
+            assert np.array_equal(t.size, np.array([r[1] for r in dom]))
+            assert np.array_equal(t.pos, np.array([r[2] for r in dom]))
+            assert np.array_equal(t.hpr, np.array([r[3] for r in dom]))
+        print("validated: iterparse / npz match the DOM parser")
+
+        for label, t, m in (("dom", t_dom, m_dom), ("iterparse", t_iter, m_iter), ("npz", t_npz, m_npz)):
+            print(f"{label:10s} {t * 1e3:9.1f} ms   peak {m:8.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
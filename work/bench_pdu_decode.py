@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+毎 tick 読む PDU（Twist / HakoHilActuatorControls / GameControllerOperation）のデコード性能の比較と検証。
+
+  generic: hakoniwa_pdu の pdu_to_py_* + Frame.to_panda3d
+  fast   : pdu_codec.decode_* + Frame.to_panda3d_values
+
+乱数で作った PDU を両方でデコードし、結果が一致することを確認してから時間を測る。
+hakopy / 箱庭コンダクタは不要（hakoniwa_pdu のみ使用）。
+
+使い方:
+    python work/bench_pdu_decode.py [--samples 200] [--repeat 20000]
+"""
+import sys
+import random
+import argparse
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_pytype_Twist import Twist
+from hakoniwa_pdu.pdu_msgs.geometry_msgs.pdu_conv_Twist import py_to_pdu_Twist, pdu_to_py_Twist
+from hakoniwa_pdu.pdu_msgs.hako_mavlink_msgs.pdu_pytype_HakoHilActuatorControls import HakoHilActuatorControls
+from hakoniwa_pdu.pdu_msgs.hako_mavlink_msgs.pdu_conv_HakoHilActuatorControls import (
+    py_to_pdu_HakoHilActuatorControls, pdu_to_py_HakoHilActuatorControls,
+)
+from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_pytype_GameControllerOperation import GameControllerOperation
+from hakoniwa_pdu.pdu_msgs.hako_msgs.pdu_conv_GameControllerOperation import (
+    py_to_pdu_GameControllerOperation, pdu_to_py_GameControllerOperation,
+)
+from hakoniwa_panda3d_drone.primitive.frame import Frame
+from hakoniwa_panda3d_drone.pdu_codec import decode_twist, decode_actuator_control0, decode_camera_pitch_buttons
+
+
+def make_samples(n: int, rng: random.Random):
+    samples = []
+    for _ in range(n):
+        twist = Twist()
+        for v in (twist.linear, twist.angular):
+            v.x, v.y, v.z = (rng.uniform(-100, 100) for _ in range(3))
+        act = HakoHilActuatorControls()
+        act.time_usec = rng.randrange(1 << 40)
+        act.controls = [rng.uniform(0, 1) for _ in range(16)]
+        act.mode = 1
+        game = GameControllerOperation()
+        game.axis = [rng.uniform(-1, 1) for _ in range(6)]
+        game.button = [rng.random() < 0.5 for _ in range(15)]
+        samples.append((py_to_pdu_Twist(twist), py_to_pdu_HakoHilActuatorControls(act),
+                        py_to_pdu_GameControllerOperation(game)))
+    return samples
+
+
+def decode_generic(raw_pose, raw_act, raw_game):
+    pos, hpr = Frame.to_panda3d(pdu_to_py_Twist(raw_pose))
+    rotor = pdu_to_py_HakoHilActuatorControls(raw_act).controls[0] * 400.0
+    game = pdu_to_py_GameControllerOperation(raw_game)
+    return pos, hpr, rotor, (game.button[11], game.button[12])
+
+
+def decode_fast(raw_pose, raw_act, raw_game):
+    pos, hpr = Frame.to_panda3d_values(*decode_twist(raw_pose))
+    rotor = decode_actuator_control0(raw_act) * 400.0
+    return pos, hpr, rotor, decode_camera_pitch_buttons(raw_game)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot PDU decode benchmark")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    samples = make_samples(args.samples, random.Random(0))
+    for s in samples:
+        g, f = decode_generic(*s), decode_fast(*s)
+        assert g[0] == f[0] and g[1] == f[1] and g[2] == f[2] and g[3] == f[3], (g, f)
+    print(f"validated {len(samples)} samples: fast decoder matches generic converters")
+
+    s = samples[0]
+    for name, fn in (("generic", decode_generic), ("fast", decode_fast)):
+        t = timeit.timeit(lambda: fn(*s), number=args.repeat)
+        print(f"{name:8s} {t / args.repeat * 1e6:8.2f} us/drone/tick")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+PoseInterpolator の表示遅れが、シミュレーションの倍速によらず有界であることの確認。
+
+env_control_loop（delta 周期のサンプルを speed 倍速で書き込む）と UI タスク（fps で最新サンプルだけを
+取り出して push し、evaluate する）を仮想時計で再現し、最新サンプルと表示中の姿勢の時刻差を測る。
+時刻差は実時間に直し（/ speed）、描画 2 フレーム + サンプル 2 周期分を超えたら失敗とする。
+Panda3D のウィンドウ・箱庭は不要。
+
+使い方:
+    python work/check_pose_interpolator.py [--speeds 0.5 1 4 10] [--fps 60] [--delta-msec 20] [--duration 60]
+"""
+import sys
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from panda3d.core import Vec3
+from hakoniwa_panda3d_drone.core.state_mailbox import DronePose
+from hakoniwa_panda3d_drone.core.pose_interpolator import PoseInterpolator
+
+
+def run(speed: float, fps: float, delta_usec: int, duration: float, jitter: float, seed: int) -> tuple:
+    """(最大遅れ[sec], 最後の 1 秒間の最大遅れ[sec]) を実時間で返す"""
+    rng = random.Random(seed)
+    interp = PoseInterpolator()
+    sample_wall = delta_usec / 1e6 / speed
+    frame_wall = 1.0 / fps
+    next_sample = 0.0
+    sim_time_usec = 0
+    latest = None
+    max_lag = tail_lag = 0.0
+    now = 0.0
+    while now < duration:
+        # このフレームまでに書き込まれたサンプルのうち最新のものだけが UI に届く（latest-wins）
+        while next_sample <= now:
+            sim_time_usec += delta_usec
+            latest = DronePose(Vec3(sim_time_usec / 1e6, 0, 0), Vec3(0, 0, 0), 0.0, sim_time_usec, next_sample)
+            interp.push("Drone", latest, now)
+            next_sample += sample_wall
+        shown = interp.evaluate(now)["Drone"]
+        lag = (latest.sim_time_usec - shown.sim_time_usec) / 1e6 / speed
+        max_lag = max(max_lag, lag)
+        if now >= duration - 1.0:
+            tail_lag = max(tail_lag, lag)
+        now += frame_wall * (1.0 + rng.uniform(-jitter, jitter))
+    return max_lag, tail_lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that PoseInterpolator lag stays bounded at any sim speed")
+    parser.add_argument("--speeds", type=float, nargs="+", default=[0.5, 1.0, 4.0, 10.0])
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--delta-msec", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0, help="実時間[sec]")
+    parser.add_argument("--jitter", type=float, default=0.2, help="描画間隔の揺らぎ（割合）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    failed = False
+    for speed in args.speeds:
+        max_lag, tail_lag = run(speed, args.fps, args.delta_msec * 1000, args.duration, args.jitter, args.seed)
+        bound = 2.0 / args.fps + 2.0 * args.delta_msec / 1e3 / speed
+        ok = max_lag <= bound
+        failed |= not ok
+        print(f"speed {speed:>5g}x: max lag {max_lag * 1e3:7.1f} ms, last 1s {tail_lag * 1e3:7.1f} ms, "
+              f"bound {bound * 1e3:6.1f} ms  {'OK' if ok else 'FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())